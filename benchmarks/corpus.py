@@ -0,0 +1,102 @@
+import json
+import random
+from typing import List, Tuple
+
+
+WORDS = (
+    "україна", "київ", "президент", "уряд", "рада", "закон", "міністр", "область", "місто", "громада", "війна",
+    "економіка", "бюджет", "гривня", "банк", "компанія", "ринок", "ціна", "новина", "журналіст", "агенція",
+    "повідомляє", "заявив", "сказала", "відбулося", "зустріч", "переговори", "делегація", "питання", "рішення",
+    "розвиток", "держава", "служба", "безпеки", "поліція", "суд", "справа", "вирок", "громадяни", "людей",
+    "найкращий", "великий", "новий", "державний", "місцевий", "міжнародний", "сьогодні", "вчора", "також", "проте",
+    "який", "яка", "яке", "що", "для", "про", "після", "через", "між", "під", "над", "без", "та", "і", "в", "на",
+    "працювали", "будували", "зростає", "знижується", "підписали", "обговорили", "виступив", "відповідальність",
+)
+
+NAMES = (
+    ("Володимир", "Зеленський"), ("Петро", "Порошенко"), ("Юлія", "Тимошенко"), ("Віталій", "Кличко"),
+    ("Денис", "Шмигаль"), ("Руслан", "Стефанчук"), ("Олена", "Зеленська"), ("Дмитро", "Кулеба"),
+)
+
+LOCATIONS = ("Київ", "Львів", "Харків", "Одеса", "Дніпро", "Вінниця", "Полтава", "Чернігів")
+
+ORGANIZATIONS = ("НАТО", "ООН", "Верховна Рада", "Кабмін", "НБУ", "СБУ", "Укрзалізниця", "Нафтогаз")
+
+PUNCTUATION = (",", ",", ",", ":", " —", ";")
+
+
+def make_article(rng: random.Random, sentence_count: int) -> Tuple[str, List[Tuple[int, int, str]]]:
+    """
+    :return: text of a synthetic news article and its (start, end, label) annotations
+
+    """
+    text, labels = "", list()
+
+    for _ in range(sentence_count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(6, 24))]
+
+        sentence, sentence_labels = "", list()
+        for word_index, word in enumerate(words):
+            if sentence:
+                sentence += " "
+
+            if rng.random() < .08:
+                label, entity = rng.choice((
+                    ("PERSON", " ".join(rng.choice(NAMES))),
+                    ("LOC", rng.choice(LOCATIONS)),
+                    ("ORG", rng.choice(ORGANIZATIONS)),
+                ))
+                sentence_labels.append((len(text) + len(sentence), len(text) + len(sentence) + len(entity), label))
+                sentence += entity
+                continue
+
+            sentence += word.capitalize() if not word_index else word
+            if rng.random() < .1:
+                sentence += rng.choice(PUNCTUATION)
+
+        text += sentence + rng.choice((".", ".", ".", "!", "?")) + " "
+        labels.extend(sentence_labels)
+
+    return text.strip(), labels
+
+
+def make_articles(article_count: int, *, sentence_count: int = 8, seed: int = 0):
+    rng = random.Random(seed)
+    return [make_article(rng, rng.randint(1, sentence_count * 2)) for _ in range(article_count)]
+
+
+def write_tagged_jsonl(path: str, articles) -> str:
+    with open(path, 'w') as jsonl_file:
+        for article_id, (text, labels) in enumerate(articles):
+            jsonl_file.write(json.dumps({
+                "id": article_id,
+                "text": text,
+                "labels": [list(label) for label in labels],
+                "article_id": article_id
+            }, ensure_ascii=False) + "\n")
+
+    return path
+
+
+def make_spider_xml(articles) -> str:
+    """
+    :return: a dump in the format written by the spiders, with some of the html noise found on news sites
+
+    """
+    xml = ['<data from="example.com.ua">\n']
+
+    for article_id, (text, _) in enumerate(articles):
+        xml.append(f'\t<article url="https://example.com.ua/news/{article_id}">\n')
+
+        for paragraph_id, paragraph in enumerate(text.split(". ")):
+            if paragraph_id % 3 == 1:
+                paragraph = f'<strong>{paragraph}</strong> <a href="/x?a=1&amp;b=2">посилання</a>'
+            elif paragraph_id % 3 == 2:
+                paragraph = f'<span class="x">{paragraph}</span><br> <!-- comment -->'
+
+            xml.append(f'\t\t<p class="text">{paragraph}.\xa0</p>\n')
+
+        xml.append('\t\t<p> </p>\n\t</article>\n')
+
+    xml.append('</data>\n')
+    return "".join(xml)
@@ -0,0 +1,508 @@
+"""
+Benchmarks of the nerua hot paths on a synthetic Ukrainian news corpus
+
+usage: python -m benchmarks.run [--scale 1.0] [--repeat 5] [--only NAME ...]
+                                [--output results.json] [--baseline baseline.json] [--threshold 0.2]
+                                [--save-baseline baseline.json]
+
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.corpus import make_articles, make_spider_xml, write_tagged_jsonl
+
+
+BENCHMARKS = dict()
+
+
+class BenchmarkSkipped(Exception):
+    pass
+
+
+def benchmark(name: str):
+    """
+    register a benchmark, the decorated function gets the shared context and returns
+    the function to time and the number of items (tokens, words, articles...) it processes per call
+
+    """
+    def decorator(setup: Callable[[dict], Tuple[Callable[[], object], int]]):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+@benchmark("tokenize_text")
+def _tokenize_text(context):
+    from nerua.tokenizer import tokenize_text
+
+    return lambda: tokenize_text(context["text"], context["lang"]), context["token_count"]
+
+
+@benchmark("tokenize_sentence")
+def _tokenize_sentence(context):
+    from nerua.tokenizer import tokenize_sentence
+
+    return lambda: tokenize_sentence(context["text"], context["lang"]), context["token_count"]
+
+
+@benchmark("iter_tokens")
+def _iter_tokens(context):
+    from nerua.tokenizer import iter_tokens
+
+    return lambda: sum(1 for _ in iter_tokens(context["text"], context["lang"])), context["token_count"]
+
+
+@benchmark("stem_ukr_word.cold")
+def _stem_cold(context):
+    from nerua.stemmer import UkrainianStemmer
+
+    def run():
+        stemmer = UkrainianStemmer(context["lang"])
+        for token in context["tokens"]:
+            stemmer.stem(token)
+
+    return run, len(context["tokens"])
+
+
+@benchmark("stem_ukr_word.warm")
+def _stem_warm(context):
+    from nerua.stemmer import stem_ukr_word
+
+    def run():
+        for token in context["tokens"]:
+            stem_ukr_word(token)
+
+    return run, len(context["tokens"])
+
+
+@benchmark("vocabulary.getitem")
+def _vocabulary_getitem(context):
+    vocab = context["vocab"]
+
+    def run():
+        for token in context["tokens"]:
+            vocab[token]
+
+    return run, len(context["tokens"])
+
+
+@benchmark("vocabulary.encode")
+def _vocabulary_encode(context):
+    return lambda: context["vocab"].encode(context["tokens"]), len(context["tokens"])
+
+
+@benchmark("vocabulary.from_text")
+def _vocabulary_from_text(context):
+    from nerua.lang.vocabulary import Vocabulary
+
+    return lambda: Vocabulary.from_text(context["text"], context["lang"]), context["token_count"]
+
+
+@benchmark("base_normilize")
+def _base_normilize(context):
+    from nerua.preprocess import base_normilize
+
+    return lambda: base_normilize(context["text"]), len(context["text"])
+
+
+@benchmark("remove_abbr")
+def _remove_abbr(context):
+    from nerua.preprocess import remove_abbr
+
+    return lambda: remove_abbr(context["text"], context["lang"]), len(context["text"])
+
+
+@benchmark("simplify_spider_xml")
+def _simplify_spider_xml(context):
+    from nerua.scraping.preprocess import simplify_spider_xml
+
+    return lambda: simplify_spider_xml(context["xml"]), len(context["articles"])
+
+
+@benchmark("normilize_text_inside_xml")
+def _normilize_text_inside_xml(context):
+    from nerua.scraping.preprocess import normilize_text_inside_xml
+
+    return lambda: normilize_text_inside_xml(context["xml"], context["lang"]), len(context["articles"])
+
+
+@benchmark("convert_jsonl_tagged_file_to_csv")
+def _convert_jsonl_tagged_file_to_csv(context):
+    from nerua.preprocess import convert_jsonl_tagged_file_to_csv
+
+    output_file_path = os.path.join(context["tmp_dir"], "train.csv")
+    return (
+        lambda: convert_jsonl_tagged_file_to_csv(context["jsonl_path"], context["lang"], output_file_path),
+        context["token_count"]
+    )
+
+
+# modules that must stay importable without the heavy dependencies, and the dependencies they must not import
+COLD_IMPORT_MODULES = (
+    "nerua.tokenizer", "nerua.stemmer", "nerua.preprocess", "nerua.scraping.preprocess", "nerua.model"
+)
+HEAVY_MODULES = ("keras", "tensorflow", "pandas", "keras_contrib", "sklearn_crfsuite", "scrapy", "selenium")
+
+_COLD_IMPORT_SCRIPT = """
+import sys
+import {module}
+heavy_modules = sorted(set({heavy_modules!r}) & {{name.partition(".")[0] for name in sys.modules}})
+if heavy_modules:
+    sys.exit("importing {module} imports " + ", ".join(heavy_modules))
+"""
+
+
+def _cold_import_benchmark(module: str):
+    def setup(context):
+        script = _COLD_IMPORT_SCRIPT.format(module=module, heavy_modules=HEAVY_MODULES)
+        command = [sys.executable, "-c", script]
+        root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        # a fresh interpreter every run, the time includes its startup
+        def run():
+            completed = subprocess.run(command, cwd=root_path, stderr=subprocess.PIPE, universal_newlines=True)
+            if completed.returncode:
+                raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+        return run, 1
+
+    return setup
+
+
+for _module in COLD_IMPORT_MODULES:
+    benchmark(f"import.{_module}")(_cold_import_benchmark(_module))
+
+
+def _tiny_model(context):
+    if "model" not in context:
+        from nerua.model import NNModel
+        from nerua.preprocess import convert_jsonl_tagged_file_to_csv
+
+        train_file_path = convert_jsonl_tagged_file_to_csv(
+            context["jsonl_path"], context["lang"], os.path.join(context["tmp_dir"], "tiny_model.csv")
+        )
+
+        # keras is imported only when the model is built
+        model = NNModel(context["lang"])
+        try:
+            model.create(train_file_path)
+        except ImportError as error:
+            raise BenchmarkSkipped(f"the model dependencies are not installed: {error}")
+
+        context["model"] = model
+
+    return context["model"]
+
+
+@benchmark("NNModel.predict")
+def _nn_model_predict(context):
+    model = _tiny_model(context)
+    text = " ".join(text for text, _ in context["articles"][:20])
+
+    def run():
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            model.predict(text)
+
+    return run, sum(len(sentence) for sentence in _tokenize(text, context["lang"]))
+
+
+@benchmark("NNModel.predict_batch")
+def _nn_model_predict_batch(context):
+    return _predict_batch_benchmark(context, _tiny_model(context).predict_batch)
+
+
+@benchmark("NumpyNERModel.predict_batch")
+def _numpy_model_predict_batch(context):
+    return _predict_batch_benchmark(context, _random_numpy_model(context).predict_batch)
+
+
+@benchmark("NumpyNERModel.predict_batch.int8")
+def _quantized_numpy_model_predict_batch(context):
+    from nerua.engine import NumpyNERModel
+
+    directory = _random_numpy_model(context).save(os.path.join(context["tmp_dir"], "int8_model"), quantize="int8")
+    return _predict_batch_benchmark(context, NumpyNERModel.load(directory).predict_batch)
+
+
+@benchmark("NumpyNERModel.predict_batch.windowed")
+def _windowed_numpy_model_predict_batch(context):
+    engine = _random_numpy_model(context)
+
+    # sentences longer than 16 tokens are tagged in overlapping windows
+    engine.max_words_count_in_sentence = 16
+
+    return _predict_batch_benchmark(context, engine.predict_batch)
+
+
+@benchmark("NumpyNERModel.predict_batch.profiled")
+def _profiled_numpy_model_predict_batch(context):
+    from nerua import profiling
+
+    engine = _random_numpy_model(context)
+
+    # the overhead of profiling compared with NumpyNERModel.predict_batch
+    def predict_batch(texts):
+        with profiling.profile():
+            return engine.predict_batch(texts)
+
+    return _predict_batch_benchmark(context, predict_batch)
+
+
+@benchmark("NumpyNERModel.parity")
+def _numpy_model_parity(context):
+    from nerua.engine import NumpyNERModel, check_parity, export_model
+
+    model = _tiny_model(context)
+    engine = NumpyNERModel.load(export_model(model, os.path.join(context["tmp_dir"], "tiny_model_export")))
+    texts = [text for text, _ in context["articles"][:50]]
+
+    def run():
+        parity = check_parity(model, engine, texts)
+        if not parity["ok"]:
+            raise RuntimeError(f"the numpy engine differs from the keras model: {parity}")
+
+    return run, len(texts)
+
+
+def _predict_batch_benchmark(context, predict_batch: Callable[[List[str]], object]):
+    """
+    :param predict_batch: tags a list of texts
+    :return: the benchmark of tagging the first 200 articles and their number of tokens
+
+    """
+    texts = [text for text, _ in context["articles"][:200]]
+
+    return lambda: predict_batch(texts), sum(
+        len(sentence) for text in texts for sentence in _tokenize(text, context["lang"])
+    )
+
+
+def _random_numpy_model(context):
+    """
+    numpy engine with random weights in the shape NNModel.create builds, it does not need keras
+
+    """
+    import numpy as np
+    from nerua.engine import EXPORT_FORMAT_VERSION, NumpyNERModel
+
+    random = np.random.RandomState(0)
+    vocab_size, embedding_size, tags = len(context["lang"].vocab) + 1, 150, ["B-PER", "I-PER", "B-LOC", "I-LOC", "O"]
+
+    def lstm(input_size, units):
+        return {
+            "kernel": random.normal(0., .1, (input_size, 4 * units)),
+            "recurrent_kernel": random.normal(0., .1, (units, 4 * units)),
+            "bias": np.zeros(4 * units),
+        }
+
+    layers = [
+        ("embedding", {"embeddings": random.normal(0., .1, (vocab_size, embedding_size))}, {}),
+        ("bidirectional_lstm", dict(
+            **{f"forward_{name}": weight for name, weight in lstm(embedding_size, embedding_size).items()},
+            **{f"backward_{name}": weight for name, weight in lstm(embedding_size, embedding_size).items()}
+        ), {"activation": "tanh", "recurrent_activation": "hard_sigmoid"}),
+        ("lstm", lstm(2 * embedding_size, 2 * embedding_size), {
+            "activation": "tanh", "recurrent_activation": "hard_sigmoid"
+        }),
+        ("dense", {
+            "kernel": random.normal(0., .1, (2 * embedding_size, len(tags))), "bias": np.zeros(len(tags))
+        }, {"activation": "relu"}),
+        ("crf", {
+            "kernel": random.normal(0., .1, (len(tags), len(tags))),
+            "chain_kernel": random.normal(0., .1, (len(tags), len(tags))),
+            "bias": np.zeros(len(tags)),
+            "left_boundary": np.zeros(len(tags)),
+            "right_boundary": np.zeros(len(tags)),
+        }, {"activation": "linear"}),
+    ]
+
+    meta = {
+        "format": EXPORT_FORMAT_VERSION, "lang": type(context["lang"]).__name__, "tags": tags, "stem_words": True,
+        "max_words_count_in_sentence": None, "input_length": None, "layers": list()
+    }
+    weights = dict()
+    for layer_id, (layer_type, layer_weights, config) in enumerate(layers):
+        meta["layers"].append(dict(config, type=layer_type, weights=[f"{layer_id}_{name}" for name in layer_weights]))
+        weights.update({f"{layer_id}_{name}": weight.astype(np.float32) for name, weight in layer_weights.items()})
+
+    return NumpyNERModel(meta, weights)
+
+
+def _tokenize(text, lang):
+    from nerua.tokenizer import tokenize_text
+    return tokenize_text(text, lang)
+
+
+def make_context(scale: float, tmp_dir: str) -> dict:
+    from nerua.lang.language import get_language
+    from nerua.lang.vocabulary import Vocabulary
+    from nerua.tokenizer import tokenize_sentence
+
+    lang = get_language("ua")
+    articles = make_articles(max(1, int(500 * scale)))
+    text = " ".join(text for text, _ in articles)
+    tokens = tokenize_sentence(text, lang)
+
+    return {
+        "lang": lang,
+        "articles": articles,
+        "text": text,
+        "tokens": tokens,
+        "token_count": len(tokens),
+        "vocab": Vocabulary.from_text(text, lang, size=5000),
+        "xml": make_spider_xml(articles),
+        "jsonl_path": write_tagged_jsonl(os.path.join(tmp_dir, "tagged.jsonl"), articles),
+        "tmp_dir": tmp_dir,
+    }
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(percent / 100. * len(sorted_values) + .5)) - 1))
+    return sorted_values[index]
+
+
+def measure(function: Callable[[], object], items: int, *, repeat: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        function()
+
+    latencies = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+
+    # memory is traced in a separate run, tracing slows the code down too much to time it at the same time
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    median = _percentile(latencies, 50)
+
+    return {
+        "items": items,
+        "repeat": repeat,
+        "items_per_sec": items / median if median else None,
+        "latency_ms": {
+            "min": latencies[0] * 1e3,
+            "p50": median * 1e3,
+            "p90": _percentile(latencies, 90) * 1e3,
+            "p99": _percentile(latencies, 99) * 1e3,
+            "max": latencies[-1] * 1e3,
+        },
+        "peak_memory_kb": peak_memory / 1024,
+    }
+
+
+def run_benchmarks(names: List[str] = None, *, scale: float = 1., repeat: int = 5) -> Dict[str, dict]:
+    results = dict()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        context = make_context(scale, tmp_dir)
+
+        for name, setup in BENCHMARKS.items():
+            if names and name not in names:
+                continue
+
+            try:
+                function, items = setup(context)
+            except BenchmarkSkipped as skipped:
+                results[name] = {"skipped": str(skipped)}
+                continue
+
+            results[name] = measure(function, items, repeat=repeat)
+
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """
+    :return: names of the benchmarks whose median latency grew by more than the threshold fraction
+
+    """
+    regressions = list()
+
+    for name, result in results.items():
+        baseline_result = baseline.get(name, dict())
+        if "latency_ms" not in result or "latency_ms" not in baseline_result:
+            continue
+
+        ratio = result["latency_ms"]["p50"] / baseline_result["latency_ms"]["p50"]
+        result["baseline_ratio"] = ratio
+        if ratio > 1. + threshold:
+            regressions.append(name)
+
+    return regressions
+
+
+def _print_results(results: Dict[str, dict], regressions: List[str]):
+    print(f"{'benchmark':<36}{'items/s':>14}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}{'peak KiB':>12}{'vs base':>9}")
+
+    for name, result in results.items():
+        if "skipped" in result:
+            print(f"{name:<36}skipped: {result['skipped']}")
+            continue
+
+        latency = result["latency_ms"]
+        ratio = f"{result['baseline_ratio']:.2f}x" if "baseline_ratio" in result else ""
+        mark = " !" if name in regressions else ""
+        print(
+            f"{name:<36}{result['items_per_sec'] or 0:>14.0f}{latency['p50']:>11.2f}{latency['p90']:>11.2f}"
+            f"{latency['p99']:>11.2f}{result['peak_memory_kb']:>12.0f}{ratio:>9}{mark}"
+        )
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the nerua pipeline")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--scale", type=float, default=1., help="corpus size relative to the default 500 articles")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs of every benchmark")
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--baseline", help="compare the results with this json file")
+    parser.add_argument("--threshold", type=float, default=.2, help="allowed slowdown relative to the baseline")
+    parser.add_argument("--save-baseline", help="write the results as a new baseline to this json file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.only, scale=args.scale, repeat=args.repeat)
+
+    regressions = list()
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            regressions = compare(results, json.load(baseline_file)["results"], args.threshold)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "scale": args.scale,
+        "results": results,
+        "regressions": regressions,
+    }
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as output_file:
+                json.dump(report, output_file, indent=2, ensure_ascii=False)
+
+    _print_results(results, regressions)
+    if regressions:
+        print(f"\nregressions over {args.threshold:.0%}: {', '.join(regressions)}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
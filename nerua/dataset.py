@@ -0,0 +1,326 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from array import array
+from typing import List, NoReturn, Optional, Sequence as SequenceType, Tuple
+
+from nerua import profiling
+from nerua.filelock import file_lock
+from nerua.lang.language import Language
+from nerua.preprocess import iter_train_data_rows
+from nerua.stemmer import stem_many
+
+
+_CORPUS_ARRAYS = ("token_ids", "tag_ids", "offsets")
+
+# bump when the layout of a cached corpus changes
+_CORPUS_CACHE_VERSION = 1
+
+
+class EncodedCorpus:
+    """
+    Tagged sentences encoded to ids and stored as three flat arrays: token ids, tag ids
+    and sentence offsets, sentence i spans [offsets[i], offsets[i + 1]) of the first two
+
+    """
+    def __init__(self, token_ids: np.ndarray, tag_ids: np.ndarray, offsets: np.ndarray):
+        if len(token_ids) != len(tag_ids) or not len(offsets) or offsets[-1] != len(token_ids):
+            raise ValueError("The token ids, tag ids and sentence offsets do not match")
+
+        self.token_ids = token_ids
+        self.tag_ids = tag_ids
+        self.offsets = offsets
+        self._lengths = None
+
+    @staticmethod
+    def from_csv(path: str, lang: Language, tags: List[str], *, stem_words: bool = True):
+        """
+        encode the article_id,word,tag training data, the file is read row by row, so the rows of an article
+        must be consecutive as convert_jsonl_tagged_file_to_csv writes them
+
+        :param path: path to the training data in any of the TRAIN_DATA_FORMATS of nerua.preprocess
+        :param lang: the language of the training data, its vocabulary is used to encode the words
+        :param tags: list of all tags, a tag is encoded as its index in it
+        :param stem_words: encode stems instead of words
+        :return: encoded corpus, one sentence per article in the order of the file
+
+        """
+        tag_index = {tag: tag_id for tag_id, tag in enumerate(tags)}
+
+        token_ids, tag_ids, offsets = array('i'), array('i'), array('q', [0])
+
+        def add_sentence(words, sentence_tags):
+            token_ids.extend(lang.vocab.encode(stem_many(words, lang) if stem_words else words))
+            tag_ids.extend(tag_index[tag] for tag in sentence_tags)
+            offsets.append(len(token_ids))
+
+        article_id, words, sentence_tags = None, list(), list()
+        encoded_article_ids = set()
+
+        for row_article_id, word, tag in iter_train_data_rows(path):
+            if row_article_id != article_id and words:
+                add_sentence(words, sentence_tags)
+                words, sentence_tags = list(), list()
+
+                encoded_article_ids.add(article_id)
+                if row_article_id in encoded_article_ids:
+                    raise ValueError(f"The rows of the article {row_article_id} are not consecutive in {path}")
+
+            article_id = row_article_id
+            words.append(word)
+            sentence_tags.append(tag)
+
+        if words:
+            add_sentence(words, sentence_tags)
+
+        return EncodedCorpus(
+            np.frombuffer(token_ids, dtype=np.int32),
+            np.frombuffer(tag_ids, dtype=np.int32),
+            np.frombuffer(offsets, dtype=np.int64)
+        )
+
+    @staticmethod
+    def load(directory: str, *, mmap: bool = True):
+        """
+        :param directory: directory the corpus was saved to
+        :param mmap: map the arrays into memory instead of reading them, the pages are shared between processes
+        :return: encoded corpus
+
+        """
+        return EncodedCorpus(*(
+            np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r' if mmap else None)
+            for name in _CORPUS_ARRAYS
+        ))
+
+    def save(self, directory: str) -> NoReturn:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        for name in _CORPUS_ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+
+    @property
+    def lengths(self) -> np.ndarray:
+        if self._lengths is None:
+            self._lengths = np.diff(self.offsets)
+
+        return self._lengths
+
+    def split(self, val_split: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param val_split: fraction of sentences to hold out, taken from the end as keras validation_split does
+        :return: indices of the train and validation sentences
+
+        """
+        split_at = int(len(self) * (1. - val_split))
+        return np.arange(split_at), np.arange(split_at, len(self))
+
+    def __getitem__(self, item) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[item], self.offsets[item + 1]
+        return self.token_ids[start:end], self.tag_ids[start:end]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+def load_encoded_corpus(path: str, lang: Language, tags: List[str], *, stem_words: bool = True,
+                        cache_dir: str = None) -> EncodedCorpus:
+    """
+    encode the training data once and reuse the memory-mapped result while the file,
+    the vocabulary, the tags and the stemming setting stay the same
+
+    :param path: path to the training data in any of the TRAIN_DATA_FORMATS of nerua.preprocess
+    :param lang: the language of the training data, its vocabulary is used to encode the words
+    :param tags: list of all tags
+    :param stem_words: encode stems instead of words
+    :param cache_dir: where to keep encoded corpora, by default "__corpus_cache__" next to the training data
+    :return: encoded corpus
+
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Unable to find the training data by path: {path}")
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), "__corpus_cache__")
+
+    file_hash = _file_hash(path, cache_dir)
+    cache_key = hashlib.sha1(json.dumps([
+        _CORPUS_CACHE_VERSION, file_hash, lang.vocab.fingerprint, tags, bool(stem_words)
+    ]).encode("utf-8")).hexdigest()
+
+    # caches of files with the same name in other directories may share the cache directory
+    path_hash = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:8]
+    corpus_dir_prefix = f"{os.path.basename(path)}.{path_hash}."
+    corpus_dir = os.path.join(cache_dir, f"{corpus_dir_prefix}{file_hash[:12]}.{cache_key}")
+    if os.path.exists(corpus_dir):
+        return EncodedCorpus.load(corpus_dir)
+
+    corpus = EncodedCorpus.from_csv(path, lang, tags, stem_words=stem_words)
+
+    # write to a temporary directory first so that other processes never see a partly written corpus
+    tmp_corpus_dir = tempfile.mkdtemp(dir=cache_dir)
+    corpus.save(tmp_corpus_dir)
+    try:
+        os.rename(tmp_corpus_dir, corpus_dir)
+    except OSError:
+        # another process has cached the same corpus in the meantime
+        shutil.rmtree(tmp_corpus_dir, ignore_errors=True)
+
+    # drop the corpora encoded from previous versions of the file
+    for name in os.listdir(cache_dir):
+        if name.startswith(corpus_dir_prefix) and not name.startswith(f"{corpus_dir_prefix}{file_hash[:12]}."):
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+    return EncodedCorpus.load(corpus_dir)
+
+
+def _file_hash(path: str, cache_dir: str) -> str:
+    """
+    sha1 of the file contents, remembered by size and modification time so that an unchanged file is not reread
+
+    """
+    stat = os.stat(path)
+    file_key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    hashes_path = os.path.join(cache_dir, "file_hashes.json")
+    file_hashes = _read_file_hashes(hashes_path)
+    if file_key in file_hashes:
+        return file_hashes[file_key]
+
+    file_hash = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            file_hash.update(block)
+
+    # the trainers sharing the cache directory update the hashes one at a time, the file is replaced at once,
+    # so it is never read half written
+    with file_lock(f"{hashes_path}.lock"):
+        file_hashes = {
+            key: value for key, value in _read_file_hashes(hashes_path).items()
+            if not key.startswith(f"{os.path.abspath(path)}:")
+        }
+        file_hashes[file_key] = file_hash.hexdigest()
+
+        tmp_hashes_path = f"{hashes_path}.{os.getpid()}.tmp"
+        with open(tmp_hashes_path, 'w') as hashes_file:
+            json.dump(file_hashes, hashes_file)
+        os.replace(tmp_hashes_path, hashes_path)
+
+    return file_hashes[file_key]
+
+
+def _read_file_hashes(hashes_path: str) -> dict:
+    if not os.path.exists(hashes_path):
+        return dict()
+
+    with open(hashes_path, 'r') as hashes_file:
+        return json.load(hashes_file)
+
+
+def pad_sequences(sequences: SequenceType[SequenceType[int]], maxlen: Optional[int] = None) -> np.ndarray:
+    """
+    the default behaviour of keras pad_sequences without importing keras
+
+    :param sequences: sequences of ids
+    :param maxlen: length of the result, by default the length of the longest sequence
+    :return: int32 matrix of the sequences padded with zeros and truncated at the front
+
+    """
+    if maxlen is None:
+        maxlen = max(map(len, sequences), default=0)
+
+    with profiling.stage("pad", items=len(sequences)):
+        padded = np.zeros((len(sequences), maxlen), dtype=np.int32)
+        if maxlen:
+            for row, sequence in enumerate(sequences):
+                sequence = sequence[-maxlen:]
+                if len(sequence):
+                    padded[row, -len(sequence):] = sequence
+
+    return padded
+
+
+class _TaggedSentenceBatches:
+    """
+    Batches of an encoded corpus for keras, tags stay integer ids until a batch is built.
+    Use TaggedSentenceSequence, which also inherits keras.utils.Sequence
+
+    """
+    def __init__(self, corpus: EncodedCorpus, indices: SequenceType[int], num_tags: int, *, batch_size: int = 256,
+                 input_length: int = None, shuffle: bool = True, bucket: bool = True, seed: int = None):
+        """
+        :param corpus: encoded sentences
+        :param indices: indices of the sentences of the corpus to use
+        :param num_tags: number of tags, used to one-hot encode them
+        :param batch_size: number of sentences in a batch
+        :param input_length: length to pad every batch to, by default a batch is padded to its longest sentence
+        :param shuffle: reshuffle the sentences after every epoch
+        :param bucket: put sentences of similar length into the same batch
+        :param seed: seed of the shuffling
+
+        """
+        self._corpus = corpus
+        self._indices = np.asarray(indices, dtype=np.int64)
+        self._num_tags = num_tags
+        self._batch_size = batch_size
+        self._input_length = input_length
+        self._shuffle = shuffle
+        self._bucket = bucket
+        self._random = np.random.RandomState(seed)
+
+        self._batches = list()
+        self.on_epoch_end()
+
+    def __len__(self):
+        return len(self._batches)
+
+    def __getitem__(self, item) -> Tuple[np.ndarray, np.ndarray]:
+        batch = self._batches[item]
+        lengths = self._corpus.lengths[batch]
+        input_length = self._input_length or max(1, int(lengths.max(initial=0)))
+
+        sentences = [self._corpus[sentence_index] for sentence_index in batch]
+        input_data = pad_sequences([token_ids for token_ids, _ in sentences], input_length)
+        output_data = pad_sequences([tag_ids for _, tag_ids in sentences], input_length)
+
+        return input_data, np.eye(self._num_tags, dtype=np.float32)[output_data]
+
+    def on_epoch_end(self):
+        indices = self._indices.copy()
+        if self._shuffle:
+            self._random.shuffle(indices)
+
+        if self._bucket:
+            # stable sort keeps the shuffled order among sentences of the same length
+            indices = indices[np.argsort(self._corpus.lengths[indices], kind="stable")]
+
+        self._batches = [
+            indices[batch_start:batch_start + self._batch_size]
+            for batch_start in range(0, len(indices), self._batch_size)
+        ]
+
+        if self._shuffle:
+            self._random.shuffle(self._batches)
+
+
+_tagged_sentence_sequence_class = None
+
+
+def __getattr__(name):
+    # keras takes seconds to import, so the Sequence subclass is created the first time it is asked for
+    global _tagged_sentence_sequence_class
+
+    if name == "TaggedSentenceSequence":
+        if _tagged_sentence_sequence_class is None:
+            from keras.utils import Sequence
+
+            _tagged_sentence_sequence_class = type(
+                "TaggedSentenceSequence", (_TaggedSentenceBatches, Sequence), {"__module__": __name__}
+            )
+
+        return _tagged_sentence_sequence_class
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
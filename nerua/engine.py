@@ -0,0 +1,676 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from nerua import profiling
+from nerua.lang.language import get_language
+from nerua.model import NNModel, TextTagger, _tags_to_entities
+
+
+# bump when the layout of an exported model changes
+EXPORT_FORMAT_VERSION = 2
+
+# versions the models can still be loaded from, version 1 has no quantized weights
+_READABLE_FORMAT_VERSIONS = (1, 2)
+
+QUANTIZATIONS = ("int8", "float16")
+
+
+def _hard_sigmoid(x: np.ndarray) -> np.ndarray:
+    return np.clip(x * np.float32(.2) + np.float32(.5), 0., 1.)
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1. / (1. + np.exp(-x))
+
+
+_ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0.),
+    "tanh": np.tanh,
+    "sigmoid": _sigmoid,
+    "hard_sigmoid": _hard_sigmoid,
+}
+
+
+def export_model(model: NNModel, directory: str, *, quantize: str = None) -> str:
+    """
+    write the weights of a model as .npy files with a meta.json describing its layers,
+    the exported model is run by NumpyNERModel without keras
+
+    :param model: created or loaded model
+    :param directory: where to write the model
+    :param quantize: None, "int8" or "float16", see save_export
+    :return: the directory
+
+    """
+    layers, weights = list(), dict()
+
+    def add_layer(layer_type: str, layer_weights: Dict[str, np.ndarray], **config):
+        names = list()
+        for name, weight in layer_weights.items():
+            names.append(f"{len(layers)}_{name}")
+            weights[names[-1]] = np.asarray(weight, dtype=np.float32)
+
+        layers.append(dict(config, type=layer_type, weights=names))
+
+    for layer in model._model.layers:
+        layer_class = type(layer).__name__
+        config = layer.get_config()
+
+        if layer_class == "InputLayer":
+            continue
+
+        elif layer_class == "Embedding":
+            add_layer("embedding", dict(zip(("embeddings",), layer.get_weights())))
+
+        elif layer_class == "LSTM":
+            add_layer("lstm", _lstm_weights(layer.get_weights()), **_lstm_config(config))
+
+        elif layer_class == "Bidirectional":
+            if config["merge_mode"] != "concat":
+                raise ValueError(f"Unsupported merge mode of a bidirectional layer: {config['merge_mode']}")
+
+            # the weights of the forward layer come first
+            layer_weights = layer.get_weights()
+            half = len(layer_weights) // 2
+            forward_weights, backward_weights = layer_weights[:half], layer_weights[half:]
+            add_layer(
+                "bidirectional_lstm",
+                dict(
+                    **{f"forward_{name}": weight for name, weight in _lstm_weights(forward_weights).items()},
+                    **{f"backward_{name}": weight for name, weight in _lstm_weights(backward_weights).items()}
+                ),
+                **_lstm_config(config["layer"]["config"])
+            )
+
+        elif layer_class == "TimeDistributed" and config["layer"]["class_name"] == "Dense":
+            add_layer(
+                "dense", dict(zip(("kernel", "bias"), layer.get_weights())),
+                activation=config["layer"]["config"]["activation"]
+            )
+
+        elif layer_class == "CRF":
+            add_layer("crf", _crf_weights(layer), activation=config["activation"])
+
+        else:
+            raise ValueError(f"Unable to export a layer of the class {layer_class}")
+
+    meta = {
+        "format": EXPORT_FORMAT_VERSION,
+        "lang": type(model.lang).__name__,
+        "tags": model._tags,
+        "stem_words": bool(model.stem_words),
+        "max_words_count_in_sentence": (
+            int(model.max_words_count_in_sentence) if model.max_words_count_in_sentence is not None else None
+        ),
+        "input_length": model._input_length,
+        "layers": layers,
+    }
+
+    return save_export(directory, meta, weights, quantize=quantize)
+
+
+def _crf_weights(layer) -> Dict[str, np.ndarray]:
+    """
+    :param layer: keras_contrib CRF layer
+    :return: its weights by the names of the crf layer of an export
+
+    """
+    config = layer.get_config()
+    if config["learn_mode"] != "join" or config["test_mode"] != "viterbi":
+        raise ValueError("Only a CRF in the join learn mode with the viterbi test mode can be exported")
+
+    names = ["kernel", "chain_kernel"]
+    names += ["bias"] if config["use_bias"] else []
+    names += ["left_boundary", "right_boundary"] if config["use_boundary"] else []
+    return dict(zip(names, layer.get_weights()))
+
+
+def save_export(directory: str, meta: dict, weights: Dict[str, np.ndarray], *, quantize: str = None) -> str:
+    """
+    :param directory: where to write the model
+    :param meta: description of the model and its layers
+    :param weights: float32 weights of the layers by their names in meta
+    :param quantize: store the embeddings and the kernels of the LSTM and dense layers as "int8" with a scale
+                     per row or as "float16", by default everything is stored as float32
+    :return: the directory
+
+    """
+    if quantize not in (None,) + QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization: {quantize}, expected one of {', '.join(QUANTIZATIONS)}")
+
+    os.makedirs(directory, exist_ok=True)
+
+    quantization = dict()
+    for layer in meta["layers"]:
+        for name in layer["weights"]:
+            weight = np.asarray(weights[name], dtype=np.float32)
+
+            if quantize is not None and _is_quantized(layer["type"], name):
+                quantization[name] = quantize
+                weight, scales = _quantize(weight, quantize)
+                if scales is not None:
+                    np.save(os.path.join(directory, f"{name}.scales.npy"), scales)
+
+            np.save(os.path.join(directory, f"{name}.npy"), weight)
+
+    meta = dict(meta, format=EXPORT_FORMAT_VERSION, quantization=quantization)
+    with open(os.path.join(directory, "meta.json"), 'w') as meta_file:
+        json.dump(meta, meta_file, indent=2, ensure_ascii=False)
+
+    return directory
+
+
+def _is_quantized(layer_type: str, name: str) -> bool:
+    # the CRF and the biases are tiny and the decoding is sensitive to them, so they stay float32
+    return layer_type != "crf" and name.partition("_")[2].endswith(("embeddings", "kernel"))
+
+
+def _quantize(weight: np.ndarray, quantize: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    :return: the quantized matrix and, for int8, the float32 scale of each of its rows
+
+    """
+    if quantize == "float16":
+        return weight.astype(np.float16), None
+
+    scales = np.abs(weight).max(axis=1) / 127.
+    scales[scales == 0.] = 1.
+    return np.round(weight / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class QuantizedMatrix:
+    """
+    Matrix stored as int8 with a float32 scale per row or as float16, rows are converted to float32 on access
+    so that a memory-mapped embedding is never copied as a whole
+
+    """
+    def __init__(self, values: np.ndarray, scales: np.ndarray = None):
+        self.values = values
+        self.scales = scales
+
+    shape = property(lambda self: self.values.shape)
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        """
+        :param rows: indices of the rows, of any shape
+        :return: float32 rows of shape rows.shape + (columns,)
+
+        """
+        values = self.values[rows].astype(np.float32)
+        return values if self.scales is None else values * self.scales[rows][..., None]
+
+    def dequantize(self) -> np.ndarray:
+        return self.take(np.arange(self.shape[0]))
+
+
+def _lstm_weights(weights) -> Dict[str, np.ndarray]:
+    return dict(zip(("kernel", "recurrent_kernel", "bias"), weights))
+
+
+def _lstm_config(config: dict) -> dict:
+    if not config.get("use_bias", True):
+        raise ValueError("Only LSTM layers with a bias can be exported")
+
+    return {"activation": config["activation"], "recurrent_activation": config["recurrent_activation"]}
+
+
+class NumpyNERModel(TextTagger):
+    """
+    Forward pass of an exported NNModel in numpy: embedding, LSTM layers, the dense layer and the viterbi
+    decoding of the keras_contrib CRF, including its decoding of sentences padded to the batch length
+
+    """
+    def __init__(self, meta: dict, weights: Dict[str, np.ndarray]):
+        """
+        :param meta: contents of meta.json of an exported model
+        :param weights: weights of the layers by their names in meta
+
+        """
+        if meta.get("format") not in _READABLE_FORMAT_VERSIONS:
+            raise ValueError(f"Unsupported version of an exported model: {meta.get('format')}")
+
+        self._meta = meta
+        self._weights = weights
+
+        # quantized kernels are small and used at every step, so they are converted once,
+        # only the embeddings are kept quantized and converted row by row
+        weights = {
+            name: weight.dequantize() if isinstance(weight, QuantizedMatrix) and "embeddings" not in name else weight
+            for name, weight in weights.items()
+        }
+
+        self.lang = get_language(meta["lang"])
+        self._tags = meta["tags"]
+        self.stem_words = meta["stem_words"]
+        self.max_words_count_in_sentence = meta["max_words_count_in_sentence"]
+        self._input_length = meta["input_length"]
+
+        layers = [
+            (layer, {name.partition("_")[2]: weights[name] for name in layer["weights"]})
+            for layer in meta["layers"]
+        ]
+        if not layers or layers[-1][0]["type"] != "crf":
+            raise ValueError("The last layer of an exported model must be a CRF")
+
+        crf_layer, crf_weights = layers[-1]
+        self._layers, self._crf = layers[:-1], CrfDecoder(crf_weights, crf_layer)
+
+    @staticmethod
+    def load(directory: str, *, mmap: bool = True):
+        """
+        :param directory: directory the model was exported to
+        :param mmap: map the weights into memory instead of reading them, the pages are shared between processes
+        :return: the model
+
+        """
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"Unable to find an exported model in: {directory}")
+
+        with open(meta_path, 'r') as meta_file:
+            meta = json.load(meta_file)
+
+        mmap_mode = 'r' if mmap else None
+        quantization = meta.get("quantization", dict())
+
+        weights = dict()
+        for layer in meta["layers"]:
+            for name in layer["weights"]:
+                weights[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+
+                if name in quantization:
+                    scales = None
+                    if quantization[name] == "int8":
+                        scales = np.load(os.path.join(directory, f"{name}.scales.npy"), mmap_mode=mmap_mode)
+                    weights[name] = QuantizedMatrix(weights[name], scales)
+
+        return NumpyNERModel(meta, weights)
+
+    def save(self, directory: str, *, quantize: str = None) -> str:
+        """
+        export the model again, for example to quantize a float32 export
+
+        :param directory: where to write the model
+        :param quantize: None, "int8" or "float16", see save_export
+        :return: the directory
+
+        """
+        weights = {
+            name: weight.dequantize() if isinstance(weight, QuantizedMatrix) else weight
+            for name, weight in self._weights.items()
+        }
+        meta = {key: value for key, value in self._meta.items() if key != "quantization"}
+
+        return save_export(directory, meta, weights, quantize=quantize)
+
+    def hidden_states(self, input_data: np.ndarray) -> np.ndarray:
+        """
+        :param input_data: padded token ids of a batch
+        :return: outputs of the layer before the CRF
+
+        """
+        hidden = input_data
+
+        for layer, weights in self._layers:
+            if layer["type"] == "embedding":
+                embeddings = weights["embeddings"]
+                if isinstance(embeddings, QuantizedMatrix):
+                    hidden = embeddings.take(hidden.astype(np.int64))
+                else:
+                    hidden = np.asarray(embeddings)[hidden.astype(np.int64)]
+
+            elif layer["type"] == "lstm":
+                hidden = _lstm(hidden, weights, layer)
+
+            elif layer["type"] == "bidirectional_lstm":
+                forward = _lstm(hidden, _prefixed(weights, "forward_"), layer)
+                backward = _lstm(hidden[:, ::-1], _prefixed(weights, "backward_"), layer)[:, ::-1]
+                hidden = np.concatenate([forward, backward], axis=-1)
+
+            elif layer["type"] == "dense":
+                hidden = _ACTIVATIONS[layer["activation"]](hidden @ weights["kernel"] + weights["bias"])
+
+        return hidden
+
+    def emissions(self, input_data: np.ndarray) -> np.ndarray:
+        """
+        :param input_data: padded token ids of a batch
+        :return: the CRF energies of every tag at every position, boundary energies included, lower is better
+
+        """
+        return self._crf.energy(self.hidden_states(input_data))
+
+    def _predict_padded(self, input_data: np.ndarray) -> np.ndarray:
+        with profiling.stage("forward", items=len(input_data)):
+            energy = self.emissions(input_data)
+
+        with profiling.stage("decode", items=len(input_data)):
+            return self._crf.decode(energy)
+
+    def _predict_padded_scores(self, input_data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        with profiling.stage("forward", items=len(input_data)):
+            energy = self.emissions(input_data)
+
+        with profiling.stage("decode", items=len(input_data)):
+            return self._crf.decode_with_scores(energy)
+
+
+class CrfDecoder:
+    """
+    The keras_contrib CRF in numpy: the energies of the tags computed from the outputs of the layer before the CRF
+    and their decoding, shared by the exported models and the keras models merging the windows of long sentences
+
+    """
+    def __init__(self, weights: Dict[str, np.ndarray], config: dict):
+        """
+        :param weights: kernel and chain_kernel, bias and the boundaries if the layer uses them
+        :param config: the activation of the layer
+
+        """
+        self._weights = weights
+        self._activation = _ACTIVATIONS[config["activation"]]
+        self.chain_kernel = np.asarray(weights["chain_kernel"])
+
+    @staticmethod
+    def from_keras(layer) -> "CrfDecoder":
+        """
+        :param layer: keras_contrib CRF layer, its weights are read once
+        :return: the decoder of the layer
+
+        """
+        return CrfDecoder(_crf_weights(layer), layer.get_config())
+
+    def energy(self, inputs: np.ndarray) -> np.ndarray:
+        """
+        :param inputs: outputs of the layer before the CRF of shape (batch, time, features)
+        :return: the CRF energies of every tag at every position, boundary energies included, lower is better
+
+        """
+        energy = self._activation(inputs @ self._weights["kernel"] + self._weights.get("bias", 0.))
+
+        if "left_boundary" in self._weights:
+            # without a mask the boundary energies go to the first and the last padded positions
+            energy = energy.copy()
+            energy[:, 0] += self._weights["left_boundary"]
+            energy[:, -1] += self._weights["right_boundary"]
+
+        return energy
+
+    def decode(self, energy: np.ndarray) -> np.ndarray:
+        """
+        :param energy: CRF energies of shape (batch, time, tags)
+        :return: tag ids of shape (batch, time), see viterbi_decode
+
+        """
+        return viterbi_decode(energy, self.chain_kernel)
+
+    def decode_with_scores(self, energy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param energy: CRF energies of shape (batch, time, tags)
+        :return: tag ids of shape (batch, time) and the probability of every decoded tag,
+                 used to merge the windows of long sentences
+
+        """
+        tag_ids = self.decode(energy)
+        scores = np.take_along_axis(crf_marginals(energy, self.chain_kernel), tag_ids[..., None], axis=-1)[..., 0]
+        return tag_ids, scores
+
+
+def _lstm(inputs: np.ndarray, weights: Dict[str, np.ndarray], config: dict) -> np.ndarray:
+    """
+    :param inputs: batch of sequences of shape (batch, time, features)
+    :param weights: kernel, recurrent_kernel and bias in the keras layout, gates in the i, f, c, o order
+    :param config: activation and recurrent_activation names
+    :return: hidden states of every step of shape (batch, time, units)
+
+    """
+    activation = _ACTIVATIONS[config["activation"]]
+    recurrent_activation = _ACTIVATIONS[config["recurrent_activation"]]
+
+    recurrent_kernel = np.asarray(weights["recurrent_kernel"])
+    units = recurrent_kernel.shape[0]
+
+    # the input part of the gates of all the steps at once
+    gate_inputs = inputs @ weights["kernel"] + weights["bias"]
+
+    batch_size, time_steps = inputs.shape[:2]
+    hidden = np.zeros((batch_size, units), dtype=np.float32)
+    cell = np.zeros((batch_size, units), dtype=np.float32)
+    outputs = np.empty((batch_size, time_steps, units), dtype=np.float32)
+
+    for step in range(time_steps):
+        gates = gate_inputs[:, step] + hidden @ recurrent_kernel
+
+        input_gate = recurrent_activation(gates[:, :units])
+        forget_gate = recurrent_activation(gates[:, units:2 * units])
+        cell = forget_gate * cell + input_gate * activation(gates[:, 2 * units:3 * units])
+        hidden = recurrent_activation(gates[:, 3 * units:]) * activation(cell)
+
+        outputs[:, step] = hidden
+
+    return outputs
+
+
+def _prefixed(weights: Dict[str, np.ndarray], prefix: str) -> Dict[str, np.ndarray]:
+    return {name[len(prefix):]: weight for name, weight in weights.items() if name.startswith(prefix)}
+
+
+def viterbi_decode(energy: np.ndarray, chain_kernel: np.ndarray) -> np.ndarray:
+    """
+    batched minimum energy path as keras_contrib CRF decodes it without a mask, the decoding of the last
+    position of the original, which assumes a next tag with id 0, is kept so that the results are the same
+
+    :param energy: CRF energies of shape (batch, time, tags)
+    :param chain_kernel: energies of the tag transitions, from the tag of a row to the tag of a column
+    :return: tag ids of shape (batch, time)
+
+    """
+    batch_size, time_steps, _ = energy.shape
+    if not time_steps:
+        return np.zeros((batch_size, 0), dtype=np.int64)
+
+    rows = np.arange(batch_size)
+
+    min_energy = np.zeros(energy.shape[::2], dtype=energy.dtype)
+    argmin_tables = np.empty(energy.shape, dtype=np.int64)
+    for step in range(time_steps):
+        # [batch, previous tag, next tag]
+        step_energy = chain_kernel[None] + (energy[:, step] + min_energy)[:, :, None]
+        argmin_tables[:, step] = step_energy.argmin(axis=1)
+        min_energy = step_energy.min(axis=1)
+
+    path = np.empty((batch_size, time_steps), dtype=np.int64)
+    best = argmin_tables[:, -1, 0]
+    for step in range(time_steps - 1, -1, -1):
+        best = argmin_tables[rows, step, best]
+        path[:, step] = best
+
+    return path
+
+
+def crf_marginals(energy: np.ndarray, chain_kernel: np.ndarray) -> np.ndarray:
+    """
+    probabilities of the tags at every position under the CRF, the forward-backward pass over the negated energies
+
+    :param energy: CRF energies of shape (batch, time, tags)
+    :param chain_kernel: energies of the tag transitions, from the tag of a row to the tag of a column
+    :return: probabilities of shape (batch, time, tags)
+
+    """
+    batch_size, time_steps, tag_count = energy.shape
+    potentials, transitions = -energy.astype(np.float64), -np.asarray(chain_kernel, dtype=np.float64)
+
+    forward = np.empty((batch_size, time_steps, tag_count))
+    backward = np.zeros((batch_size, time_steps, tag_count))
+    if not time_steps:
+        return forward
+
+    forward[:, 0] = potentials[:, 0]
+    for step in range(1, time_steps):
+        forward[:, step] = _logsumexp(forward[:, step - 1, :, None] + transitions[None], axis=1) + potentials[:, step]
+
+    for step in range(time_steps - 2, -1, -1):
+        backward[:, step] = _logsumexp(
+            transitions[None] + (potentials[:, step + 1] + backward[:, step + 1])[:, None, :], axis=2
+        )
+
+    log_partition = _logsumexp(forward[:, -1], axis=-1)
+    return np.exp(forward + backward - log_partition[:, None, None])
+
+
+def _logsumexp(x: np.ndarray, axis: int) -> np.ndarray:
+    x_max = x.max(axis=axis, keepdims=True)
+    return np.squeeze(x_max, axis=axis) + np.log(np.exp(x - x_max).sum(axis=axis))
+
+
+def compare_accuracy(reference: TextTagger, candidate: TextTagger, held_out_path: str, *,
+                     batch_size: int = 256) -> dict:
+    """
+    tag held-out data with two models, for example a float32 and a quantized export of the same model
+
+    :param reference: the model to compare with
+    :param candidate: the model to evaluate
+    :param held_out_path: path to a csv file with the article_id,word,tag data, one sentence per article
+    :param batch_size: number of sentences in one forward pass
+    :return: token accuracy and entity F1 of both models against the data, their deltas
+             and the share of tokens the models tag the same
+
+    """
+    from nerua.dataset import EncodedCorpus
+
+    if reference._tags != candidate._tags:
+        raise ValueError("The models have different tags")
+
+    corpus = EncodedCorpus.from_csv(held_out_path, reference.lang, reference._tags, stem_words=reference.stem_words)
+    sentences = [corpus[sentence_index] for sentence_index in range(len(corpus))]
+
+    predictions = dict()
+    for name, model in (("reference", reference), ("candidate", candidate)):
+        predictions[name] = list()
+
+        for batch_start in range(0, len(sentences), batch_size):
+            batch = [token_ids for token_ids, _ in sentences[batch_start:batch_start + batch_size]]
+            predictions[name].extend(model._predict_tag_ids(batch))
+
+    expected = [tag_ids for _, tag_ids in sentences]
+    report = {
+        "sentences": len(sentences),
+        "tokens": int(sum(map(len, expected))),
+    }
+
+    for name in ("reference", "candidate"):
+        report[name] = {
+            "accuracy": _token_agreement(expected, predictions[name]),
+            "entity_f1": _entity_f1(expected, predictions[name], reference._tags),
+        }
+
+    report["accuracy_delta"] = report["candidate"]["accuracy"] - report["reference"]["accuracy"]
+    report["entity_f1_delta"] = report["candidate"]["entity_f1"] - report["reference"]["entity_f1"]
+    report["agreement"] = _token_agreement(predictions["reference"], predictions["candidate"])
+
+    return report
+
+
+def _token_agreement(expected: List[np.ndarray], actual: List[np.ndarray]) -> float:
+    tokens = sum(map(len, expected))
+    matches = sum(int(np.sum(np.asarray(e) == np.asarray(a))) for e, a in zip(expected, actual))
+
+    return matches / tokens if tokens else 1.
+
+
+def _entity_f1(expected: List[np.ndarray], actual: List[np.ndarray], tags: List[str]) -> float:
+    def entities(sentence_index: int, tag_ids: np.ndarray):
+        tokens = [(None, token_index, token_index + 1) for token_index in range(len(tag_ids))]
+        return {
+            (sentence_index, entity["start"], entity["end"], entity["label"])
+            for entity in _tags_to_entities("", tokens, [tags[tag_id] for tag_id in tag_ids])
+        }
+
+    expected_entities, actual_entities = set(), set()
+    for sentence_index, (expected_tag_ids, actual_tag_ids) in enumerate(zip(expected, actual)):
+        expected_entities |= entities(sentence_index, expected_tag_ids)
+        actual_entities |= entities(sentence_index, actual_tag_ids)
+
+    if not expected_entities and not actual_entities:
+        return 1.
+
+    true_positives = len(expected_entities & actual_entities)
+    return 2. * true_positives / (len(expected_entities) + len(actual_entities))
+
+
+def check_parity(model: NNModel, engine: NumpyNERModel, texts: Iterable[str], *, batch_size: int = 256,
+                 atol: float = 1e-4) -> dict:
+    """
+    compare the tags and the CRF input of a keras model and of its numpy export on the same texts
+
+    :param model: the keras model
+    :param engine: the model exported with export_model
+    :param texts: texts to tag with both models
+    :param batch_size: number of sentences in one forward pass
+    :param atol: the largest allowed difference of the dense layer outputs
+    :return: {"documents", "mismatched_documents", "max_abs_diff", "ok"}
+
+    """
+    from keras.models import Model
+    from nerua.stemmer import stem_many
+    from nerua.tokenizer import tokenize_text
+    from nerua.dataset import pad_sequences
+
+    texts = list(texts)
+    expected = model.predict_batch(texts, batch_size=batch_size)
+    actual = engine.predict_batch(texts, batch_size=batch_size)
+
+    mismatched_documents = sum(
+        expected_document["tags"] != actual_document["tags"]
+        for expected_document, actual_document in zip(expected, actual)
+    )
+
+    # the outputs of the layer before the CRF are compared on the first batch of sentences
+    sentences = model.lang.vocab.encode_batch(
+        stem_many(sentence, model.lang) if model.stem_words else sentence
+        for text in texts
+        for sentence in tokenize_text(text, model.lang)
+    )[:batch_size]
+
+    max_abs_diff = 0.
+    if sentences:
+        input_data = pad_sequences(sentences, model._input_length or max(1, max(map(len, sentences))))
+
+        hidden_states_model = Model(model._model.inputs, model._model.layers[-2].output)
+        max_abs_diff = float(np.abs(
+            hidden_states_model.predict_on_batch(input_data) - engine.hidden_states(input_data)
+        ).max())
+
+    return {
+        "documents": len(texts),
+        "mismatched_documents": mismatched_documents,
+        "max_abs_diff": max_abs_diff,
+        "ok": not mismatched_documents and max_abs_diff <= atol,
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Quantize an exported nerua model")
+    parser.add_argument("source", help="directory of a float32 export")
+    parser.add_argument("destination", help="where to write the quantized model")
+    parser.add_argument("--quantize", choices=QUANTIZATIONS, default="int8")
+    parser.add_argument("--held-out", help="csv with article_id,word,tag data to compare the accuracy on")
+    args = parser.parse_args(argv)
+
+    reference = NumpyNERModel.load(args.source)
+    reference.save(args.destination, quantize=args.quantize)
+
+    if args.held_out:
+        report = compare_accuracy(reference, NumpyNERModel.load(args.destination), args.held_out)
+        print(json.dumps(report, indent=2))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # windows, the files are then locked only by the locks of the callers within the process
+    fcntl = None
+
+
+@contextmanager
+def file_lock(lock_path: str):
+    """
+    exclusive lock shared by the processes of one machine, for a read-modify-write of a file next to the lock file
+
+    :param lock_path: path of the lock file, it is created if it does not exist
+
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+
+    with open(lock_path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -2,7 +2,9 @@ import os
 import re
 import six
 import json
+import threading
 from abc import ABC
+from types import MappingProxyType
 
 
 LANGUAGES = (
@@ -14,33 +16,68 @@ ACCENT = six.unichr(769)
 
 class Language(ABC):
     def __init__(self):
-        from nerua.lang.vocabulary import Vocabulary
-
         self._word_tokenization_rules = re.compile("", re.UNICODE | re.VERBOSE)
         self._punctuation_symbols = tuple()
 
         self._vowels = ""
-        self._perfective = ""
-        self._reflexive = ""
-        self._adjective = ""
-        self._participle = ""
-        self._verb = ""
-        self._noun = ""
-
-        lang_short_name = dict(reversed(lang_tuple) for lang_tuple in LANGUAGES)[type(self).__name__]
-
-        abbr_file_path = os.path.join(os.path.dirname(__file__), f"{lang_short_name}_abbr.json")
-        if not os.path.exists(abbr_file_path):
-            self._abbreviations = dict()
-        else:
-            self._abbreviations = json.load(abbr_file_path)
-
-        vocab_file_path = os.path.join(os.path.dirname(__file__), "__data__", f"{lang_short_name}_vocab.json")
-
-        if not os.path.exists(vocab_file_path):
-            self._vocab = Vocabulary.create_empty(lang_short_name)
-        else:
-            self._vocab = Vocabulary(vocab_file_path)
+        self._perfective = tuple()
+        self._reflexive = tuple()
+        self._adjective = tuple()
+        self._participle = tuple()
+        self._verb = tuple()
+        self._noun = tuple()
+
+        # abbreviations and vocabulary are read from disk on first access
+        self._abbreviations = None
+        self._vocab = None
+        self._resources_lock = threading.Lock()
+
+    def warmup(self):
+        """
+        load all lazily read language resources right away, e.g. before a server starts accepting requests
+
+        :return: the language itself
+
+        """
+        _ = self.abbreviations, self.vocab
+        return self
+
+    @property
+    def abbreviations(self):
+        if self._abbreviations is None:
+            with self._resources_lock:
+                if self._abbreviations is None:
+                    abbr_file_path = os.path.join(os.path.dirname(__file__), f"{self.short_form}_abbr.json")
+
+                    abbreviations = dict()
+                    if os.path.exists(abbr_file_path):
+                        with open(abbr_file_path, 'r') as abbr_file:
+                            abbreviations = json.load(abbr_file)
+
+                    self._abbreviations = MappingProxyType(abbreviations)
+
+        return self._abbreviations
+
+    @property
+    def vocab(self):
+        if self._vocab is None:
+            with self._resources_lock:
+                if self._vocab is None:
+                    from nerua.lang.vocabulary import Vocabulary
+
+                    # the line per word format is preferred, it loads faster than the older json one
+                    vocab_file_paths = [
+                        os.path.join(os.path.dirname(__file__), "__data__", f"{self.short_form}_vocab.{extension}")
+                        for extension in ("txt", "json")
+                    ]
+                    vocab_file_paths = [path for path in vocab_file_paths if os.path.exists(path)]
+
+                    if not vocab_file_paths:
+                        self._vocab = Vocabulary.create_empty(self.short_form)
+                    else:
+                        self._vocab = Vocabulary(vocab_file_paths[0])
+
+        return self._vocab
 
     short_form = property(lambda self: dict([reversed(lang_info) for lang_info in LANGUAGES])[type(self).__name__])
 
@@ -62,10 +99,6 @@ class Language(ABC):
 
     noun = property(lambda self: self._noun)
 
-    abbreviations = property(lambda self: self._abbreviations)
-
-    vocab = property(lambda self: self._vocab)
-
 
 class Ukrainian(Language):
     def __init__(self):
@@ -87,10 +120,40 @@ class Ukrainian(Language):
         self._punctuation_symbols = ('.', '!', '?', '"', "'", ',', ':', ';', '-', '(', ')')
 
         self._vowels = "аеиоуюяіїє"
-        self._perfective = r"(ив|ивши|ившись|ыв|ывши|ывшись((?<=[ая])(в|вши|вшись)))$"
-        self._reflexive = r"(с[яьи])$"
-        self._adjective = r"(ими|ій|ий|а|е|ова|ове|ів|є|їй|єє|еє|я|ім|ем|им|ім|их|іх|ою|йми|іми|у|ю|ого|ому|ої)$"
-        self._participle = r"(ий|ого|ому|им|ім|а|ій|у|ою|ій|і|их|йми|их)$"
-        self._verb = r"(сь|ся|ив|ать|ять|у|ю|ав|али|учи|ячи|вши|ши|е|ме|ати|яти|є)$"
-        self._noun = r"(а|ев|ов|е|ями|ами|еи|и|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю" \
-                     r"|ия|ья|я|і|ові|ї|ею|єю|ою|є|еві|ем|єм|ів|їв|ю)$"
+        self._perfective = ("ив", "ивши", "ившись", "ыв", "ывши")
+        self._reflexive = ("ся", "сь", "си")
+        self._adjective = ("ими", "ій", "ий", "а", "е", "ова", "ове", "ів", "є", "їй", "єє", "еє", "я", "ім", "ем", "им",
+                           "их", "іх", "ою", "йми", "іми", "у", "ю", "ого", "ому", "ої")
+        self._participle = ("ий", "ого", "ому", "им", "ім", "а", "ій", "у", "ою", "і", "их", "йми")
+        self._verb = ("сь", "ся", "ив", "ать", "ять", "у", "ю", "ав", "али", "учи", "ячи", "вши", "ши", "е", "ме", "ати",
+                      "яти", "є")
+        self._noun = ("а", "ев", "ов", "е", "ями", "ами", "еи", "и", "ей", "ой", "ий", "й", "иям", "ям", "ием", "ем", "ам",
+                      "ом", "о", "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия", "ья", "я", "і", "ові", "ї", "ею",
+                      "єю", "ою", "є", "еві", "єм", "ів", "їв")
+
+
+_languages = dict()
+_languages_lock = threading.Lock()
+
+
+def get_language(name: str) -> Language:
+    """
+    get the process-wide shared instance of a language
+
+    :param name: short form ("ua") or class name ("Ukrainian") of the language
+    :return: language instance, created on the first call
+
+    """
+    lang_class_names = dict(LANGUAGES)
+    if name in lang_class_names:
+        name = lang_class_names[name]
+
+    elif name not in lang_class_names.values():
+        raise ValueError(f"Unknown language: {name}")
+
+    if name not in _languages:
+        with _languages_lock:
+            if name not in _languages:
+                _languages[name] = globals()[name]()
+
+    return _languages[name]
@@ -1,8 +1,14 @@
 import os
 import json
+import hashlib
+import numpy as np
+from functools import partial
 from collections import Counter
+from typing import Iterable, List, NoReturn, Optional, Tuple
 
-from nerua.lang.language import LANGUAGES, Language
+from nerua import profiling
+from nerua.parallel import parallel_map
+from nerua.lang.language import LANGUAGES, Language, get_language
 
 
 class Vocabulary:
@@ -19,10 +25,13 @@ class Vocabulary:
 
         self._lang = dict(LANGUAGES)[lang_short_form]
 
-        with open(path, 'r') as file:
-            self._data = json.load(file)
-
-        self._len = len(self._data)
+        with open(path, 'r', encoding='utf-8') as file:
+            if path.endswith(".txt"):
+                # one word per line, see save
+                data = file.read()
+                self._set_data(data[:-1].split("\n") if data else [])
+            else:
+                self._set_data(json.load(file))
 
     @staticmethod
     def from_text(text, lang: Language, *, size: int = 50000, stem_words: bool = True, **kwargs):
@@ -30,37 +39,286 @@ class Vocabulary:
 
         tokenized_text = tokenize_sentence(text, lang)
         if stem_words:
-            from nerua.stemmer import stem_word
+            from nerua.stemmer import stem_many
 
-            tokenized_text = (stem_word(token, lang, **kwargs) for token in tokenized_text)
+            tokenized_text = stem_many(tokenized_text, lang, **kwargs)
 
         vocab = Vocabulary.__new__(Vocabulary)
         vocab._lang = type(lang).__name__
-        vocab._data = [word for word, _ in Counter(tokenized_text).most_common(size)]
-        vocab._len = len(vocab._data)
+        vocab._set_data([word for word, _ in Counter(tokenized_text).most_common(size)])
+
+        return vocab
+
+    @staticmethod
+    def from_counts(counts: Counter, lang: Language, *, size: int = 50000, min_count: int = 1):
+        vocab = Vocabulary.__new__(Vocabulary)
+        vocab._lang = type(lang).__name__
+        vocab._set_data([word for word, count in counts.most_common(size) if count >= min_count])
 
         return vocab
 
     @staticmethod
     def create_empty(lang_short_name: str):
         vocab = Vocabulary.__new__(Vocabulary)
-        vocab._lang = lang_short_name
-        vocab._data = []
-        vocab._len = 0
+        vocab._lang = dict(LANGUAGES)[lang_short_name]
+        vocab._set_data([])
         return vocab
 
-    def save(self):
-        lang_short_name = dict(reversed(lang_tuple) for lang_tuple in LANGUAGES)[self._lang]
-        path = os.path.join(os.path.dirname(__file__), "__data__", f"{lang_short_name}_vocab.json")
+    def save(self, path: str = None) -> str:
+        """
+        save the words one per line, which loads much faster than a json list
+
+        :param path: where to save the vocabulary, by default to the language data directory
+        :return: path of the saved file
+
+        """
+        if path is None:
+            lang_short_name = dict(reversed(lang_tuple) for lang_tuple in LANGUAGES)[self._lang]
+            path = os.path.join(os.path.dirname(__file__), "__data__", f"{lang_short_name}_vocab.txt")
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with open(path, 'w', encoding='utf-8') as file:
+            if path.endswith(".txt"):
+                file.write("".join(f"{word}\n" for word in self._data))
+            else:
+                json.dump(self._data, file)
+
+        return path
+
+    def encode(self, tokens: Iterable[str]) -> np.ndarray:
+        """
+        map tokens to their ids, unknown tokens get the out-of-vocabulary id
+
+        :param tokens: tokens to encode
+        :return: int32 array of token ids
+
+        """
+        index, unknown_id = self._index, self._len
+        return np.fromiter((index.get(token, unknown_id) for token in tokens), dtype=np.int32)
+
+    def encode_batch(self, sentences: Iterable[Iterable[str]]) -> List[np.ndarray]:
+        with profiling.stage("encode") as stage:
+            encoded_sentences = [self.encode(sentence) for sentence in sentences]
+            stage.add_items(len(encoded_sentences))
+
+        if profiling.is_enabled():
+            tokens = sum(map(len, encoded_sentences))
+            unknown = sum(int(np.count_nonzero(ids == self._len)) for ids in encoded_sentences)
+            profiling.count("vocab", hits=tokens - unknown, misses=unknown)
 
-        with open(path, 'w') as file:
-            json.dump(self._data, file)
+        return encoded_sentences
+
+    def decode(self, ids: Iterable[int]) -> List[str]:
+        """
+        map ids back to tokens, the out-of-vocabulary id is decoded as None
+
+        :param ids: token ids
+        :return: list of tokens
+
+        """
+        data, unknown_id = self._data, self._len
+        return [None if token_id == unknown_id else data[token_id] for token_id in map(int, ids)]
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        hash of the vocabulary contents, equal vocabularies have equal fingerprints
+
+        """
+        if self._fingerprint is None:
+            self._fingerprint = hashlib.sha1("\n".join(self._data).encode("utf-8")).hexdigest()
+
+        return self._fingerprint
+
+    def _set_data(self, data: List[str]):
+        self._data = list(data)
+        self._index = {word: word_id for word_id, word in reversed(list(enumerate(self._data)))}
+        self._len = len(self._data)
+        self._fingerprint = None
 
     def __getitem__(self, item):
-        if item in self._data:
-            return self._data.index(item)
+        return self._index.get(item, self._len)
 
-        return self._len
+    def __contains__(self, item):
+        return item in self._index
 
     def __len__(self):
         return self._len + 1
+
+
+class VocabularyBuilder:
+    """
+    Word counts of a corpus gathered shard by shard in a process pool. Counts of new texts can be added
+    at any time and the state can be checkpointed, so a rebuild continues where it stopped
+
+    """
+    def __init__(self, lang: Language, *, stem_words: bool = True, processes: Optional[int] = 1,
+                 shard_size: int = 1 << 24):
+        """
+        :param lang: the main language of the corpus
+        :param stem_words: count stems instead of words
+        :param processes: number of worker processes, None to use every core
+        :param shard_size: approximate number of bytes of a file counted by one worker at once
+
+        """
+        self._lang = lang
+        self._stem_words = stem_words
+        self._processes = processes
+        self._shard_size = shard_size
+
+        self.counts = Counter()
+
+        # absolute path -> size and modification time of the file when its shards were counted
+        # and the (start, end) byte ranges of the counted shards
+        self._counted_files = dict()
+
+    def update(self, texts: Iterable[str]):
+        """
+        count the words of texts, every text is a shard
+
+        :param texts: texts to count
+        :return: the builder itself
+
+        """
+        count_shard = partial(_count_words, lang_name=type(self._lang).__name__, stem_words=self._stem_words)
+
+        for counts in parallel_map(count_shard, texts, processes=self._processes, chunk_size=1):
+            self.counts.update(counts)
+
+        return self
+
+    def update_from_files(self, paths: Iterable[str], *, checkpoint_path: str = None, checkpoint_every: int = 16):
+        """
+        count the words of text files, shards already counted by this builder or its checkpoint are skipped
+
+        :param paths: paths to utf-8 text files, a file must not change once some of its shards are counted
+        :param checkpoint_path: save a checkpoint there every checkpoint_every counted shards and at the end
+        :param checkpoint_every: number of shards counted between two checkpoints
+        :return: the builder itself
+
+        """
+        shards = list()
+        for path in paths:
+            counted_shards = self._counted_file(path)["shards"]
+            shards.extend(
+                shard for shard in _file_shards(path, self._shard_size) if shard[1:] not in counted_shards
+            )
+
+        count_shard = partial(
+            _count_file_shard_words, lang_name=type(self._lang).__name__, stem_words=self._stem_words
+        )
+
+        shard_counts = parallel_map(count_shard, shards, processes=self._processes, chunk_size=1)
+        for shard_number, ((path, start, end), counts) in enumerate(zip(shards, shard_counts), 1):
+            self.counts.update(counts)
+            self._counted_files[os.path.abspath(path)]["shards"].add((start, end))
+
+            if checkpoint_path is not None and (shard_number % checkpoint_every == 0 or shard_number == len(shards)):
+                self.save_checkpoint(checkpoint_path)
+
+        return self
+
+    def build(self, *, size: int = 50000, min_count: int = 1) -> Vocabulary:
+        return Vocabulary.from_counts(self.counts, self._lang, size=size, min_count=min_count)
+
+    def save_checkpoint(self, path: str) -> NoReturn:
+        checkpoint = {
+            "lang": type(self._lang).__name__,
+            "stem_words": self._stem_words,
+            "counted_files": {
+                path: dict(counted_file, shards=sorted(counted_file["shards"]))
+                for path, counted_file in self._counted_files.items()
+            },
+            "counts": self.counts,
+        }
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load_checkpoint(self, path: str):
+        """
+        :param path: path to a checkpoint saved by a builder with the same language and stemming
+        :return: the builder itself
+
+        """
+        with open(path, 'r', encoding='utf-8') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+
+        if checkpoint["lang"] != type(self._lang).__name__ or checkpoint["stem_words"] != self._stem_words:
+            raise ValueError("The checkpoint was made with a different language or stemming setting")
+
+        self.counts = Counter(checkpoint["counts"])
+        self._counted_files = {
+            path: dict(counted_file, shards={tuple(shard) for shard in counted_file["shards"]})
+            for path, counted_file in checkpoint["counted_files"].items()
+        }
+
+        return self
+
+    def _counted_file(self, path: str) -> dict:
+        """
+        :raises ValueError: if the file has changed since some of its shards were counted,
+                            the new shards would be counted on top of the counts of the old ones
+
+        """
+        stat = os.stat(path)
+        counted_file = self._counted_files.setdefault(os.path.abspath(path), {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "shards": set(),
+        })
+
+        changed = (counted_file["size"], counted_file["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns)
+        if counted_file["shards"] and changed:
+            raise ValueError(f"{path} has changed since its words were counted, count it with a new builder")
+
+        counted_file["size"], counted_file["mtime_ns"] = stat.st_size, stat.st_mtime_ns
+        return counted_file
+
+
+def _count_words(text: str, lang_name: str, stem_words: bool) -> Counter:
+    from nerua.tokenizer import tokenize_sentence
+
+    lang = get_language(lang_name)
+    tokens = tokenize_sentence(text, lang)
+    if stem_words:
+        from nerua.stemmer import stem_many
+
+        tokens = stem_many(tokens, lang)
+
+    return Counter(tokens)
+
+
+def _count_file_shard_words(shard: Tuple[str, int, int], lang_name: str, stem_words: bool) -> Counter:
+    path, start, end = shard
+
+    with open(path, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8')
+
+    return _count_words(text, lang_name, stem_words)
+
+
+def _file_shards(path: str, shard_size: int) -> List[Tuple[str, int, int]]:
+    """
+    :return: (path, start, end) byte ranges of the file, every range begins at the start of a line
+
+    """
+    file_size = os.path.getsize(path)
+
+    shards = list()
+    with open(path, 'rb') as file:
+        start = 0
+        while start < file_size:
+            file.seek(min(start + shard_size, file_size))
+            file.readline()
+            end = min(file.tell(), file_size)
+
+            shards.append((path, start, end))
+            start = end
+
+    return shards
+
@@ -1,53 +1,202 @@
 import os
-import csv
 import json
-import keras
 import numpy as np
-import pandas as pd
-from datetime import datetime
-from keras_contrib.layers import CRF
-from keras.utils import to_categorical
-from keras_contrib.losses import crf_loss
-from keras.models import Model, load_model
-from keras_contrib.metrics import crf_viterbi_accuracy
-from keras.preprocessing.sequence import pad_sequences
-from sklearn_crfsuite.metrics import flat_classification_report
-from keras.layers import LSTM, Embedding, Dense, TimeDistributed, Bidirectional, Input
-
-from nerua.lang import language as lang_module
-from nerua.lang.language import Language
-from nerua.tokenizer import tokenize_text
-from nerua.stemmer import stem_ukr_word, stem_word
-
-
-class NNModel:
-    def __init__(self, *args, model_id=None, **kwargs):
+from itertools import groupby
+from operator import itemgetter
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from nerua import profiling
+from nerua.lang.language import Language, get_language
+from nerua.tokenizer import tokenize_text, tokenize_text_with_offsets
+from nerua.dataset import EncodedCorpus, load_encoded_corpus, pad_sequences
+from nerua.preprocess import iter_train_data_rows
+from nerua.stemmer import stem_many
+from nerua.registry import ModelRegistry, get_model_registry
+
+
+class TextTagger:
+    """
+    Batched tagging of raw texts shared by the models, a subclass sets lang, stem_words and _tags
+    and implements the forward pass in _predict_padded. Sentences longer than the window length are tagged
+    in overlapping windows of that length, so the compute per sentence is bounded and no token is left untagged
+
+    """
+    lang = None
+    stem_words = None
+    max_words_count_in_sentence = None
+    _tags = []
+
+    # the model input length, None if a batch is padded to its longest sentence
+    _input_length = None
+
+    # the longest token sequence run through the model at once, None to run every sentence whole
+    _window_length = property(lambda self: self._input_length or self.max_words_count_in_sentence)
+
+    def predict_batch(self, texts: Iterable[str], *, batch_size: int = 256, bucket: bool = True,
+                      window_overlap: int = None) -> List[dict]:
+        """
+        tag many documents at once, sentences of all documents are run through the network together
+
+        :param texts: documents to tag
+        :param batch_size: number of sentences or windows of long sentences in one forward pass
+        :param bucket: group sentences of similar length into the same batch to keep padding small
+        :param window_overlap: number of tokens shared by the neighbouring windows of a long sentence,
+                               a quarter of the window length by default
+        :return: for every document a dict with its tokens, their tags and the entities
+                 as {"text", "label", "start", "end"} with character offsets in the document
+
+        """
+        texts = list(texts)
+
+        with profiling.stage("predict_batch", items=len(texts)):
+            documents = [tokenize_text_with_offsets(text, self.lang) for text in texts]
+
+            sentences = [sentence for document in documents for sentence in document]
+            words = [[token for token, _, _ in sentence] for sentence in sentences]
+            if self.stem_words:
+                words = [stem_many(sentence_words, self.lang) for sentence_words in words]
+
+            tag_ids = self._predict_tag_ids(
+                self.lang.vocab.encode_batch(words), batch_size=batch_size, bucket=bucket,
+                window_overlap=window_overlap
+            )
+
+            with profiling.stage("entities", items=len(texts)):
+                results = list()
+                tag_ids = iter(tag_ids)
+                for text, document in zip(texts, documents):
+                    tokens, tags, entities = list(), list(), list()
+
+                    for sentence in document:
+                        sentence_tags = [self._tags[tag_id] for tag_id in next(tag_ids)]
+
+                        tokens.extend(token for token, _, _ in sentence)
+                        tags.extend(sentence_tags)
+                        entities.extend(_tags_to_entities(text, sentence, sentence_tags))
+
+                    results.append({"tokens": tokens, "tags": tags, "entities": entities})
+
+        return results
+
+    def _predict_tag_ids(self, sequences: List[np.ndarray], *, batch_size: int = None, bucket: bool = False,
+                         window_overlap: int = None) -> List[np.ndarray]:
+        """
+        :param sequences: encoded sentences
+        :param batch_size: number of sentences or windows in one forward pass, all of them at once by default
+        :param bucket: group windows of similar length into the same batch
+        :param window_overlap: number of tokens shared by the neighbouring windows of a long sentence
+        :return: tag ids of every token of every sentence
+
+        """
+        window_length = self._window_length
+        if window_length is not None and window_overlap is None:
+            window_overlap = window_length // 4
+
+        windows, spans = _split_into_windows(sequences, window_length, window_overlap)
+
+        # only the windows of split sentences need the scores of their tags to be merged
+        split = np.bincount([sequence_index for sequence_index, _ in spans], minlength=len(sequences)) > 1
+
+        order = list(range(len(windows)))
+        if bucket:
+            order.sort(key=lambda window_index: len(windows[window_index]))
+
+        window_tag_ids, window_scores = [None] * len(windows), [None] * len(windows)
+        predict_padded_scores = None
+        batch_size = batch_size or max(len(windows), 1)
+        for batch_start in range(0, len(order), batch_size):
+            batch = order[batch_start:batch_start + batch_size]
+            batch_windows = [windows[window_index] for window_index in batch]
+
+            input_length = self._input_length or max(1, max(map(len, batch_windows)))
+            input_data = pad_sequences(maxlen=input_length, sequences=batch_windows)
+
+            if any(split[spans[window_index][0]] for window_index in batch):
+                predict_padded_scores = predict_padded_scores or self._scores_predictor()
+                prediction, scores = predict_padded_scores(input_data)
+            else:
+                prediction, scores = self._predict_padded(input_data), None
+
+            for row, (window_index, window) in enumerate(zip(batch, batch_windows)):
+                padding = input_length - len(window)
+                window_tag_ids[window_index] = prediction[row, padding:]
+                if scores is not None:
+                    window_scores[window_index] = scores[row, padding:]
+
+        return _merge_windows([len(sequence) for sequence in sequences], spans, window_tag_ids, window_scores)
+
+    def _predict_padded(self, input_data: np.ndarray) -> np.ndarray:
+        """
+        :param input_data: padded token ids of a batch
+        :return: tag ids of every position of the batch
+
+        """
+        raise NotImplementedError
+
+    def _predict_padded_scores(self, input_data: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        :param input_data: padded token ids of a batch
+        :return: tag ids of every position of the batch and the confidence of every tag, higher is better,
+                 or None if the model has no scores, the windows are then merged in the middle of their overlap
+
+        """
+        return self._predict_padded(input_data), None
+
+    def _scores_predictor(self) -> Callable[[np.ndarray], Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """
+        :return: _predict_padded_scores of the batches of one call of _predict_tag_ids, a model reading
+                 the weights of its CRF for every batch reads them once here instead
+
+        """
+        return self._predict_padded_scores
+
+
+class NNModel(TextTagger):
+    def __init__(self, *args, model_id=None, registry: ModelRegistry = None, **kwargs):
         self.lang = None
         self._tags = []
         self.stem_words = None
         self.max_words_count_in_sentence = None
         self._model = None
+        self._hidden_states_model = None
 
         if model_id is None:
             self._init(*args, **kwargs)
 
         else:
-            self._load(model_id)
+            self._load(model_id, registry)
+
+    def create(self, train_file_path: str, output_summary: bool = False, *, max_words_count_in_sentence: int = None):
+        """
+        :param train_file_path: path to the article_id,word,tag training data in any of the TRAIN_DATA_FORMATS
+        :param output_summary: print the summary of the model
+        :param max_words_count_in_sentence: the longest token sequence tagged at once, longer sentences are tagged
+                                            in overlapping windows, by default the longest article of the training data
 
-    def create(self, train_file_path: str, output_summary: bool = False):
+        """
         if not os.path.exists(train_file_path):
             raise FileNotFoundError
 
-        with open(train_file_path, 'r') as train_file:
-            self.max_words_count_in_sentence = pd.read_csv(train_file).groupby("article_id").size().max()
+        # keras and tensorflow take seconds to import, so they are imported only when a model is built
+        import keras
+        from keras.models import Model
+        from keras_contrib.layers import CRF
+        from keras.layers import LSTM, Embedding, Dense, TimeDistributed, Bidirectional, Input
+
+        if max_words_count_in_sentence is not None:
+            self.max_words_count_in_sentence = int(max_words_count_in_sentence)
+        else:
+            self.max_words_count_in_sentence = max(
+                sum(1 for _ in rows) for _, rows in groupby(iter_train_data_rows(train_file_path), key=itemgetter(0))
+            )
 
-        input_layer = Input(shape=(self.max_words_count_in_sentence,))
+        # the sentence length is left open so that inference batches only need padding to their longest sentence
+        input_layer = Input(shape=(None,))
         word_embedding_size = 150
 
         model = Embedding(
             input_dim=len(self.lang.vocab),
-            output_dim=word_embedding_size,
-            input_length=self.max_words_count_in_sentence
+            output_dim=word_embedding_size
         )(input_layer)
 
         model = Bidirectional(
@@ -82,108 +231,152 @@ class NNModel:
             model.summary()
 
         self._model = model
-
-    def train(self, file: str, *, val_split: float = .1,
-              epoch_count: int = 25, batch_size: int = 256):
-
-        with open(file, 'r') as train_file:
-            agg_func = lambda dataframe_part: dataframe_part[["word", "tag"]].values.tolist()
-            sentences = pd.read_csv(train_file).groupby("article_id").apply(agg_func)
-
-        input_train_data = pad_sequences(
-            maxlen=self.max_words_count_in_sentence,
-            sequences=[
-                [self.lang.vocab[stem_word(word, self.lang) if self.stem_words else word] for word, _ in sentence]
-                for sentence in sentences
-            ]
-        )
-
-        output_train_data = np.array([
-            to_categorical(i, num_classes=len(self._tags))
-            for i in pad_sequences(
-                maxlen=self.max_words_count_in_sentence,
-                sequences=[[self._tags.index(w[1]) for w in s] for s in sentences]
-            )
-        ])
-
-        history = self._model.fit(
-            input_train_data,
-            output_train_data,
-            batch_size=batch_size,
+        self._hidden_states_model = None
+
+    def train(self, file: str, *, val_split: float = .1, epoch_count: int = 25, batch_size: int = 256,
+              bucket: bool = True, prefetch: int = 0, seed: int = None, use_cache: bool = True, cache_dir: str = None):
+        """
+        :param file: path to the article_id,word,tag training data in any of the TRAIN_DATA_FORMATS
+        :param val_split: fraction of the articles, taken from the end of the file, to validate on
+        :param epoch_count: number of epochs
+        :param batch_size: number of sentences in a batch
+        :param bucket: put sentences of similar length into the same batch
+        :param prefetch: number of batches to prepare ahead on a background thread, 0 to build them on demand
+        :param seed: seed of the shuffling
+        :param use_cache: reuse the encoded training data from a previous run if nothing it depends on has changed
+        :param cache_dir: where to keep the encoded training data, see load_encoded_corpus
+        :return: keras history
+
+        """
+        from nerua.dataset import TaggedSentenceSequence
+
+        corpus = self._encode_corpus(file, use_cache, cache_dir)
+        train_indices, val_indices = corpus.split(val_split)
+
+        sequence_kwargs = dict(batch_size=batch_size, input_length=self._model.input_shape[1], bucket=bucket)
+        train_data = TaggedSentenceSequence(corpus, train_indices, len(self._tags), seed=seed, **sequence_kwargs)
+        val_data = TaggedSentenceSequence(corpus, val_indices, len(self._tags), shuffle=False, **sequence_kwargs)
+
+        history = self._model.fit_generator(
+            train_data,
             epochs=epoch_count,
-            validation_split=val_split,
+            validation_data=val_data if len(val_data) else None,
+            workers=1 if prefetch else 0,
+            max_queue_size=max(prefetch, 1),
+            use_multiprocessing=False,
             verbose=2
         )
 
         return history
 
-    def save(self):
-        model_name = f"{self.lang.short_form}_model_{datetime.now().strftime('%d.%m.%YT%H%M%S')}.h5"
-        model_dir_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models")
-        model_path = os.path.join(model_dir_path, "__models__", model_name)
+    def evaluate(self, file: str, *, batch_size: int = 256, use_cache: bool = True, cache_dir: str = None):
+        """
+        :param file: path to the article_id,word,tag data to evaluate on in any of the TRAIN_DATA_FORMATS
+        :param batch_size: number of sentences in a batch
+        :param use_cache: reuse the encoded data from a previous run if nothing it depends on has changed
+        :param cache_dir: where to keep the encoded data, see load_encoded_corpus
+        :return: loss and metrics of the model
+
+        """
+        from nerua.dataset import TaggedSentenceSequence
+
+        corpus = self._encode_corpus(file, use_cache, cache_dir)
+        data = TaggedSentenceSequence(
+            corpus, range(len(corpus)), len(self._tags),
+            batch_size=batch_size, input_length=self._model.input_shape[1], shuffle=False
+        )
+
+        return self._model.evaluate_generator(data, workers=0)
 
-        if not os.path.exists(model_dir_path):
-            os.mkdir(model_dir_path)
+    def _encode_corpus(self, file: str, use_cache: bool, cache_dir: str) -> EncodedCorpus:
+        if use_cache:
+            return load_encoded_corpus(file, self.lang, self._tags, stem_words=self.stem_words, cache_dir=cache_dir)
 
-        with open(os.path.join(model_dir_path, "models_config.csv"), "a") as csvfile:
-            writer = csv.writer(csvfile, delimiter=',')
-            writer.writerow([
-                hash(model_path),
-                type(self.lang).__name__,
-                self._tags,
-                self.stem_words,
-                self.max_words_count_in_sentence,
-                model_path
-            ])
+        return EncodedCorpus.from_csv(file, self.lang, self._tags, stem_words=self.stem_words)
 
-        if not os.path.exists(os.path.join(model_dir_path, "__models__")):
-            os.mkdir(os.path.join(model_dir_path, "__models__"))
+    def save(self, registry: ModelRegistry = None) -> str:
+        """
+        :param registry: where to save the model, the one in the "models" directory by default
+        :return: id of the model, it depends only on the saved file and can be loaded in any process
 
+        """
+        registry = registry or get_model_registry()
+
+        model_path = registry.new_model_path(self.lang.short_form)
         self._model.save(model_path)
 
-        return hash(model_path)
+        return registry.register(
+            model_path,
+            lang=type(self.lang).__name__,
+            tags=self._tags,
+            stem_words=self.stem_words,
+            max_words_count_in_sentence=self.max_words_count_in_sentence
+        )
 
     def predict(self, text, with_report: bool = False):
-        prepared_data = [
-                [self.lang.vocab[stem_ukr_word(word) if self.stem_words else word] for word in sentence]
-                for sentence in tokenize_text(text, self.lang)
+        with profiling.stage("predict", items=1):
+            sentences = tokenize_text(text, self.lang)
+            if self.stem_words:
+                sentences = [stem_many(sentence, self.lang) for sentence in sentences]
+
+            # sentences longer than the window length are tagged in windows instead of being cut
+            pred_labels = [
+                [self._tags[tag_id] for tag_id in sentence_tag_ids]
+                for sentence_tag_ids in self._predict_tag_ids(self.lang.vocab.encode_batch(sentences))
             ]
-        input_data = pad_sequences(
-            maxlen=self.max_words_count_in_sentence,
-            sequences=prepared_data
-        )
-
-        prediction = self._model.predict(input_data, verbose=1)
-        pred_labels = [[self._tags[np.argmax(i)] for i in p][-len(prepared_data[j]):] for j, p in enumerate(prediction)]
 
         if with_report:
+            from sklearn_crfsuite.metrics import flat_classification_report
+
             print(flat_classification_report(y_pred=pred_labels, y_true=pred_labels))
 
         print(pred_labels)
 
-    def _load(self, model_id):
+    _input_length = property(lambda self: self._model.input_shape[1])
 
-        model_dir_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models")
+    def _predict_padded(self, input_data: np.ndarray) -> np.ndarray:
+        with profiling.stage("forward", items=len(input_data)):
+            prediction = self._model.predict_on_batch(input_data)
 
-        model_info = pd.read_csv(
-            os.path.join(model_dir_path, "models_config.csv"),
-            index_col=0,
-            header=None
-        ).loc[model_id]
+        with profiling.stage("decode", items=len(input_data)):
+            return np.argmax(prediction, axis=-1)
 
-        self.lang, self._tags, self.stem_words, self.max_words_count_in_sentence, model_path = model_info
+    def _predict_padded_scores(self, input_data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return self._scores_predictor()(input_data)
 
-        self.lang = getattr(lang_module, self.lang)()
-        self._tags = json.loads(self._tags.replace("'", '"'))
+    def _scores_predictor(self) -> Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]]:
+        from nerua.engine import CrfDecoder
 
-        self._model = load_model(
-            model_path,
-            custom_objects={
-                'CRF': CRF,
-                'crf_loss': crf_loss,
-                'crf_viterbi_accuracy': crf_viterbi_accuracy
-            }
-        )
+        # the CRF is decoded in numpy from the output of the layer before it, so the tags and their scores
+        # come from the same energies, the decoding is the one of keras_contrib, see viterbi_decode
+        if self._hidden_states_model is None:
+            from keras.models import Model
+
+            self._hidden_states_model = Model(self._model.inputs, self._model.layers[-2].output)
+
+        hidden_states_model, crf = self._hidden_states_model, CrfDecoder.from_keras(self._model.layers[-1])
+
+        def predict_padded_scores(input_data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+            with profiling.stage("forward", items=len(input_data)):
+                energy = crf.energy(hidden_states_model.predict_on_batch(input_data))
+
+            with profiling.stage("decode", items=len(input_data)):
+                return crf.decode_with_scores(energy)
+
+        return predict_padded_scores
+
+    def _load(self, model_id, registry: ModelRegistry = None):
+        registry = registry or get_model_registry()
+        model_info = registry.get(model_id)
+
+        self.lang = get_language(model_info["lang"])
+        self._tags = model_info["tags"]
+        self.stem_words = model_info["stem_words"]
+        self.max_words_count_in_sentence = model_info["max_words_count_in_sentence"]
+
+        # the keras model is shared with other instances loaded from the same id
+        self._model = registry.load(model_id, _load_keras_model)
+        self._hidden_states_model = None
 
     def _init(self, lang: Language, stem_words: bool = True):
         self.lang = lang
@@ -202,3 +395,130 @@ class NNModel:
         self.stem_words = stem_words
         self.max_words_count_in_sentence = None
         self._model = None
+
+
+def _load_keras_model(model_path: str):
+    from keras.models import load_model
+    from keras_contrib.layers import CRF
+    from keras_contrib.losses import crf_loss
+    from keras_contrib.metrics import crf_viterbi_accuracy
+
+    return load_model(
+        model_path,
+        custom_objects={
+            'CRF': CRF,
+            'crf_loss': crf_loss,
+            'crf_viterbi_accuracy': crf_viterbi_accuracy
+        }
+    )
+
+
+def _split_into_windows(sequences: List[np.ndarray], window_length: Optional[int],
+                        overlap: Optional[int]) -> Tuple[List[np.ndarray], List[Tuple[int, int]]]:
+    """
+    :param sequences: encoded sentences
+    :param window_length: the longest window, None to keep every sentence whole
+    :param overlap: number of tokens shared by neighbouring windows
+    :return: the windows and, for every window, the index of its sentence and its first token,
+             the windows of a sentence follow each other in the order of their positions
+
+    """
+    if window_length is not None and not 0 <= overlap < window_length:
+        raise ValueError(f"The window overlap must be in [0, {window_length}), not {overlap}")
+
+    windows, spans = list(), list()
+    for sequence_index, sequence in enumerate(sequences):
+        if window_length is None or len(sequence) <= window_length:
+            windows.append(sequence)
+            spans.append((sequence_index, 0))
+            continue
+
+        # the last window ends with the sentence, so it may overlap the previous one more
+        starts = list(range(0, len(sequence) - window_length, window_length - overlap))
+        starts.append(len(sequence) - window_length)
+
+        for start in starts:
+            windows.append(sequence[start:start + window_length])
+            spans.append((sequence_index, start))
+
+    return windows, spans
+
+
+def _merge_windows(lengths: List[int], spans: List[Tuple[int, int]], window_tag_ids: List[np.ndarray],
+                   window_scores: List[Optional[np.ndarray]]) -> List[np.ndarray]:
+    """
+    join the tags of the windows of every sentence, the tags of two overlapping windows are switched at the position
+    of the overlap that maximizes the total score, so the tags on each side come from one CRF path
+
+    :param lengths: number of tokens of every sentence
+    :param spans: index of the sentence and the first token of every window
+    :param window_tag_ids: tag ids of every window
+    :param window_scores: scores of the tags of every window, None for the windows of the sentences kept whole
+    :return: tag ids of every sentence
+
+    """
+    tag_ids, scores, ends = [None] * len(lengths), [None] * len(lengths), [0] * len(lengths)
+
+    for (sequence_index, start), window_tags, window_score in zip(spans, window_tag_ids, window_scores):
+        if start == 0:
+            ends[sequence_index] = len(window_tags)
+
+            if len(window_tags) == lengths[sequence_index]:
+                tag_ids[sequence_index] = window_tags
+            else:
+                tag_ids[sequence_index] = np.zeros(lengths[sequence_index], dtype=window_tags.dtype)
+                tag_ids[sequence_index][:len(window_tags)] = window_tags
+                scores[sequence_index] = np.zeros(lengths[sequence_index])
+                scores[sequence_index][:len(window_tags)] = _window_scores(window_tags, window_score)
+            continue
+
+        merged_tags, merged_scores, end = tag_ids[sequence_index], scores[sequence_index], ends[sequence_index]
+        window_score = _window_scores(window_tags, window_score)
+
+        # total score of switching to the window after k tokens of the overlap, for every k
+        overlap = end - start
+        kept = np.concatenate([[0.], np.cumsum(merged_scores[start:end])])
+        switched = np.concatenate([[0.], np.cumsum(window_score[:overlap])])
+        switch = int(np.argmax(kept + switched[-1] - switched))
+
+        merged_tags[start + switch:start + len(window_tags)] = window_tags[switch:]
+        merged_scores[start + switch:start + len(window_tags)] = window_score[switch:]
+        ends[sequence_index] = start + len(window_tags)
+
+    return tag_ids
+
+
+def _window_scores(window_tags: np.ndarray, window_score: Optional[np.ndarray]) -> np.ndarray:
+    if window_score is not None:
+        return np.asarray(window_score, dtype=np.float64)
+
+    # without the scores of the model a tag is trusted more the farther it is from the edges of its window
+    positions = np.arange(len(window_tags))
+    return np.minimum(positions + 1, len(window_tags) - positions).astype(np.float64)
+
+
+def _tags_to_entities(text: str, sentence: List[Tuple[str, int, int]], tags: List[str]) -> List[dict]:
+    entities = list()
+
+    entity = None
+    for (_, start, end), tag in zip(sentence, tags):
+        tag_indicator, _, label = tag.partition("-")
+
+        if entity is not None and tag_indicator == "I" and label == entity["label"]:
+            entity["end"] = end
+            continue
+
+        if entity is not None:
+            entities.append(entity)
+            entity = None
+
+        if tag_indicator in ("B", "I"):
+            entity = {"label": label, "start": start, "end": end}
+
+    if entity is not None:
+        entities.append(entity)
+
+    for entity in entities:
+        entity["text"] = text[entity["start"]:entity["end"]]
+
+    return entities
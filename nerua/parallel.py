@@ -0,0 +1,48 @@
+import os
+from collections import deque
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional
+
+
+def parallel_map(function: Callable, items: Iterable, *, processes: Optional[int] = 1,
+                 chunk_size: int = 64) -> Iterator:
+    """
+    lazy map over a process pool that keeps the order of the items
+
+    :param function: picklable function applied to every item
+    :param items: items to process, they are read as the workers need them
+    :param processes: number of worker processes, None to use every core, 1 to map in the current process
+    :param chunk_size: number of items sent to a worker at once
+    :return: generator of results in the order of the items
+
+    """
+    if processes == 1:
+        yield from map(function, items)
+        return
+
+    # multiprocessing is imported only when it is used, it slows down the start of the workers otherwise
+    from concurrent.futures import ProcessPoolExecutor
+
+    processes = processes or os.cpu_count()
+    items = iter(items)
+
+    with ProcessPoolExecutor(processes) as executor:
+        pending = deque()
+
+        while True:
+            # keep a couple of chunks per worker queued, so the memory does not grow with the input
+            while len(pending) < 2 * processes:
+                chunk = list(islice(items, chunk_size))
+                if not chunk:
+                    break
+
+                pending.append(executor.submit(_map_chunk, function, chunk))
+
+            if not pending:
+                return
+
+            yield from pending.popleft().result()
+
+
+def _map_chunk(function: Callable, chunk: List) -> List:
+    return [function(item) for item in chunk]
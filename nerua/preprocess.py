@@ -1,9 +1,16 @@
+import os
 import re
+import csv
+import gzip
 import json
-import pandas as pd
-from typing import NoReturn
+import threading
+from itertools import islice
 from operator import itemgetter
+from typing import Iterable, Iterator, List, NoReturn, Tuple
+from collections import OrderedDict
+from collections.abc import Mapping
 
+from nerua import profiling
 from nerua.lang.language import Language
 
 
@@ -63,44 +70,151 @@ def remove_abbr(text: str, lang: Language) -> str:
     if not isinstance(lang, Language):
         raise TypeError("The 'lang' variable must be an object of the class 'nherited from the class 'Language'")
 
-    return _multiple_replace(lang.abbreviations, text)
+    with profiling.stage("remove_abbr", items=1):
+        return _multiple_replace(lang.abbreviations, text)
 
 
 def base_normilize(text: str) -> str:
     if not isinstance(text, str):
         raise TypeError(f"The 'text' variable must have a string type, not {type(text).__name__}")
 
-    return _multiple_replace(BASE_NORMS, text)
+    with profiling.stage("normalize", items=1):
+        return _multiple_replace(BASE_NORMS, text)
 
 
-def convert_jsonl_tagged_file_to_csv(jsonl_file_path: str, lang: Language) -> NoReturn:
+TRAIN_DATA_COLUMNS = ("article_id", "word", "tag")
+
+TRAIN_DATA_FORMATS = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+
+def normalize_many(texts: Iterable[str], lang: Language = None) -> List[str]:
+    """
+    apply base_normilize and, when the language is given, remove_abbr to every text
+
+    :param texts: texts to normalize
+    :param lang: the main language used in the texts
+    :return: list of normalized texts
+
+    """
+    if lang is not None and not isinstance(lang, Language):
+        raise TypeError("The 'lang' variable must be an object of a class inherited from the class 'Language'")
+
+    replacers = [_get_replacer(BASE_NORMS)]
+    if lang is not None:
+        replacers.append(_get_replacer(lang.abbreviations))
+
+    normalized_texts = list()
+    with profiling.stage("normalize") as stage:
+        for text in texts:
+            for replacer in replacers:
+                text = replacer(text)
+            normalized_texts.append(text)
+
+        stage.add_items(len(normalized_texts))
+
+    return normalized_texts
+
+
+def convert_jsonl_tagged_file_to_csv(jsonl_file_path: str, lang: Language, output_file_path: str = None, *,
+                                     output_format: str = "csv", chunk_size: int = 65536) -> str:
+    """
+    convert annotated articles to the article_id,word,tag training data with BIO tags,
+    the input is read one article at a time and rows are written as they are produced
+
+    :param jsonl_file_path: path to the jsonl file with annotated articles
+    :param lang: the main language used in the articles
+    :param output_file_path: where to write the training data, by default next to the input file
+    :param output_format: one of "csv", "csv.gz", "parquet" or "arrow" (the last two require pyarrow)
+    :param chunk_size: number of rows per parquet row group / arrow record batch
+    :return: path of the written file
+
+    """
+    if output_format not in TRAIN_DATA_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}, expected one of {', '.join(TRAIN_DATA_FORMATS)}")
+
+    if output_file_path is None:
+        output_file_path = os.path.splitext(jsonl_file_path)[0] + TRAIN_DATA_FORMATS[output_format]
+
+    # the input is read lazily while the output is written, so writing over it would truncate it
+    if os.path.abspath(output_file_path) == os.path.abspath(jsonl_file_path):
+        raise ValueError(f"The training data would overwrite the input file: {jsonl_file_path}")
+
+    rows = iter_jsonl_tagged_rows(jsonl_file_path, lang)
+
+    if output_format in ("csv", "csv.gz"):
+        if output_format == "csv.gz":
+            csv_file = gzip.open(output_file_path, "wt", newline="")
+        else:
+            csv_file = open(output_file_path, "w", newline="", buffering=1 << 20)
+
+        with csv_file:
+            writer = csv.writer(csv_file, lineterminator="\n")
+            writer.writerow(("",) + TRAIN_DATA_COLUMNS)
+            writer.writerows((row_id,) + row for row_id, row in enumerate(rows))
+
+    else:
+        _write_columnar_train_data(rows, output_file_path, output_format, chunk_size)
+
+    return output_file_path
+
+
+def iter_jsonl_tagged_rows(jsonl_file_path: str, lang: Language) -> Iterator[Tuple[int, str, str]]:
+    """
+    :param jsonl_file_path: path to the jsonl file with annotated articles
+    :param lang: the main language used in the articles
+    :return: generator of (article_id, word, tag) rows
+
+    """
     from nerua.tokenizer import tokenize_sentence
 
     with open(jsonl_file_path) as file:
-        jsonl = file.readlines()
+        for data_in_json in file:
+            if not data_in_json.strip():
+                continue
+
+            _, text, label, article_id = json.loads(data_in_json).values()
 
-    dataframe = pd.DataFrame(columns=["article_id", "word", "tag"])
-    for data_in_json in jsonl:
-        _, text, label, article_id = json.loads(data_in_json).values()
+            cursor = 0
+            for start_index, end_index, tag in sorted(label, key=itemgetter(0)):
+                for token in tokenize_sentence(text[cursor:start_index], lang):
+                    yield article_id, token, "O"
 
-        cursor = 0
-        for start_index, end_index, tag in sorted(label, key=itemgetter(0)):
-            for token in tokenize_sentence(text[cursor:start_index], lang):
-                dataframe = dataframe.append({"article_id": article_id, "word": token, "tag": "O"}, ignore_index=True)
+                for token_id, token in enumerate(tokenize_sentence(text[start_index:end_index], lang)):
+                    yield article_id, token, f"{'B' if not token_id else 'I'}-{tag}"
 
-            for token_id, token in enumerate(tokenize_sentence(text[start_index:end_index], lang)):
-                dataframe = dataframe.append(
-                    {"article_id": article_id, "word": token, "tag": f"{'B' if not token_id else 'I'}-{tag}"},
-                    ignore_index=True
-                )
+                cursor = end_index
 
-            cursor = end_index
+            if cursor != len(text):
+                for token in tokenize_sentence(text[cursor:len(text)], lang):
+                    yield article_id, token, "O"
 
-        if cursor != len(text):
-            for token in tokenize_sentence(text[cursor:len(text)], lang):
-                dataframe = dataframe.append({"article_id": article_id, "word": token, "tag": "O"}, ignore_index=True)
 
-    dataframe.to_csv(jsonl_file_path.replace('.jsonl', '.csv'))
+def iter_train_data_rows(train_file_path: str) -> Iterator[Tuple[object, str, str]]:
+    """
+    read the article_id,word,tag training data in any of the TRAIN_DATA_FORMATS, the format is chosen
+    by the extension of the file and anything that is not parquet or arrow is read as csv, gzipped if it ends with .gz
+
+    :param train_file_path: path to the training data
+    :return: generator of (article_id, word, tag) rows in the order of the file, read in chunks
+
+    """
+    if train_file_path.endswith((TRAIN_DATA_FORMATS["parquet"], TRAIN_DATA_FORMATS["arrow"])):
+        yield from _iter_columnar_train_data(train_file_path)
+        return
+
+    if train_file_path.endswith(".gz"):
+        csv_file = gzip.open(train_file_path, "rt", newline="")
+    else:
+        csv_file = open(train_file_path, "r", newline="")
+
+    with csv_file:
+        for row in csv.DictReader(csv_file):
+            yield row["article_id"], row["word"], row["tag"]
 
 
 def get_text_from_jsonl_tagged_file(jsonl_file_path: str) -> str:
@@ -110,13 +224,104 @@ def get_text_from_jsonl_tagged_file(jsonl_file_path: str) -> str:
     return "".join(list(json.loads(data_in_json).values())[1] for data_in_json in jsonl)
 
 
-def _multiple_replace(replacements: dict, text: str) -> str:
+class MultipleReplacer:
+    """
+    Replace every key of a mapping found in a text with its value in a single pass.
+    Keys are matched literally and the longest key wins where several of them start at the same position
+
+    """
+    def __init__(self, replacements: Mapping):
+        if not isinstance(replacements, Mapping):
+            raise TypeError(f"The 'replacements' variable must be a mapping, not {type(replacements).__name__}")
+
+        self._replacements = {change_from: change_to for change_from, change_to in replacements.items() if change_from}
+        self._pattern = re.compile(
+            "|".join(re.escape(change_from) for change_from in sorted(self._replacements, key=len, reverse=True))
+        ) if self._replacements else None
+
+    def __call__(self, text: str) -> str:
+        if not isinstance(text, str):
+            raise TypeError(f"The 'text' variable must have a string type, not {type(text).__name__}")
+
+        if self._pattern is None:
+            return text
+
+        replacements = self._replacements
+        return self._pattern.sub(lambda match: replacements[match.group()], text)
+
+
+# compiled replacers of the recently used mappings by their id, an entry keeps its mapping alive so that the id
+# is not reused and a copy of its items so that a mapping edited in place is compiled again
+_replacers = OrderedDict()
+_replacers_lock = threading.Lock()
+_REPLACERS_CACHE_SIZE = 16
+
+
+def _get_replacer(replacements: Mapping) -> MultipleReplacer:
+    with _replacers_lock:
+        cached = _replacers.get(id(replacements))
+        if cached is not None and cached[0] is replacements and cached[1] == replacements:
+            _replacers.move_to_end(id(replacements))
+            return cached[2]
+
+    frozen_replacements = dict(replacements)
+    replacer = MultipleReplacer(frozen_replacements)
+    with _replacers_lock:
+        _replacers[id(replacements)] = replacements, frozen_replacements, replacer
+        _replacers.move_to_end(id(replacements))
+        while len(_replacers) > _REPLACERS_CACHE_SIZE:
+            _replacers.popitem(last=False)
+
+    return replacer
+
+
+def _multiple_replace(replacements: Mapping, text: str) -> str:
     if not isinstance(text, str):
         raise TypeError(f"The 'text' variable must have a string type, not {type(text).__name__}")
 
-    if not isinstance(replacements, dict):
-        raise TypeError(f"The 'replacements' variable must have a dict type, not {type(text).__name__}")
+    return _get_replacer(replacements)(text)
+
+
+def _write_columnar_train_data(rows: Iterator[Tuple[int, str, str]], output_file_path: str,
+                               output_format: str, chunk_size: int) -> NoReturn:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError(f"pyarrow is required to write training data in the {output_format} format")
+
+    schema = pa.schema([("article_id", pa.int64()), ("word", pa.string()), ("tag", pa.string())])
+
+    if output_format == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(output_file_path, schema)
+    else:
+        writer = pa.ipc.new_file(output_file_path, schema)
+
+    with writer:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(zip(*chunk), schema)],
+                schema=schema
+            ))
+
+
+def _iter_columnar_train_data(train_file_path: str) -> Iterator[Tuple[int, str, str]]:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError(f"pyarrow is required to read the training data from {train_file_path}")
+
+    if train_file_path.endswith(TRAIN_DATA_FORMATS["parquet"]):
+        import pyarrow.parquet as pq
+        batches = pq.ParquetFile(train_file_path).iter_batches(columns=list(TRAIN_DATA_COLUMNS))
+    else:
+        reader = pa.ipc.open_file(train_file_path)
+        batches = (reader.get_batch(batch_id) for batch_id in range(reader.num_record_batches))
 
-    for change_from, change_to in replacements.items():
-        text = re.sub(change_from, change_to, text)
-    return text
+    for batch in batches:
+        columns = batch.to_pydict()
+        yield from zip(*(columns[column] for column in TRAIN_DATA_COLUMNS))
@@ -0,0 +1,334 @@
+"""
+Opt-in profiling of the pipeline. The pipeline marks its stages with profiling.stage, which does nothing
+unless a Profiler is enabled, so the marks stay in place in production
+
+usage:
+    from nerua import profiling
+
+    with profiling.profile() as profiler:
+        model.predict_batch(texts)
+
+    print(profiler.flame())
+
+"""
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NoReturn, Optional, Tuple
+
+
+class Profiler:
+    """
+    Collects the wall time, the number of processed items and, optionally, the memory allocated by every stage.
+    A stage is identified by its path, so "predict_batch/forward" is the forward pass run by predict_batch
+    and is counted apart from a forward pass run by evaluate
+
+    """
+    def __init__(self, *, trace_allocations: bool = False):
+        """
+        :param trace_allocations: record the memory allocated by the stages with tracemalloc, it slows the stages
+
+        """
+        self.trace_allocations = trace_allocations
+
+        # path -> [calls, items, seconds, allocated bytes]
+        self._stages = dict()
+        self._counters = dict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def stage(self, name: str, items: int = 0) -> "_Stage":
+        return _Stage(self, name, items)
+
+    def count(self, name: str, **values: int) -> NoReturn:
+        """
+        :param name: name of the counter, for example "stemmer_cache"
+        :param values: increments of its values, for example hits=10, misses=2
+
+        """
+        with self._lock:
+            counter = self._counters.setdefault(name, dict())
+            for kind, value in values.items():
+                counter[kind] = counter.get(kind, 0) + value
+
+    def reset(self) -> NoReturn:
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def stages(self) -> List[dict]:
+        """
+        :return: totals of every stage in the order of their paths, self_seconds excludes the nested stages
+
+        """
+        with self._lock:
+            stages = {path: list(totals) for path, totals in self._stages.items()}
+
+        nested_seconds = dict()
+        for path, (_, _, seconds, _) in stages.items():
+            if len(path) > 1:
+                nested_seconds[path[:-1]] = nested_seconds.get(path[:-1], 0.) + seconds
+
+        return [
+            {
+                "stage": "/".join(path),
+                "calls": calls,
+                "items": items,
+                "seconds": seconds,
+                "self_seconds": max(seconds - nested_seconds.get(path, 0.), 0.),
+                "allocated_bytes": allocated if self.trace_allocations else None,
+            }
+            for path, (calls, items, seconds, allocated) in sorted(stages.items())
+        ]
+
+    def counters(self) -> Dict[str, dict]:
+        """
+        :return: the counters, a counter with hits and misses gets their hit_ratio
+
+        """
+        with self._lock:
+            counters = {name: dict(counter) for name, counter in self._counters.items()}
+
+        for counter in counters.values():
+            if "hits" in counter and "misses" in counter:
+                lookups = counter["hits"] + counter["misses"]
+                counter["hit_ratio"] = counter["hits"] / lookups if lookups else 0.
+
+        return counters
+
+    def to_json(self) -> dict:
+        return {"stages": self.stages(), "counters": self.counters()}
+
+    def to_prometheus(self, prefix: str = "nerua") -> str:
+        """
+        :param prefix: prefix of the metric names
+        :return: the stages and the counters in the prometheus text format
+
+        """
+        stages = self.stages()
+
+        metrics = [
+            ("stage_seconds_total", "Wall time spent in the stage", "seconds"),
+            ("stage_calls_total", "Number of times the stage was run", "calls"),
+            ("stage_items_total", "Number of items processed by the stage", "items"),
+        ]
+        if self.trace_allocations:
+            metrics.append(("stage_allocated_bytes_total", "Memory allocated by the stage", "allocated_bytes"))
+
+        lines = list()
+        for metric, description, key in metrics:
+            lines.append(f"# HELP {prefix}_{metric} {description}")
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            lines.extend(f'{prefix}_{metric}{{stage="{_escape(stage["stage"])}"}} {stage[key]}' for stage in stages)
+
+        counters = self.counters()
+        if counters:
+            lines.append(f"# HELP {prefix}_events_total Events counted by the pipeline, for example cache hits")
+            lines.append(f"# TYPE {prefix}_events_total counter")
+            for name, counter in sorted(counters.items()):
+                lines.extend(
+                    f'{prefix}_events_total{{counter="{_escape(name)}",kind="{_escape(kind)}"}} {value}'
+                    for kind, value in sorted(counter.items()) if kind != "hit_ratio"
+                )
+
+            lines.append(f"# HELP {prefix}_hit_ratio Share of the lookups found in a cache")
+            lines.append(f"# TYPE {prefix}_hit_ratio gauge")
+            lines.extend(
+                f'{prefix}_hit_ratio{{counter="{_escape(name)}"}} {counter["hit_ratio"]}'
+                for name, counter in sorted(counters.items()) if "hit_ratio" in counter
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def flame(self, width: int = 40) -> str:
+        """
+        :param width: length of the bar of a stage taking all the time of its root stage
+        :return: the stages as an indented tree, the slowest first among their siblings, with their time,
+                 share of the time of their root stage, calls and items
+
+        """
+        stages = {tuple(stage["stage"].split("/")): stage for stage in self.stages()}
+
+        children = dict()
+        for path in stages:
+            children.setdefault(path[:-1], list()).append(path)
+
+        lines = list()
+        name_width = max((2 * (len(path) - 1) + len(path[-1]) for path in stages), default=0)
+
+        def add_lines(parent: Tuple[str, ...], root_seconds: float):
+            for path in sorted(children.get(parent, ()), key=lambda child: -stages[child]["seconds"]):
+                stage = stages[path]
+                share = stage["seconds"] / (root_seconds or stage["seconds"] or 1.)
+
+                name = "  " * (len(path) - 1) + path[-1]
+                line = (
+                    f"{name:<{name_width}}  {stage['seconds'] * 1e3:10.3f} ms  {share:6.1%}  "
+                    f"{'█' * round(share * width):<{width}}  {stage['calls']} calls, {stage['items']} items"
+                )
+                if stage["allocated_bytes"] is not None:
+                    line += f", {stage['allocated_bytes'] / 1024:.1f} KiB allocated"
+
+                lines.append(line)
+                add_lines(path, root_seconds or stage["seconds"])
+
+        add_lines((), 0.)
+        return "\n".join(lines)
+
+    def folded(self) -> str:
+        """
+        :return: the self time of every stage in microseconds as folded stacks, the input format of flamegraph.pl
+                 and speedscope
+
+        """
+        return "\n".join(
+            f"{stage['stage'].replace('/', ';')} {round(stage['self_seconds'] * 1e6)}" for stage in self.stages()
+        )
+
+    def _stack(self) -> List[str]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = list()
+
+        return stack
+
+    def _record(self, path: Tuple[str, ...], items: int, seconds: float, allocated: int) -> NoReturn:
+        with self._lock:
+            totals = self._stages.get(path)
+            if totals is None:
+                totals = self._stages[path] = [0, 0, 0., 0]
+
+            totals[0] += 1
+            totals[1] += items
+            totals[2] += seconds
+            totals[3] += allocated
+
+
+class _Stage:
+    __slots__ = ("_profiler", "_name", "_items", "_path", "_started", "_allocated")
+
+    def __init__(self, profiler: Profiler, name: str, items: int):
+        self._profiler = profiler
+        self._name = name
+        self._items = items
+
+    def add_items(self, items: int) -> NoReturn:
+        self._items += items
+
+    def __enter__(self):
+        stack = self._profiler._stack()
+        stack.append(self._name)
+        self._path = tuple(stack)
+
+        self._allocated = tracemalloc.get_traced_memory()[0] if self._profiler.trace_allocations else 0
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        seconds = time.perf_counter() - self._started
+        allocated = tracemalloc.get_traced_memory()[0] - self._allocated if self._profiler.trace_allocations else 0
+
+        self._profiler._stack().pop()
+        self._profiler._record(self._path, self._items, seconds, allocated)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def add_items(self, items: int) -> NoReturn:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+_profiler = None
+_started_tracemalloc = False
+
+
+def stage(name: str, items: int = 0):
+    """
+    mark a stage of the pipeline, use as "with stage(...):", it costs a function call if profiling is disabled
+
+    :param name: name of the stage, nested stages get the names of the enclosing ones as their path
+    :param items: number of items processed by the stage, more can be added with add_items of the stage
+
+    """
+    profiler = _profiler
+    return _NULL_STAGE if profiler is None else profiler.stage(name, items)
+
+
+def count(name: str, **values: int) -> NoReturn:
+    profiler = _profiler
+    if profiler is not None:
+        profiler.count(name, **values)
+
+
+def is_enabled() -> bool:
+    return _profiler is not None
+
+
+def get_profiler() -> Optional[Profiler]:
+    return _profiler
+
+
+def enable(profiler: Profiler = None, *, trace_allocations: bool = False) -> Profiler:
+    """
+    start collecting the stages of all the threads
+
+    :param profiler: profiler to collect into, a new one by default
+    :param trace_allocations: record the allocated memory, starts tracemalloc if it is not running
+    :return: the enabled profiler
+
+    """
+    global _profiler, _started_tracemalloc
+
+    profiler = profiler or Profiler(trace_allocations=trace_allocations)
+    if profiler.trace_allocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+
+    _profiler = profiler
+    return profiler
+
+
+def disable() -> Optional[Profiler]:
+    """
+    :return: the profiler that was enabled
+
+    """
+    global _profiler, _started_tracemalloc
+
+    profiler, _profiler = _profiler, None
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+    return profiler
+
+
+@contextmanager
+def profile(*, trace_allocations: bool = False) -> Iterator[Profiler]:
+    """
+    profile the code inside the with block with a new profiler, the previously enabled one is restored afterwards
+
+    """
+    previous = _profiler
+
+    profiler = enable(trace_allocations=trace_allocations)
+    try:
+        yield profiler
+    finally:
+        disable()
+        if previous is not None:
+            enable(previous)
+
+
+def _escape(label_value: str) -> str:
+    return label_value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,295 @@
+import os
+import ast
+import csv
+import json
+import hashlib
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from collections import OrderedDict
+from typing import Callable, Dict, List, NoReturn, Optional
+
+from nerua import profiling
+from nerua.filelock import file_lock
+
+
+MODELS_DIR_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models")
+
+# loaded models kept in memory, estimated by the size of their files
+DEFAULT_MEMORY_BUDGET = 2 << 30
+
+
+class ModelCache:
+    """
+    LRU cache of loaded models limited by their total estimated size,
+    the least recently used models are dropped once the budget is exceeded.
+    A model is loaded outside of the lock, the threads asking for a model being loaded wait for that load
+
+    """
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        """
+        :param memory_budget: total size in bytes of the cached models, the last loaded model is kept even if
+                              it alone is larger
+
+        """
+        self.memory_budget = memory_budget
+
+        self._models = OrderedDict()
+        self._memory_used = 0
+        self._loading = dict()
+        self._lock = threading.RLock()
+        self._hits = self._misses = self._evictions = 0
+
+    def get(self, key: str, loader: Callable[[], object], size: int) -> object:
+        """
+        :param key: id of the model
+        :param loader: loads the model if it is not cached
+        :param size: estimated size of the loaded model in bytes
+        :return: the cached or newly loaded model
+
+        """
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self._hits += 1
+                profiling.count("model_cache", hits=1, misses=0)
+                return self._models[key][0]
+
+            # only the first miss loads the model, the others wait for it and are counted as hits
+            loading = self._loading.get(key)
+            is_loader = loading is None
+            if is_loader:
+                loading = self._loading[key] = Future()
+                self._misses += 1
+            else:
+                self._hits += 1
+            profiling.count("model_cache", hits=int(not is_loader), misses=int(is_loader))
+
+        if not is_loader:
+            return loading.result()
+
+        try:
+            model = loader()
+        except BaseException as error:
+            with self._lock:
+                del self._loading[key]
+            loading.set_exception(error)
+            raise
+
+        with self._lock:
+            del self._loading[key]
+            self._models[key] = model, size
+            self._memory_used += size
+            self._evict()
+
+        loading.set_result(model)
+        return model
+
+    def discard(self, key: str) -> NoReturn:
+        with self._lock:
+            if key in self._models:
+                _, size = self._models.pop(key)
+                self._memory_used -= size
+
+    def clear(self) -> NoReturn:
+        with self._lock:
+            self._models.clear()
+            self._memory_used = 0
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "models": len(self._models),
+                "memory_used": self._memory_used,
+                "memory_budget": self.memory_budget,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+    def _evict(self) -> NoReturn:
+        while self._memory_used > self.memory_budget and len(self._models) > 1:
+            _, (_, size) = self._models.popitem(last=False)
+            self._memory_used -= size
+            self._evictions += 1
+
+    def __contains__(self, key: str):
+        return key in self._models
+
+    def __len__(self):
+        return len(self._models)
+
+
+class ModelRegistry:
+    """
+    Index of the saved models. A model id is derived from the contents of its file, so the same model
+    gets the same id in every process. The metadata of all models is kept in "models_index.json",
+    models saved to the older "models_config.csv" are still found by their ids
+
+    """
+    def __init__(self, models_dir_path: str = MODELS_DIR_PATH, *, cache: ModelCache = None):
+        """
+        :param models_dir_path: directory with the index and the "__models__" directory of model files
+        :param cache: cache of the loaded models, the process wide one by default
+
+        """
+        self.models_dir_path = models_dir_path
+        self.cache = cache if cache is not None else get_model_cache()
+
+        self._index = None
+        self._index_mtime = None
+        self._legacy_index = None
+        self._lock = threading.RLock()
+
+    index_path = property(lambda self: os.path.join(self.models_dir_path, "models_index.json"))
+    legacy_index_path = property(lambda self: os.path.join(self.models_dir_path, "models_config.csv"))
+    model_files_dir_path = property(lambda self: os.path.join(self.models_dir_path, "__models__"))
+
+    def new_model_path(self, lang_short_name: str) -> str:
+        os.makedirs(self.model_files_dir_path, exist_ok=True)
+
+        model_name = f"{lang_short_name}_model_{datetime.now().strftime('%d.%m.%YT%H%M%S')}.h5"
+        return os.path.join(self.model_files_dir_path, model_name)
+
+    def register(self, model_path: str, *, lang: str, tags: List[str], stem_words: bool,
+                 max_words_count_in_sentence: Optional[int]) -> str:
+        """
+        :param model_path: path to the saved model file
+        :param lang: class name of the language of the model
+        :param tags: tags of the model in the order of its outputs
+        :param stem_words: the model is trained on stems
+        :param max_words_count_in_sentence: the longest sentence of the training data
+        :return: id of the model
+
+        """
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Unable to find the model by path: {model_path}")
+
+        model_id = _file_id(model_path)
+
+        # the index file is locked against the other processes, so a model registered between the reread
+        # of the index and its write is not lost
+        with self._lock, file_lock(f"{self.index_path}.lock"):
+            # reread the index in case another process has registered a model
+            index = dict(self._read_index())
+            index[model_id] = {
+                "lang": lang,
+                "tags": list(tags),
+                "stem_words": bool(stem_words),
+                "max_words_count_in_sentence": (
+                    int(max_words_count_in_sentence) if max_words_count_in_sentence is not None else None
+                ),
+                "path": os.path.relpath(model_path, self.models_dir_path),
+                "created": datetime.now().isoformat(timespec="seconds"),
+            }
+            self._write_index(index)
+
+        return model_id
+
+    def get(self, model_id) -> dict:
+        """
+        :param model_id: id returned by NNModel.save, an integer id of the older models_config.csv is accepted too
+        :return: metadata of the model with an absolute "path"
+
+        """
+        model_id = str(model_id)
+
+        with self._lock:
+            info = self._read_index().get(model_id)
+            if info is None:
+                info = self._read_legacy_index().get(model_id)
+
+        if info is None:
+            raise KeyError(f"Unable to find a model with id: {model_id}")
+
+        return dict(info, path=os.path.join(self.models_dir_path, info["path"]))
+
+    def load(self, model_id, loader: Callable[[str], object]) -> object:
+        """
+        :param model_id: id of the model
+        :param loader: loads the model from its path, used only if the model is not cached
+        :return: the loaded model, shared with everyone loading the same id
+
+        """
+        info = self.get(model_id)
+        if not os.path.exists(info["path"]):
+            raise FileNotFoundError(f"Unable to find the model by path: {info['path']}")
+
+        return self.cache.get(str(model_id), lambda: loader(info["path"]), os.path.getsize(info["path"]))
+
+    def models(self) -> Dict[str, dict]:
+        with self._lock:
+            return dict(self._read_legacy_index(), **self._read_index())
+
+    def _read_index(self) -> Dict[str, dict]:
+        if not os.path.exists(self.index_path):
+            return dict()
+
+        index_mtime = os.stat(self.index_path).st_mtime_ns
+        if self._index is None or index_mtime != self._index_mtime:
+            with open(self.index_path, 'r') as index_file:
+                self._index = json.load(index_file)
+            self._index_mtime = index_mtime
+
+        return self._index
+
+    def _write_index(self, index: Dict[str, dict]) -> NoReturn:
+        os.makedirs(self.models_dir_path, exist_ok=True)
+
+        tmp_index_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_index_path, 'w') as index_file:
+            json.dump(index, index_file, indent=2, ensure_ascii=False)
+        os.replace(tmp_index_path, self.index_path)
+
+        self._index, self._index_mtime = index, os.stat(self.index_path).st_mtime_ns
+
+    def _read_legacy_index(self) -> Dict[str, dict]:
+        if self._legacy_index is None:
+            self._legacy_index = dict()
+
+            if os.path.exists(self.legacy_index_path):
+                with open(self.legacy_index_path, 'r', newline='') as csv_file:
+                    for model_id, lang, tags, stem_words, max_words_count_in_sentence, path in csv.reader(csv_file):
+                        self._legacy_index[model_id] = {
+                            "lang": lang,
+                            "tags": ast.literal_eval(tags),
+                            "stem_words": stem_words == "True",
+                            "max_words_count_in_sentence": (
+                                int(max_words_count_in_sentence) if max_words_count_in_sentence else None
+                            ),
+                            "path": path,
+                        }
+
+        return self._legacy_index
+
+
+_model_cache = ModelCache()
+_model_registry = None
+_model_registry_lock = threading.Lock()
+
+
+def get_model_cache() -> ModelCache:
+    return _model_cache
+
+
+def get_model_registry() -> ModelRegistry:
+    """
+    :return: the registry of the "models" directory shared by the whole process
+
+    """
+    global _model_registry
+
+    with _model_registry_lock:
+        if _model_registry is None:
+            _model_registry = ModelRegistry()
+
+        return _model_registry
+
+
+def _file_id(path: str) -> str:
+    file_hash = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()[:16]
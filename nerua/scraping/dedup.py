@@ -0,0 +1,305 @@
+"""
+Near-duplicate detection of articles with MinHash signatures of their word shingles and an LSH index kept in sqlite,
+so the articles of a new crawl are checked against all the articles kept before
+
+usage: python -m nerua.scraping.dedup INPUT_JSONL OUTPUT_JSONL --index PATH [--lang Ukrainian] [--threshold 0.8]
+
+"""
+import os
+import sys
+import json
+import zlib
+import sqlite3
+import hashlib
+import argparse
+import numpy as np
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, NoReturn, Optional
+
+from nerua.lang.language import Language, get_language
+from nerua.tokenizer import tokenize_sentence
+
+
+# the mersenne prime 2 ** 61 - 1, the permuted hashes are taken modulo it
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class MinHasher:
+    """
+    MinHash signatures of texts, the share of equal values of two signatures estimates
+    the jaccard similarity of the sets of word shingles of the texts
+
+    """
+    def __init__(self, lang: Language, *, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        """
+        :param lang: language used to tokenize the texts
+        :param num_perm: number of hash functions, the length of a signature
+        :param shingle_size: number of consecutive words in a shingle
+        :param seed: seed of the hash functions, signatures made with different seeds are not comparable
+
+        """
+        self.lang = lang
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+
+        # a is below 2 ** 31, so a * hash + b does not overflow 64 bits for 32 bit hashes
+        random_state = np.random.RandomState(seed)
+        self._a = random_state.randint(1, 1 << 31, num_perm, dtype=np.uint64)
+        self._b = random_state.randint(0, 1 << 31, num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> List[str]:
+        words = [word.lower() for word in tokenize_sentence(text, self.lang)]
+        if len(words) <= self.shingle_size:
+            return [" ".join(words)] if words else list()
+
+        return [" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)]
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        :param text: text to sign
+        :return: uint32 array of num_perm values, all of them are the largest value for a text without words
+
+        """
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in set(self.shingles(text))), dtype=np.uint64
+        )
+        if not len(hashes):
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class DedupIndex:
+    """
+    LSH index of the signatures of the kept articles in a sqlite database. A signature is split into bands,
+    articles with an equal band are candidates and a candidate is a duplicate if the estimated similarity
+    of the signatures reaches the threshold, so an article is compared only with a few similar ones
+
+    """
+    def __init__(self, path: str, lang: Language, *, threshold: float = .8, num_perm: int = 128, bands: int = 16,
+                 shingle_size: int = 5, seed: int = 1, commit_every: int = 1000):
+        """
+        :param path: path to the sqlite database, it is created if it does not exist
+        :param lang: language used to tokenize the articles
+        :param threshold: estimated jaccard similarity from which an article is a duplicate
+        :param num_perm: length of the signatures
+        :param bands: number of bands a signature is split into, more bands find less similar candidates
+        :param shingle_size: number of consecutive words in a shingle
+        :param seed: seed of the hash functions
+        :param commit_every: number of added articles written to the database at once outside of a transaction
+
+        """
+        if num_perm % bands:
+            raise ValueError(f"The number of bands must divide the signature length {num_perm}, not {bands}")
+
+        self.path = path
+        self.threshold = threshold
+        self.hasher = MinHasher(lang, num_perm=num_perm, shingle_size=shingle_size, seed=seed)
+        self._bands = bands
+        self._commit_every = commit_every
+        self._uncommitted = 0
+        self._in_transaction = False
+
+        self.stats = {
+            "articles": 0,
+            "kept": 0,
+            "duplicates": 0,
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS articles (id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, signature BLOB);
+            CREATE TABLE IF NOT EXISTS bands (band INTEGER NOT NULL, hash INTEGER NOT NULL, article_id INTEGER);
+            CREATE INDEX IF NOT EXISTS bands_index ON bands (band, hash);
+        """)
+        self._check_settings({
+            "lang": type(lang).__name__,
+            "num_perm": num_perm,
+            "bands": bands,
+            "shingle_size": shingle_size,
+            "seed": seed,
+        })
+
+    def find_duplicate(self, signature: np.ndarray) -> Optional[str]:
+        """
+        :param signature: signature of an article
+        :return: key of the most similar kept article if the article is its duplicate, otherwise None
+
+        """
+        candidates = set()
+        for band, band_hash in enumerate(self._band_hashes(signature)):
+            candidates.update(article_id for article_id, in self._connection.execute(
+                "SELECT article_id FROM bands WHERE band = ? AND hash = ?", (band, band_hash)
+            ))
+
+        best_key, best_similarity = None, self.threshold
+        for article_id in candidates:
+            key, candidate_signature = self._connection.execute(
+                "SELECT key, signature FROM articles WHERE id = ?", (article_id,)
+            ).fetchone()
+
+            similarity = float(np.mean(np.frombuffer(candidate_signature, dtype=np.uint32) == signature))
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+
+        return best_key
+
+    def add(self, key: str, signature: np.ndarray) -> NoReturn:
+        cursor = self._connection.execute(
+            "INSERT OR IGNORE INTO articles (key, signature) VALUES (?, ?)",
+            (key, signature.astype(np.uint32).tobytes())
+        )
+        if not cursor.rowcount:
+            return
+
+        self._connection.executemany(
+            "INSERT INTO bands (band, hash, article_id) VALUES (?, ?, ?)",
+            [(band, band_hash, cursor.lastrowid) for band, band_hash in enumerate(self._band_hashes(signature))]
+        )
+
+        self._uncommitted += 1
+        if not self._in_transaction and self._uncommitted >= self._commit_every:
+            self.commit()
+
+    def check(self, text: str, key: str = None) -> Optional[str]:
+        """
+        add the article to the index unless it is a duplicate of a kept one
+
+        :param text: text of the article
+        :param key: id of the article, a hash of its text by default
+        :return: key of the kept article it duplicates or None if the article is kept
+
+        """
+        key = key if key is not None else hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+        signature = self.hasher.signature(text)
+
+        self.stats["articles"] += 1
+        duplicate_key = self.find_duplicate(signature)
+        if duplicate_key is None:
+            self.add(key, signature)
+            self.stats["kept"] += 1
+        else:
+            self.stats["duplicates"] += 1
+
+        return duplicate_key
+
+    def filter(self, article_texts: Iterable[str]) -> Iterator[str]:
+        """
+        the kept articles are added to the index but not committed, run it inside transaction()
+        and write the kept articles out before the block ends, so they are remembered only once they are written
+
+        :param article_texts: texts of the articles, read one at a time
+        :return: generator of the articles that are not duplicates of the kept ones or of the previous ones
+
+        """
+        for article_text in article_texts:
+            if self.check(article_text) is None:
+                yield article_text
+
+    @contextmanager
+    def transaction(self) -> Iterator["DedupIndex"]:
+        """
+        the articles added inside the with block are committed when it ends and rolled back if it raises
+
+        """
+        if self._in_transaction:
+            raise RuntimeError("The index is already in a transaction")
+
+        self.commit()
+        self._in_transaction = True
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        else:
+            self.commit()
+        finally:
+            self._in_transaction = False
+
+    def commit(self) -> NoReturn:
+        self._connection.commit()
+        self._uncommitted = 0
+
+    def rollback(self) -> NoReturn:
+        self._connection.rollback()
+        self._uncommitted = 0
+
+    def close(self) -> NoReturn:
+        self.commit()
+        self._connection.close()
+
+    def _band_hashes(self, signature: np.ndarray) -> List[int]:
+        # signed 64 bit values, the type of sqlite integers
+        return [
+            int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), "little", signed=True)
+            for band in np.split(signature.astype(np.uint32), self._bands)
+        ]
+
+    def _check_settings(self, settings: dict) -> NoReturn:
+        saved_settings = dict(self._connection.execute("SELECT name, value FROM settings"))
+        if not saved_settings:
+            self._connection.executemany("INSERT INTO settings (name, value) VALUES (?, ?)", [
+                (name, str(value)) for name, value in settings.items()
+            ])
+            self._connection.commit()
+
+        elif saved_settings != {name: str(value) for name, value in settings.items()}:
+            raise ValueError(f"The index {self.path} was made with different settings: {saved_settings}")
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def deduplicate_articles_jsonl(input_file_path: str, output_file_path: str, index: DedupIndex) -> dict:
+    """
+    copy the articles of a jsonl file made by create_file_for_tagging_* without the duplicates,
+    the kept articles are numbered again
+
+    :param input_file_path: jsonl with an "article" in every line
+    :param output_file_path: path of the jsonl file to write
+    :param index: index of the articles kept before, the kept articles are added to it once the output is written
+    :return: number of the checked, kept and removed articles
+
+    """
+    from nerua.scraping.preprocess import write_articles_jsonl
+
+    with open(input_file_path, 'r', encoding='utf-8') as jsonl_file:
+        article_texts = (json.loads(line)["article"] for line in jsonl_file if line.strip())
+        write_articles_jsonl(output_file_path, article_texts, index)
+
+    return dict(index.stats)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Remove near-duplicate articles from a jsonl file")
+    parser.add_argument("input", help="jsonl with one article per line")
+    parser.add_argument("output", help="jsonl to write the kept articles to")
+    parser.add_argument("--index", required=True, help="sqlite index of the articles kept by the previous runs")
+    parser.add_argument("--lang", default="Ukrainian", help="language of the articles")
+    parser.add_argument("--threshold", type=float, default=.8, help="similarity from which an article is removed")
+    args = parser.parse_args(argv)
+
+    with DedupIndex(args.index, get_language(args.lang), threshold=args.threshold) as index:
+        stats = deduplicate_articles_jsonl(args.input, args.output, index)
+
+    print(
+        f"{stats['duplicates']} of {stats['articles']} articles removed as duplicates, "
+        f"{stats['kept']} kept", file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,27 +3,180 @@ import re
 import html
 import json
 from lxml import etree
-from typing import NoReturn
+from itertools import chain
+from functools import partial
+from typing import Iterable, Iterator, List, NoReturn, Optional, Union
 
-from nerua.lang.language import Language
-from nerua.preprocess import _multiple_replace, base_normilize, remove_abbr
+from nerua.lang.language import Language, get_language
+from nerua.parallel import parallel_map
+from nerua.preprocess import base_normilize, remove_abbr
+from nerua.scraping.dedup import DedupIndex
+from nerua.scraping.segments import iter_segment_records, list_segments
 
 
-def create_file_for_tagging_from_xml_file(input_file_path: str, output_file_path: str, lang: Language) -> NoReturn:
+# tags dropped from the spider dumps while their text is kept
+SPIDER_XML_INLINE_TAGS = ("a", "strong", "b", "em", "span", "br", "i", "meta", "img")
+
+# tags dropped from the spider dumps together with their content
+SPIDER_XML_REMOVED_TAGS = ("script",)
+
+
+def create_file_for_tagging_from_xml_file(input_file_path: str, output_file_path: str, lang: Language, *,
+                                          processes: Optional[int] = 1, chunk_size: int = 64,
+                                          dedup_index: DedupIndex = None) -> NoReturn:
+    """
+    convert a spider dump to jsonl with one normalized article per line
+
+    :param input_file_path: path to the .text file written by a spider
+    :param output_file_path: path of the jsonl file to write
+    :param lang: the main language used in the articles
+    :param processes: number of worker processes normalizing the articles, None to use every core
+    :param chunk_size: number of articles sent to a worker at once
+    :param dedup_index: drop the near-duplicates of the articles kept in this index
+
+    """
     if not os.path.exists(input_file_path):
         raise FileNotFoundError(f"Unable to find input file by path: {input_file_path}")
 
     elif not input_file_path.count('.') or input_file_path.split('.')[-1] != "text":
         raise ValueError("The input file must have an text extension")
 
-    with open(input_file_path, "r") as xml_file:
-        xml = xml_file.read()
+    article_texts = parallel_map(
+        partial(prepare_article_text, lang_name=type(lang).__name__), iter_spider_articles(input_file_path),
+        processes=processes, chunk_size=chunk_size
+    )
+
+    write_articles_jsonl(output_file_path, article_texts, dedup_index)
+
+
+def iter_spider_articles(input_file_path: str, cleaner: "SpiderXmlCleaner" = None) -> Iterator[List[str]]:
+    """
+    read a spider dump one article at a time, the parsed articles are dropped as soon as they are processed
+    so the memory use does not depend on the size of the dump
+
+    :param input_file_path: path to the .text file written by a spider
+    :param cleaner: html cleanup applied to every article, the default one by default
+    :return: generator of the paragraph texts of every non-empty article
+
+    """
+    cleaner = cleaner or SpiderXmlCleaner()
+
+    # the paragraphs are raw html, so void tags like <br> and html entities are expected
+    articles = etree.iterparse(
+        input_file_path, events=("end",), tag="article", html=True, encoding="utf-8", huge_tree=True,
+        remove_comments=True
+    )
+
+    for _, article in articles:
+        paragraphs = cleaner.paragraph_texts(article) if cleaner.clean_element(article) else None
+
+        # free the article and everything parsed before it
+        article.clear()
+        while article.getprevious() is not None:
+            del article.getparent()[0]
+
+        if paragraphs is not None:
+            yield paragraphs
+
+
+def create_file_for_tagging_from_segments(segments: Union[str, Iterable[str]], output_file_path: str, lang: Language, *,
+                                          processes: Optional[int] = 1, dedup_index: DedupIndex = None) -> NoReturn:
+    """
+    convert the article segments written by ArticleSegmentPipeline to jsonl with one normalized article per line,
+    every worker process reads and normalizes whole segments
+
+    :param segments: directory of the segments or paths to them
+    :param output_file_path: path of the jsonl file to write
+    :param lang: the main language used in the articles
+    :param processes: number of worker processes, None to use every core
+    :param dedup_index: drop the near-duplicates of the articles kept in this index
+
+    """
+    segment_paths = list_segments(segments) if isinstance(segments, str) else list(segments)
+    if not segment_paths:
+        raise FileNotFoundError(f"Unable to find article segments: {segments}")
+
+    segment_article_texts = parallel_map(
+        partial(prepare_segment_article_texts, lang_name=type(lang).__name__), segment_paths,
+        processes=processes, chunk_size=1
+    )
+
+    write_articles_jsonl(output_file_path, chain.from_iterable(segment_article_texts), dedup_index)
+
+
+def iter_segment_articles(segment_path: str, cleaner: "SpiderXmlCleaner" = None) -> Iterator[List[str]]:
+    """
+    :param segment_path: path to a segment written by ArticleSegmentPipeline
+    :param cleaner: html cleanup applied to every article, the default one by default
+    :return: generator of the paragraph texts of every non-empty article
+
+    """
+    cleaner = cleaner or SpiderXmlCleaner()
+    parser = etree.HTMLParser(remove_comments=True, huge_tree=True)
+
+    for record in iter_segment_records(segment_path):
+        # only the html of the paragraphs of a single article is parsed
+        root = etree.fromstring(f"<article>{''.join(record['paragraphs'])}</article>", parser)
+        article = root.find("body/article") if root is not None else None
+
+        if article is not None and cleaner.clean_element(article):
+            yield cleaner.paragraph_texts(article)
+
+
+def prepare_segment_article_texts(segment_path: str, lang_name: str) -> List[str]:
+    """
+    :param segment_path: path to a segment written by ArticleSegmentPipeline
+    :param lang_name: name of the main language used in the articles
+    :return: normalized texts of the articles of the segment
+
+    """
+    return [prepare_article_text(paragraphs, lang_name) for paragraphs in iter_segment_articles(segment_path)]
+
+
+def prepare_article_text(paragraphs: List[str], lang_name: str) -> str:
+    """
+    :param paragraphs: texts of the paragraphs of an article
+    :param lang_name: name of the main language used in the article
+    :return: normalized text of the article with decoded html entities, one paragraph per line
+
+    """
+    lang = get_language(lang_name)
+    return html.unescape("\n".join(normilize_paragraph_text(paragraph, lang) for paragraph in paragraphs))
+
 
-    xml = normilize_text_inside_xml(xml, lang)
-    jsonl = convert_ner_xml_to_jsonl(xml)
+def write_articles_jsonl(output_file_path: str, article_texts: Iterable[str],
+                         dedup_index: DedupIndex = None) -> NoReturn:
+    """
+    write the articles under a temporary name renamed to the output path once all of them are written
 
-    with open(output_file_path, "w") as jsonl_file:
-        jsonl_file.write(jsonl)
+    :param output_file_path: path of the jsonl file to write
+    :param article_texts: texts of the articles
+    :param dedup_index: drop the near-duplicates of the articles kept in this index, the written articles are
+                        committed to it after the rename and nothing is committed if the writing fails
+
+    """
+    if dedup_index is not None:
+        with dedup_index.transaction():
+            write_articles_jsonl(output_file_path, dedup_index.filter(article_texts))
+        return
+
+    part_file_path = f"{output_file_path}.part"
+    try:
+        with open(part_file_path, "w") as jsonl_file:
+            for article_id, article_text in enumerate(article_texts):
+                if article_id:
+                    jsonl_file.write("\n")
+
+                jsonl_file.write(json.dumps({
+                    f"article_id": article_id,
+                    "article": article_text
+                }))
+    except BaseException:
+        if os.path.exists(part_file_path):
+            os.remove(part_file_path)
+        raise
+
+    os.replace(part_file_path, output_file_path)
 
 
 def convert_ner_xml_to_jsonl(xml: str) -> str:
@@ -68,47 +221,133 @@ def normilize_text_inside_xml(xml: str, lang: Language) -> str:
             if paragraph.text is None:
                 continue
 
-            paragraph_text = paragraph.text
-            paragraph_text = base_normilize(paragraph_text)
-            paragraph_text = remove_abbr(paragraph_text, lang)
-            paragraph_text = re.sub(r"\s+", " ", paragraph_text)
-            paragraph.text = paragraph_text.capitalize()
+            paragraph.text = normilize_paragraph_text(paragraph.text, lang)
 
     xml = etree.tostring(root, encoding='unicode')
     return xml
 
 
-def simplify_spider_xml(xml: str) -> str:
+def normilize_paragraph_text(paragraph_text: str, lang: Language) -> str:
+    paragraph_text = base_normilize(paragraph_text)
+    paragraph_text = remove_abbr(paragraph_text, lang)
+    paragraph_text = re.sub(r"\s+", " ", paragraph_text)
+    return paragraph_text.capitalize()
+
+
+def simplify_spider_xml(xml: str, cleaner: "SpiderXmlCleaner" = None) -> str:
     """
     Remove HTML tags from text (but not p)
 
     :param xml: the text to be cleared of html tags
+    :param cleaner: html cleanup to apply, the default one by default
     :return: xml text without html tags
 
     """
     if not isinstance(xml, str):
         raise TypeError(f"The 'xml' variable must have a string type, not {type(xml).__name__}")
 
-    # delete html comments and script tags with code inside
-    xml = re.sub(r"<!--[\S\s]*?-->|<script(?:\s.*?>|>)>.*?</script>", "", xml)
+    return (cleaner or SpiderXmlCleaner()).clean(xml)
 
-    # delete tags listed in the tuple while preserving the code inside
-    for tag in ("a", "strong", "b", "em", "span", "br", "i", "meta", "img"):
-        xml = re.sub(fr"</?\s*{tag}(?:\s.*?>|>)", "", xml)
 
-    # change non-breaking space to space
-    xml = re.sub(u"\xa0", u" ", xml)
-
-    # delete empty p tags
-    xml = re.sub(r"<\s*p(?:\s.*?>|>)\s*</\s*p(?:\s.*?>|>)", "", xml)
-
-    # drop p tags attributes
-    xml = _multiple_replace({r"<\s*p(?:\s.*?>|>)\s*": "<p>", r"\s*</\s*p\s*>": "</p>"}, xml)
-
-    # delete empty lines
-    xml = re.sub(r"\t+\n+", "", xml)
-
-    # delete empty articles
-    xml = re.sub(fr"\t*<.*?>\s*</.*?>\n*", "", xml)
+class SpiderXmlCleaner:
+    """
+    Cleanup of the html the spiders store inside the paragraphs of their dumps. The markup is parsed once,
+    then unwanted elements are dropped together with their content, inline tags are unwrapped keeping their text,
+    and a single walk over the tree removes attributes, non-breaking spaces and the elements left empty.
+    As in any html parser a block element inside a paragraph closes the paragraph, which the spiders
+    extracting the paragraphs with an html parser never produce
 
-    return xml
+    """
+    def __init__(self, *, inline_tags: Iterable[str] = SPIDER_XML_INLINE_TAGS,
+                 removed_tags: Iterable[str] = SPIDER_XML_REMOVED_TAGS, paragraph_tag: str = "p",
+                 attribute_free_tags: Iterable[str] = ("p",)):
+        """
+        :param inline_tags: tags to unwrap, their text is kept
+        :param removed_tags: tags to drop with everything inside them
+        :param paragraph_tag: tag of the paragraphs, their text is stripped
+        :param attribute_free_tags: tags to remove attributes from
+
+        """
+        self._inline_tags = tuple(inline_tags)
+        self._removed_tags = tuple(removed_tags)
+        self._paragraph_tag = paragraph_tag
+        self._attribute_free_tags = frozenset(attribute_free_tags)
+
+    def clean(self, xml: str) -> str:
+        """
+        :param xml: spider dump or a part of it
+        :return: the cleaned dump serialized as xml
+
+        """
+        parser = etree.HTMLParser(remove_comments=True, huge_tree=True)
+        root = etree.fromstring(xml, parser)
+        if root is None:
+            return ""
+
+        # the html parser wraps the markup into html and body elements
+        body = root.find("body")
+        elements = list(body if body is not None else root)
+
+        for element in elements:
+            self.clean_element(element)
+
+        return "".join(etree.tostring(element, encoding='unicode', with_tail=False) for element in elements)
+
+    def clean_element(self, element: etree.ElementBase) -> bool:
+        """
+        clean an element in place, its descendants that are left empty are removed
+
+        :param element: element to clean
+        :return: False if the element itself is left empty
+
+        """
+        if self._removed_tags:
+            etree.strip_elements(element, *self._removed_tags, with_tail=False)
+        if self._inline_tags:
+            etree.strip_tags(element, *self._inline_tags)
+
+        # children come before their parents in the reversed document order
+        for node in reversed(list(element.iter())):
+            if node.text:
+                node.text = node.text.replace("\xa0", " ")
+            if node.tail:
+                node.tail = node.tail.replace("\xa0", " ")
+
+            if node.tag in self._attribute_free_tags:
+                node.attrib.clear()
+
+            if node.tag == self._paragraph_tag:
+                if len(node):
+                    node.text = (node.text or "").lstrip() or None
+                    node[-1].tail = (node[-1].tail or "").rstrip() or None
+                else:
+                    node.text = (node.text or "").strip() or None
+
+            if node is not element and _is_empty(node):
+                _remove_keeping_tail(node)
+
+        return not _is_empty(element)
+
+    def paragraph_texts(self, element: etree.ElementBase) -> List[str]:
+        """
+        :param element: cleaned element
+        :return: texts of the paragraphs inside the element
+
+        """
+        return [paragraph.text for paragraph in element.iter(self._paragraph_tag) if paragraph.text is not None]
+
+
+def _is_empty(element: etree.ElementBase) -> bool:
+    return not len(element) and not (element.text or "").strip()
+
+
+def _remove_keeping_tail(element: etree.ElementBase) -> NoReturn:
+    parent, previous = element.getparent(), element.getprevious()
+
+    if element.tail:
+        if previous is not None:
+            previous.tail = (previous.tail or "") + element.tail
+        else:
+            parent.text = (parent.text or "") + element.tail
+
+    parent.remove(element)
@@ -0,0 +1,264 @@
+import io
+import os
+import gzip
+import json
+import zlib
+import time
+from datetime import datetime
+from typing import Callable, Iterator, List, NoReturn
+
+
+# extensions of the finished segments by compression
+SEGMENT_EXTENSIONS = {
+    "gzip": ".jsonl.gz",
+    "zstd": ".jsonl.zst",
+}
+
+# extension of the segment being written, it is renamed to the final one when the segment is finished
+PART_EXTENSION = ".part"
+
+# bytes of a segment read at once when it is recovered
+_RECOVERY_CHUNK_SIZE = 1 << 16
+
+
+class SegmentWriter:
+    """
+    Writes records as compressed jsonl segments. Records are compressed in batches, every batch is a complete
+    gzip member or zstd frame appended to the segment, so a crash loses at most the batch being written.
+    A segment is written under a temporary name and renamed once it is full or the writer is closed,
+    so the readers never see a segment that is still being written
+
+    """
+    def __init__(self, directory: str, prefix: str, *, max_segment_size: int = 64 << 20, compression: str = "gzip",
+                 flush_every: int = 100, flush_interval: float = None, on_flush: Callable[[List[dict]], object] = None):
+        """
+        :param directory: where to write the segments
+        :param prefix: beginning of the names of the segments
+        :param max_segment_size: start a new segment once the compressed size of the current one exceeds it
+        :param compression: "gzip" or "zstd", the last requires the zstandard package
+        :param flush_every: number of records in a compressed batch
+        :param flush_interval: seconds after which a batch is written even if it has fewer records
+        :param on_flush: called with the records of every batch once it is written
+
+        """
+        if compression not in SEGMENT_EXTENSIONS:
+            raise ValueError(f"Unknown compression: {compression}, expected one of {', '.join(SEGMENT_EXTENSIONS)}")
+
+        self.directory = directory
+        self.prefix = prefix
+        self._max_segment_size = max_segment_size
+        self._compression = compression
+        self._compress = _compressor(compression)
+        self._flush_every = flush_every
+        self._flush_interval = flush_interval
+        self._flushed = time.monotonic()
+        self._on_flush = on_flush
+
+        self._records = list()
+        self._file = None
+        self._part_path = None
+        self._segment_count = 0
+
+        os.makedirs(directory, exist_ok=True)
+        recover_segments(directory, prefix)
+
+    def write(self, record: dict) -> NoReturn:
+        self._records.append(record)
+
+        if len(self._records) >= self._flush_every or (
+                self._flush_interval is not None and time.monotonic() - self._flushed >= self._flush_interval):
+            self.flush()
+
+    def flush(self) -> NoReturn:
+        self._flushed = time.monotonic()
+        if not self._records:
+            return
+
+        if self._file is None:
+            self._open_segment()
+
+        records, self._records = self._records, list()
+        self._file.write(self._compress("".join(
+            json.dumps(record, ensure_ascii=False) + "\n" for record in records
+        ).encode("utf-8")))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        if self._on_flush is not None:
+            self._on_flush(records)
+
+        if self._file.tell() >= self._max_segment_size:
+            self._finish_segment()
+
+    def close(self) -> NoReturn:
+        self.flush()
+        self._finish_segment()
+
+    def _open_segment(self) -> NoReturn:
+        # a segment recovered from a crashed writer may have the same name
+        while True:
+            name = f"{self.prefix}.{datetime.now().strftime('%Y%m%dT%H%M%S')}.{os.getpid()}.{self._segment_count:05d}"
+            self._segment_count += 1
+
+            segment_path = os.path.join(self.directory, f"{name}{SEGMENT_EXTENSIONS[self._compression]}")
+            if not os.path.exists(segment_path):
+                break
+
+        self._part_path = f"{segment_path}{PART_EXTENSION}"
+        self._file = open(self._part_path, 'wb')
+
+    def _finish_segment(self) -> NoReturn:
+        if self._file is None:
+            return
+
+        self._file.close()
+        os.replace(self._part_path, self._part_path[:-len(PART_EXTENSION)])
+        self._file, self._part_path = None, None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def list_segments(directory: str) -> List[str]:
+    """
+    :return: paths of the finished segments in the directory in the order of their names
+
+    """
+    if not os.path.exists(directory):
+        return list()
+
+    return [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.endswith(tuple(SEGMENT_EXTENSIONS.values()))
+    ]
+
+
+def iter_segment_records(path: str) -> Iterator[dict]:
+    """
+    :param path: path to a finished segment
+    :return: generator of its records
+
+    """
+    with _open_segment_stream(path) as lines:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+
+def recover_segments(directory: str, prefix: str = "") -> List[str]:
+    """
+    finish the segments left by a writer that has crashed, the incomplete batch at their end is dropped
+
+    :param directory: directory of the segments
+    :param prefix: recover only the segments with this prefix
+    :return: paths of the recovered segments
+
+    """
+    recovered = list()
+
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith(prefix) or not name.endswith(PART_EXTENSION):
+            continue
+
+        part_path = os.path.join(directory, name)
+        with open(part_path, 'r+b') as part_file:
+            complete_size = _complete_batches_size(part_file, _segment_compression(part_path[:-len(PART_EXTENSION)]))
+            if complete_size:
+                part_file.truncate(complete_size)
+
+        if not complete_size:
+            os.remove(part_path)
+            continue
+
+        os.replace(part_path, part_path[:-len(PART_EXTENSION)])
+        recovered.append(part_path[:-len(PART_EXTENSION)])
+
+    return recovered
+
+
+def _segment_compression(path: str) -> str:
+    for compression, extension in SEGMENT_EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+
+    raise ValueError(f"Not a segment: {path}")
+
+
+def _compressor(compression: str) -> Callable[[bytes], bytes]:
+    if compression == "gzip":
+        return lambda data: gzip.compress(data, compresslevel=6)
+
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstandard is required to write zstd compressed segments")
+
+    return zstandard.ZstdCompressor(level=3).compress
+
+
+def _open_segment_stream(path: str) -> io.TextIOBase:
+    """
+    :return: the decompressed lines of a finished segment, read as a stream across its batches
+
+    """
+    if _segment_compression(path) == "gzip":
+        # gzip reads the members one after another
+        return gzip.open(path, 'rt', encoding="utf-8")
+
+    import zstandard
+
+    segment_file = open(path, 'rb')
+    try:
+        reader = zstandard.ZstdDecompressor().stream_reader(segment_file, read_across_frames=True, closefd=True)
+    except BaseException:
+        segment_file.close()
+        raise
+
+    return io.TextIOWrapper(io.BufferedReader(reader), encoding="utf-8")
+
+
+def _complete_batches_size(part_file, compression: str) -> int:
+    """
+    :param part_file: segment opened in the binary mode
+    :param compression: compression of the segment
+    :return: the size of the complete batches at the beginning of the segment, the first incomplete
+             or corrupted batch and everything after it are not counted
+
+    """
+    if compression == "zstd":
+        import zstandard
+
+        new_decompressor = lambda: zstandard.ZstdDecompressor().decompressobj()
+        errors = zstandard.ZstdError,
+    else:
+        # gzip members, MAX_WBITS | 16 expects the gzip header
+        new_decompressor = lambda: zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        errors = zlib.error,
+
+    # the data is read in chunks and a batch ending inside a chunk is followed by a view of the rest of the chunk,
+    # so every byte is copied a bounded number of times however large the segment is
+    decompressor, complete_size, position = new_decompressor(), 0, 0
+    while True:
+        chunk = part_file.read(_RECOVERY_CHUNK_SIZE)
+        if not chunk:
+            return complete_size
+
+        data = memoryview(chunk)
+        position += len(data)
+
+        while data:
+            try:
+                decompressor.decompress(data)
+            except errors:
+                return complete_size
+
+            if not decompressor.eof:
+                break
+
+            unused_size = len(decompressor.unused_data)
+            complete_size = position - unused_size
+            decompressor, data = new_decompressor(), data[len(data) - unused_size:]
@@ -1,31 +1,257 @@
+"""
+News spiders and the runner crawling all of them at the same time, the articles are written
+to compressed jsonl segments in data/segments by ArticleSegmentPipeline
+
+usage: python -m nerua.scraping.spider [--only SPIDER_NAME ...] [--full] [--state-dir PATH]
+                                       [--set SETTING=VALUE ...] [--start-url SPIDER_NAME=URL ...]
+
+"""
 import os
 import sys
+import shutil
 import scrapy
 import inspect
-from lxml import etree
+import argparse
 from time import sleep
 from pathlib import Path
-from selenium import webdriver
-from scrapy.crawler import CrawlerProcess
+from functools import partial
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, NoReturn
+
+from nerua.scraping.segments import SegmentWriter
+
+
+SPIDER_DATA_DIR_PATH = Path(__file__).parent.parent.parent / "data"
+
+# segments of the crawled articles, their names start with the names of the spiders
+SPIDER_SEGMENTS_DIR_PATH = SPIDER_DATA_DIR_PATH / "segments"
+
+# crawl state of every spider: the scrapy job directory and the urls of the articles already saved
+SPIDER_STATE_DIR_PATH = Path(__file__).parent.parent.parent / "crawl_state"
+
+# scrapy settings shared by all the spiders, a spider overrides them in its custom_settings,
+# the concurrency and the delay are applied to every domain separately,
+# NERUA_CRAWL_STATE_DIR is where every spider keeps its job directory and its seen urls,
+# NERUA_SEGMENT_* settings configure the segments written by ArticleSegmentPipeline
+SPIDER_SETTINGS = {
+    "CONCURRENT_REQUESTS": 32,
+    "CONCURRENT_REQUESTS_PER_DOMAIN": 4,
+    "DOWNLOAD_DELAY": .5,
+    "AUTOTHROTTLE_ENABLED": True,
+    "AUTOTHROTTLE_START_DELAY": 1.,
+    "AUTOTHROTTLE_MAX_DELAY": 30.,
+    "AUTOTHROTTLE_TARGET_CONCURRENCY": 2.,
+    "RETRY_TIMES": 3,
+    "LOG_LEVEL": "INFO",
+    "ITEM_PIPELINES": {"nerua.scraping.spider.ArticleSegmentPipeline": 300},
+    "NERUA_SEGMENTS_DIR": str(SPIDER_SEGMENTS_DIR_PATH),
+    "NERUA_SEGMENT_SIZE": 64 << 20,
+    "NERUA_SEGMENT_COMPRESSION": "gzip",
+    "NERUA_SEGMENT_FLUSH_EVERY": 100,
+    "NERUA_SEGMENT_FLUSH_INTERVAL": 10.,
+}
+
+
+_FINISHED_JOB_MARK = "finished"
+
+
+class SeenUrlStore:
+    """
+    Urls of the articles saved by the previous crawls, kept in a text file with one url per line.
+    A url is appended as soon as its article is written to a segment, so an interrupted crawl loses nothing
+
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._urls = set()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as urls_file:
+                self._urls.update(line.rstrip("\n") for line in urls_file if line.strip())
+
+        self._file = open(path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def normalize(url: str) -> str:
+        return url.partition("#")[0]
+
+    def add(self, url: str) -> NoReturn:
+        url = self.normalize(url)
+        if url not in self._urls:
+            self._urls.add(url)
+            self._file.write(f"{url}\n")
+            self._file.flush()
+
+    def close(self) -> NoReturn:
+        self._file.close()
+
+    def __contains__(self, url: str):
+        return self.normalize(url) in self._urls
+
+    def __len__(self):
+        return len(self._urls)
+
+
+class ArticleSegmentPipeline:
+    """
+    Writes the articles yielded by a spider to compressed jsonl segments, one record per article.
+    The records are written in batches and the url of an article is marked as seen only once
+    its batch is on the disk
+
+    """
+    def __init__(self, segments_dir_path: str, *, max_segment_size: int, compression: str, flush_every: int,
+                 flush_interval: float):
+        """
+        :param segments_dir_path: where to write the segments
+        :param max_segment_size: compressed size of a segment in bytes after which a new one is started
+        :param compression: "gzip" or "zstd"
+        :param flush_every: number of articles written at once
+        :param flush_interval: seconds after which the articles are written even if there are fewer of them
+
+        """
+        self.segments_dir_path = segments_dir_path
+        self._writer_kwargs = {
+            "max_segment_size": max_segment_size,
+            "compression": compression,
+            "flush_every": flush_every,
+            "flush_interval": flush_interval,
+        }
+        self._writer = None
+        self._crawler = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        pipeline = cls(
+            settings.get("NERUA_SEGMENTS_DIR") or str(SPIDER_SEGMENTS_DIR_PATH),
+            max_segment_size=settings.getint("NERUA_SEGMENT_SIZE", 64 << 20),
+            compression=settings.get("NERUA_SEGMENT_COMPRESSION", "gzip"),
+            flush_every=settings.getint("NERUA_SEGMENT_FLUSH_EVERY", 100),
+            flush_interval=settings.getfloat("NERUA_SEGMENT_FLUSH_INTERVAL", 10.),
+        )
+        pipeline._crawler = crawler
+        return pipeline
+
+    # the newer scrapy versions do not pass the spider to the pipelines, it is taken from the crawler then
+    def open_spider(self, spider=None):
+        spider = spider or self._crawler.spider
+        self._writer = SegmentWriter(
+            self.segments_dir_path, spider.name, on_flush=partial(_mark_articles_seen, spider), **self._writer_kwargs
+        )
+
+    def process_item(self, item, spider=None):
+        self._writer.write(dict(item))
+        return item
+
+    def close_spider(self, spider=None):
+        self._writer.close()
+
+
+def _mark_articles_seen(spider, records: List[dict]) -> NoReturn:
+    seen_urls = getattr(spider, "seen_urls", None)
+    if seen_urls is not None:
+        for record in records:
+            seen_urls.add(record["url"])
+
+
+class NewsSpider(scrapy.Spider):
+    """
+    Base of the news spiders. The articles are yielded as {"url", "source", "fetched_at", "paragraphs"} items
+    for ArticleSegmentPipeline, articles saved by the previous crawls are not requested again
+
+    """
+    # the site name written to every article record
+    source = None
+
+    @classmethod
+    def update_settings(cls, settings):
+        super(NewsSpider, cls).update_settings(settings)
+
+        # the job directory keeps the scheduled requests and the request fingerprints of an unfinished crawl
+        state_dir_path = settings.get("NERUA_CRAWL_STATE_DIR")
+        if state_dir_path and not settings.get("JOBDIR"):
+            job_dir_path = os.path.join(state_dir_path, cls.name, "job")
+
+            # only an interrupted crawl is resumed, a new one starts with an empty job directory
+            if os.path.exists(os.path.join(job_dir_path, _FINISHED_JOB_MARK)):
+                shutil.rmtree(job_dir_path)
+
+            settings.set("JOBDIR", job_dir_path, priority="spider")
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        state_dir_path = crawler.settings.get("NERUA_CRAWL_STATE_DIR")
+        if state_dir_path:
+            kwargs.setdefault("seen_urls_path", os.path.join(state_dir_path, cls.name, "seen_urls.txt"))
 
-if not os.path.exists("spider_data"):
-    os.mkdir("spider_data")
+        return super(NewsSpider, cls).from_crawler(crawler, *args, **kwargs)
 
+    def __init__(self, name=None, *, start_url: str = None, seen_urls_path: str = None, incremental=True, **kwargs):
+        """
+        :param start_url: crawl from this url instead of the site, for example from a local copy of it
+        :param seen_urls_path: file of the SeenUrlStore, by default in the crawl state directory of the spider
+        :param incremental: stop following the older news once a listing page has no new articles
 
-class PravdaNewsSpider(scrapy.Spider):
+        """
+        super(NewsSpider, self).__init__(name, **kwargs)
+
+        if start_url is not None:
+            self.start_urls = [start_url]
+
+        # spider arguments given on the command line are strings
+        self.incremental = incremental not in (False, "0", "false", "False", "no")
+
+        self.seen_urls = SeenUrlStore(seen_urls_path or str(SPIDER_STATE_DIR_PATH / self.name / "seen_urls.txt"))
+
+    def article_requests(self, response, urls: Iterable[str]) -> List[scrapy.Request]:
+        """
+        :param response: the listing page
+        :param urls: links to articles found on the page
+        :return: requests of the articles not saved yet
+
+        """
+        urls = [response.urljoin(url) for url in urls]
+        return [scrapy.Request(url, callback=self.parse_article) for url in urls if url not in self.seen_urls]
+
+    def parse_article(self, response):
+        # the url is marked as seen by ArticleSegmentPipeline once the article is written
+        yield {
+            "url": response.url,
+            "source": self.source,
+            "fetched_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "paragraphs": list(self.article_paragraphs(response)),
+        }
+
+    def article_paragraphs(self, response) -> Iterable[str]:
+        """
+        :return: html of the paragraphs of the article
+
+        """
+        raise NotImplementedError
+
+    def closed(self, reason):
+        self.seen_urls.close()
+
+        job_dir_path = self.settings.get("JOBDIR")
+        if reason == "finished" and job_dir_path:
+            Path(job_dir_path, _FINISHED_JOB_MARK).touch()
+
+
+class PravdaNewsSpider(NewsSpider):
     name = "pravda_spider"
+    source = "pravda.com.ua"
     start_urls = [r"https://www.pravda.com.ua/news/"]
 
-    def __init__(self, name=None, **kwargs):
-        super(PravdaNewsSpider, self).__init__(name, **kwargs)
+    def parse(self, response, **kwargs):
+        article_urls = [link.get() for link in response.xpath('//div[@class="article_header"]/a/@href')]
+        article_requests = self.article_requests(response, article_urls)
 
-        self.xml_file = open(Path(__file__).parent.parent.parent / "data" / "pravda_spider_data.text", "w")
-        self.xml_file.write(f'<data from="pravda.com.ua">\n')
+        yield from article_requests
 
-    def parse(self, response, **kwargs):
-        for article_link in response.xpath('//div[@class="article_header"]/a/@href'):
-            yield scrapy.Request(response.urljoin(article_link.get()), callback=self.parse_article)
+        # the news of the previous days were saved by the previous crawls
+        if self.incremental and article_urls and not article_requests:
+            return
 
         url_on_yesterdays_news = response.xpath('//a[img/@src="/images/v6/ico_arr_l.svg"]/@href')
         if url_on_yesterdays_news:
@@ -34,34 +260,23 @@ class PravdaNewsSpider(scrapy.Spider):
                 callback=self.parse
             )
 
-    def parse_article(self, response):
-        self.xml_file.write(f'\t<article url="{response.url}">\n')
-
-        for paragraph in response.xpath('//div[@class="post_text"]/p[not(script)]'):
-            self.xml_file.write(f"\t\t{paragraph.get()}\n")
-
-        for paragraph in response.xpath('//article[@class="article"]/p'):
-            self.xml_file.write(f"\t\t{paragraph.get()}\n")
+    def article_paragraphs(self, response) -> Iterable[str]:
+        for xpath in ('//div[@class="post_text"]/p[not(script)]', '//article[@class="article"]/p',
+                      '//div[@class="post__text"]/p'):
+            for paragraph in response.xpath(xpath):
+                yield paragraph.get()
 
-        for paragraph in response.xpath('//div[@class="post__text"]/p'):
-            self.xml_file.write(f"\t\t{paragraph.get()}\n")
 
-        self.xml_file.write("\t</article>\n")
-
-    def __del__(self):
-        self.xml_file.write(f"</data>\n")
-        self.xml_file.close()
-
-
-class TsnNewsSpider(scrapy.Spider):
+class TsnNewsSpider(NewsSpider):
     name = "tsn_spider"
+    source = "tsn.ua"
     start_urls = [r"https://tsn.ua/news"]
 
     def __init__(self, name=None, **kwargs):
         super(TsnNewsSpider, self).__init__(name, **kwargs)
 
-        self.xml_file = open(Path(__file__).parent.parent.parent / "data" / "tsn_spider_data.text", "w")
-        self.xml_file.write(f'<data from="tsn.ua">\n')
+        # selenium is needed only by this spider
+        from selenium import webdriver
 
         self.driver = webdriver.Firefox()
 
@@ -76,40 +291,102 @@ class TsnNewsSpider(scrapy.Spider):
 
         previus_article_num = 0
         while previus_article_num != len(self.driver.find_elements_by_xpath(xpath_to_articles_link)):
-            previus_article_num = len(self.driver.find_elements_by_xpath(xpath_to_articles_link))
+            article_links = self.driver.find_elements_by_xpath(xpath_to_articles_link)
+
+            # the older news were saved by the previous crawls
+            last_article_url = response.urljoin(article_links[-1].get_attribute("href")) if article_links else None
+            if self.incremental and last_article_url is not None and last_article_url in self.seen_urls:
+                break
+
+            previus_article_num = len(article_links)
             for _ in range(10):
                 self.driver.execute_script("arguments[0].click();", load_more_articles_button)
                 sleep(1)
 
-        for article_link in self.driver.find_elements_by_xpath(xpath_to_articles_link):
-            yield scrapy.Request(response.urljoin(article_link.get_attribute("href")), callback=self.parse_article)
-
-    def parse_article(self, response):
-        self.xml_file.write(f'\t<article url="{response.url}">\n')
+        yield from self.article_requests(response, [
+            article_link.get_attribute("href")
+            for article_link in self.driver.find_elements_by_xpath(xpath_to_articles_link)
+        ])
 
+    def article_paragraphs(self, response) -> Iterable[str]:
         for paragraph in response.xpath('//div[@class="c-card__box c-card__body"]/p'):
-            self.xml_file.write(f"\t\t{paragraph.get()}\n")
-
-        self.xml_file.write("\t</article>\n")
+            yield paragraph.get()
 
-    def __del__(self):
-        self.xml_file.write(f"</data>\n")
-        self.xml_file.close()
+    def closed(self, reason):
+        super(TsnNewsSpider, self).closed(reason)
 
         self.driver.close()
 
 
-def _is_scrapy_spider(member) -> bool:
-    return inspect.isclass(member) and issubclass(getattr(sys.modules[__name__], member.__name__), scrapy.Spider)
+def _is_news_spider(member) -> bool:
+    return inspect.isclass(member) and issubclass(member, NewsSpider) and getattr(member, "name", None) is not None
+
+
+def get_spider_classes() -> List[type]:
+    return [member for _, member in inspect.getmembers(sys.modules[__name__], _is_news_spider)]
+
+
+def run_crawl(spider_classes: Iterable[type] = None, *, state_dir_path: str = None, settings: dict = None,
+              spider_kwargs: Dict[str, dict] = None) -> NoReturn:
+    """
+    crawl with all the spiders at the same time in one reactor, an interrupted crawl
+    continues from its scrapy job directory when it is run again
+
+    :param spider_classes: spiders to run, every spider of this module by default
+    :param state_dir_path: where to keep the job directories and the seen urls of the spiders
+    :param settings: scrapy settings overriding SPIDER_SETTINGS
+    :param spider_kwargs: arguments of the spiders by their names, for example {"pravda_spider": {"start_url": ...}}
+
+    """
+    from scrapy.crawler import CrawlerProcess
+
+    state_dir_path = state_dir_path if state_dir_path is not None else SPIDER_STATE_DIR_PATH
+    # the given settings may override the state directory too
+    crawl_settings = dict(SPIDER_SETTINGS)
+    crawl_settings.update(NERUA_CRAWL_STATE_DIR=str(state_dir_path))
+    crawl_settings.update(settings or dict())
+    spider_kwargs = spider_kwargs or dict()
+
+    process = CrawlerProcess(crawl_settings)
+    for spider_class in spider_classes or get_spider_classes():
+        process.crawl(spider_class, **spider_kwargs.get(spider_class.name, dict()))
+
+    process.start()
 
 
 def run_spiders():
-    spider_classes = [
-        getattr(sys.modules[__name__], member[0])
-        for member in inspect.getmembers(sys.modules[__name__], _is_scrapy_spider)
-    ]
-
-    for spider_class in spider_classes:
-        process = CrawlerProcess()
-        process.crawl(spider_class)
-        process.start()
+    run_crawl()
+
+
+def main(argv: List[str] = None) -> int:
+    spider_names = [spider_class.name for spider_class in get_spider_classes()]
+
+    parser = argparse.ArgumentParser(description="Crawl the news sites")
+    parser.add_argument("--only", nargs="+", choices=spider_names, help="run only these spiders")
+    parser.add_argument("--full", action="store_true", help="follow the older news even if they were crawled")
+    parser.add_argument("--state-dir", help="where to keep the crawl state")
+    parser.add_argument("--set", nargs="+", default=[], metavar="SETTING=VALUE", help="override scrapy settings")
+    parser.add_argument("--start-url", nargs="+", default=[], metavar="SPIDER_NAME=URL",
+                        help="crawl from another url, for example from a local copy of the site")
+    args = parser.parse_args(argv)
+
+    spider_kwargs = {spider_name: {"incremental": not args.full} for spider_name in spider_names}
+    for start_url in args.start_url:
+        spider_name, _, url = start_url.partition("=")
+        if spider_name not in spider_names or not url:
+            parser.error(f"--start-url expects SPIDER_NAME=URL with one of the spiders: {', '.join(spider_names)}, "
+                         f"not {start_url}")
+        spider_kwargs[spider_name]["start_url"] = url
+
+    run_crawl(
+        [spider_class for spider_class in get_spider_classes() if not args.only or spider_class.name in args.only],
+        state_dir_path=args.state_dir,
+        settings=dict(setting.partition("=")[::2] for setting in args.set),
+        spider_kwargs=spider_kwargs
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
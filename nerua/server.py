@@ -0,0 +1,428 @@
+"""
+HTTP/JSON server tagging texts with a saved model, concurrent requests are tagged together in micro-batches
+
+usage: python -m nerua.server MODEL_ID [--host 127.0.0.1] [--port 8080] [--max-batch 64] [--max-wait-ms 5]
+                                       [--max-queue 1024] [--profile]
+
+POST /tag      {"text": "..."} or {"texts": ["...", ...]}, responds with the tokens, tags and entities of every text
+GET  /health   {"status": "ok"}
+GET  /metrics  counters of the requests and batches, with --profile also the time of every pipeline stage
+
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, NoReturn, Tuple
+
+from nerua import profiling
+
+
+class ServerOverloaded(Exception):
+    pass
+
+
+class TooManyTexts(ValueError):
+    pass
+
+
+class MicroBatcher:
+    """
+    Collects texts submitted concurrently into batches and tags every batch with one call, a batch is sent
+    when it has max_batch texts or when its first text has waited max_wait seconds
+
+    """
+    def __init__(self, predict_batch: Callable[[List[str]], List[dict]], *, max_batch: int = 64,
+                 max_wait: float = .005, max_queue: int = 1024, executor: ThreadPoolExecutor = None):
+        """
+        :param predict_batch: tags a list of texts, for example NNModel.predict_batch
+        :param max_batch: the largest number of texts tagged at once
+        :param max_wait: seconds a text may wait for others to join its batch
+        :param max_queue: number of texts waiting to be tagged before new ones are rejected,
+                          a request with more texts is never accepted
+        :param executor: where predict_batch is run, a new single thread by default
+
+        """
+        self._predict_batch = predict_batch
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._max_queue = max_queue
+
+        self._queue = None
+        self._worker = None
+        # the model is not thread safe, so the batches are tagged one by one
+        self._executor = executor or ThreadPoolExecutor(1, thread_name_prefix="nerua-batcher")
+
+        self.metrics = {
+            "requests": 0,
+            "texts": 0,
+            "rejected": 0,
+            "errors": 0,
+            "batches": 0,
+            "batched_texts": 0,
+            "max_batch_size": 0,
+            "predict_seconds": 0.,
+            "wait_seconds": 0.,
+        }
+
+    queue_size = property(lambda self: self._queue.qsize() if self._queue is not None else 0)
+
+    def start(self) -> NoReturn:
+        self._queue = asyncio.Queue(self._max_queue)
+        self._worker = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> NoReturn:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, text: str) -> dict:
+        """
+        :param text: text to tag
+        :return: the tags of the text as predict_batch returns them
+
+        """
+        return (await self.submit_many([text]))[0]
+
+    async def submit_many(self, texts: List[str]) -> List[dict]:
+        """
+        queue all the texts or, if there is not enough room for all of them, none
+
+        :param texts: texts to tag
+        :return: the tags of every text as predict_batch returns them
+        :raises TooManyTexts: if there are more texts than the queue can ever hold
+        :raises ServerOverloaded: if the queue has no room for the texts now
+
+        """
+        if len(texts) > self._max_queue:
+            self.metrics["rejected"] += 1
+            raise TooManyTexts(f"A request can have at most {self._max_queue} texts, not {len(texts)}")
+
+        if self._max_queue - self._queue.qsize() < len(texts):
+            self.metrics["rejected"] += 1
+            raise ServerOverloaded(f"More than {self._max_queue} texts would be waiting to be tagged")
+
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in texts]
+        for text, future in zip(texts, futures):
+            self._queue.put_nowait((text, future, time.perf_counter()))
+
+        self.metrics["requests"] += 1
+        self.metrics["texts"] += len(texts)
+        return list(await asyncio.gather(*futures))
+
+    async def _run(self) -> NoReturn:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+
+            deadline = loop.time() + self._max_wait
+            while len(batch) < self._max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # requests cancelled while waiting are not tagged
+            batch = [(text, future, submitted) for text, future, submitted in batch if not future.done()]
+            if batch:
+                await self._tag_batch(loop, batch)
+
+    async def _tag_batch(self, loop: asyncio.AbstractEventLoop, batch: List[Tuple[str, asyncio.Future, float]]):
+        started = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(self._executor, self._predict_batch, [text for text, _, _ in batch])
+        except Exception as error:
+            if len(batch) > 1:
+                # tag the texts one by one so that a single bad text fails only its own request
+                for item in batch:
+                    await self._tag_batch(loop, [item])
+                return
+
+            self.metrics["errors"] += 1
+            _, future, _ = batch[0]
+            if not future.done():
+                future.set_exception(error)
+            return
+
+        self.metrics["batches"] += 1
+        self.metrics["batched_texts"] += len(batch)
+        self.metrics["max_batch_size"] = max(self.metrics["max_batch_size"], len(batch))
+        self.metrics["predict_seconds"] += time.perf_counter() - started
+        self.metrics["wait_seconds"] += sum(started - submitted for _, _, submitted in batch)
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class NerServer:
+    """
+    Minimal HTTP/1.1 server on asyncio streams, it supports keep-alive connections and JSON bodies only
+
+    """
+    def __init__(self, batcher: MicroBatcher, *, host: str = "127.0.0.1", port: int = 8080,
+                 max_body_size: int = 1 << 20, max_header_count: int = 100, max_header_size: int = 1 << 16):
+        """
+        :param batcher: batcher of the tagged texts
+        :param host: address to listen on
+        :param port: port to listen on, 0 to pick a free one
+        :param max_body_size: the largest accepted request body in bytes
+        :param max_header_count: the most headers accepted in a request
+        :param max_header_size: the largest accepted size of the request line and the headers in bytes
+
+        """
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+        self._max_body_size = max_body_size
+        self._max_header_count = max_header_count
+        self._max_header_size = max_header_size
+
+        self._server = None
+        self._started = None
+        self._responses = dict()
+
+    async def start(self) -> NoReturn:
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started = time.time()
+
+    async def stop(self) -> NoReturn:
+        self._server.close()
+        await self._server.wait_closed()
+        await self.batcher.stop()
+
+    async def serve_forever(self) -> NoReturn:
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                status, response = await self._respond(method, path, body)
+                self._responses[status] = self._responses.get(status, 0) + 1
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, status, response, keep_alive)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+        except _BadRequest as error:
+            self._write_response(writer, error.status, {"error": str(error)}, False)
+            await self._discard_unread(reader, writer)
+
+        finally:
+            writer.close()
+
+    async def _discard_unread(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> NoReturn:
+        # closing a connection with unread data resets it, and the reset may drop the response before the client
+        # reads it, so the rest of the request is read for a moment after the response is sent
+        try:
+            await writer.drain()
+            writer.write_eof()
+
+            discarded = 0
+            while discarded <= self._max_body_size:
+                data = await asyncio.wait_for(reader.read(1 << 16), 1.)
+                if not data:
+                    break
+                discarded += len(data)
+
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await _read_line(reader, _BadRequest(400, "The request line is too long"))
+        if not request_line.strip():
+            return None
+
+        try:
+            method, path, _ = request_line.decode("latin-1").split()
+        except ValueError:
+            raise _BadRequest(400, "Malformed request line")
+
+        too_large = _BadRequest(
+            431, f"The headers must be at most {self._max_header_count} lines of {self._max_header_size} bytes in total"
+        )
+
+        headers, header_size = dict(), len(request_line)
+        while True:
+            line = await _read_line(reader, too_large)
+            if line in (b"\r\n", b"\n", b""):
+                break
+
+            header_size += len(line)
+            if len(headers) >= self._max_header_count or header_size > self._max_header_size:
+                raise too_large
+
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        content_length = headers.get("content-length") or "0"
+        if not (content_length.isascii() and content_length.isdigit()):
+            raise _BadRequest(400, f"Invalid Content-Length: {content_length}")
+
+        body_size = int(content_length)
+        if body_size > self._max_body_size:
+            raise _BadRequest(413, f"The request body is larger than {self._max_body_size} bytes")
+
+        body = await reader.readexactly(body_size) if body_size else b""
+        return method, path.partition("?")[0], headers, body
+
+    async def _respond(self, method: str, path: str, body: bytes) -> Tuple[int, dict]:
+        if path == "/health":
+            return (200, {"status": "ok"}) if method == "GET" else (405, {"error": "Use GET"})
+
+        if path == "/metrics":
+            return (200, self.metrics()) if method == "GET" else (405, {"error": "Use GET"})
+
+        if path != "/tag":
+            return 404, {"error": f"Unknown path: {path}"}
+
+        if method != "POST":
+            return 405, {"error": "Use POST"}
+
+        try:
+            request = json.loads(body.decode("utf-8"))
+        except ValueError:
+            return 400, {"error": "The body must be a JSON object"}
+
+        single = isinstance(request, dict) and isinstance(request.get("text"), str)
+        texts = [request["text"]] if single else request.get("texts") if isinstance(request, dict) else None
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            return 400, {"error": "Expected {\"text\": string} or {\"texts\": [string, ...]}"}
+
+        try:
+            results = await self.batcher.submit_many(texts)
+        except TooManyTexts as error:
+            return 413, {"error": str(error)}
+        except ServerOverloaded as error:
+            return 503, {"error": str(error)}
+        except Exception as error:
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+
+        return 200, results[0] if single else {"results": results}
+
+    def metrics(self) -> dict:
+        metrics = dict(self.batcher.metrics)
+        metrics.update({
+            "queue_size": self.batcher.queue_size,
+            "mean_batch_size": metrics["batched_texts"] / metrics["batches"] if metrics["batches"] else 0.,
+            "uptime_seconds": time.time() - self._started if self._started else 0.,
+            "responses": {str(status): count for status, count in sorted(self._responses.items())},
+        })
+
+        profiler = profiling.get_profiler()
+        if profiler is not None:
+            metrics["profile"] = profiler.to_json()
+
+        return metrics
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, response: dict, keep_alive: bool) -> NoReturn:
+        body = json.dumps(response, ensure_ascii=False).encode("utf-8")
+        headers = [
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            headers.append("Retry-After: 1")
+
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+
+
+async def _read_line(reader: asyncio.StreamReader, too_long: Exception) -> bytes:
+    """
+    :param reader: the stream of the connection
+    :param too_long: raised if the line is longer than the limit of the stream
+    :return: the line with its end
+
+    """
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise too_long
+
+
+class _BadRequest(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+_REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve a saved nerua model over HTTP")
+    parser.add_argument("model_id", help="id returned by NNModel.save")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=64, help="the largest number of texts tagged at once")
+    parser.add_argument("--max-wait-ms", type=float, default=5., help="time a text waits for others to join")
+    parser.add_argument("--max-queue", type=int, default=1024, help="waiting texts before requests get 503")
+    parser.add_argument("--profile", action="store_true", help="report the time of every pipeline stage in /metrics")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        profiling.enable()
+
+    from nerua.model import NNModel
+
+    # keras models are bound to the thread they are loaded on, so the model is loaded on the thread that runs it
+    executor = ThreadPoolExecutor(1, thread_name_prefix="nerua-batcher")
+    model = executor.submit(NNModel, model_id=args.model_id).result()
+
+    # the abbreviations and the vocabulary are read now instead of by the first request
+    model.lang.warmup()
+
+    batcher = MicroBatcher(
+        model.predict_batch, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1e3, max_queue=args.max_queue,
+        executor=executor
+    )
+    server = NerServer(batcher, host=args.host, port=args.port)
+
+    print(f"serving model {args.model_id} on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
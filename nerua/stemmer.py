@@ -1,61 +1,252 @@
 import re
+import json
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, NoReturn, Tuple
+
+from nerua import profiling
+from nerua.lang.language import Language, Ukrainian, get_language
+
+
+class SuffixTrie:
+    """
+    Trie over reversed suffixes: the longest matching ending is found in one walk from the end of the word
+
+    """
+    def __init__(self, suffixes: Iterable[str]):
+        self._root = dict()
+
+        for suffix in suffixes:
+            node = self._root
+            for char in reversed(suffix):
+                node = node.setdefault(char, dict())
+            node[None] = len(suffix)
+
+    def longest_match(self, word: str) -> int:
+        """
+        :param word: the word to look the ending up in
+        :return: length of the longest suffix of the word found in the trie, 0 if there is none
+
+        """
+        node, length = self._root, 0
+
+        for char in reversed(word):
+            node = node.get(char)
+            if node is None:
+                break
+
+            length = node.get(None, length)
+
+        return length
+
+    def strip(self, word: str) -> str:
+        length = self.longest_match(word)
+        return word[:-length] if length else word
+
+
+class UkrainianStemmer:
+    def __init__(self, lang: Ukrainian = None, *, cache_size: int = 100000):
+        if lang is None:
+            lang = get_language("ua")
+
+        elif not isinstance(lang, Ukrainian):
+            raise TypeError(f"The 'lang' variable must be a 'Ukrainian' object, not {type(lang).__name__}")
+
+        vowels = lang.vowels
+
+        self._first_vowel = re.compile(fr"[{vowels}]")
+        self._perfective = SuffixTrie(lang.perfective)
+        self._reflexive = SuffixTrie(lang.reflexive)
+        self._adjective = SuffixTrie(lang.adjective)
+        self._participle = SuffixTrie(lang.participle)
+        self._verb = SuffixTrie(lang.verb)
+        self._noun = SuffixTrie(lang.noun)
+        self._derivational = re.compile(fr"[^{vowels}][{vowels}]+[^{vowels}]+[{vowels}].*(?<=о)сть?$")
+
+        # the cache is shared by the threads tagging at the same time, the stems are computed outside of the lock
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def stem(self, word: str, *, to_lower: bool = True) -> str:
+        return self._stem_cached(word, to_lower)[0]
 
-from nerua.lang.language import Language, Ukrainian
+    def stem_many(self, words: Iterable[str], *, to_lower: bool = True, cache_counts: dict = None) -> List[str]:
+        """
+        :param words: words to stem
+        :param to_lower: lowercase the words first
+        :param cache_counts: if given, the "hits" and "misses" of the cache in this call are added to it,
+                             unlike the totals of cache_info they do not include the calls of other threads
+        :return: the stems of the words
 
+        """
+        stems, hits = list(), 0
+        for word in words:
+            stem, hit = self._stem_cached(word, to_lower)
+            stems.append(stem)
+            hits += hit
 
-def stem_word(word: str, lang: Language, *, to_lower: bool = True):
-    if isinstance(lang, Ukrainian):
-        return stem_ukr_word(word, to_lower=to_lower)
+        if cache_counts is not None:
+            cache_counts["hits"] = cache_counts.get("hits", 0) + hits
+            cache_counts["misses"] = cache_counts.get("misses", 0) + len(stems) - hits
 
-    raise TypeError
+        return stems
 
+    def cache_info(self) -> dict:
+        with self._cache_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._cache),
+                "max_size": self._cache_size
+            }
 
-def stem_ukr_word(word: str, *, to_lower: bool = True) -> str:
-    lang = Ukrainian()
+    def clear_cache(self) -> NoReturn:
+        with self._cache_lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def save(self, path: str) -> NoReturn:
+        """
+        dump the word -> stem table, least recently used words first
+
+        :param path: path of the json file to write
+
+        """
+        with self._cache_lock:
+            stem_table = dict(self._cache)
+
+        with open(path, 'w') as file:
+            json.dump(stem_table, file, ensure_ascii=False)
 
-    if not isinstance(word, str):
-        raise TypeError("word must have string type")
+    def load(self, path: str) -> NoReturn:
+        """
+        warm the cache up with a table previously written by save
 
-    if to_lower:
-        word = word.lower()
+        :param path: path of the json file to read
 
-    match = re.search(fr"[{lang.vowels}]", word)
-    if match is None:
-        return word
+        """
+        with open(path, 'r') as file:
+            stem_table = json.load(file)
 
-    first_word_part, buffer = word[:match.span()[1]], word[match.span()[1]:]
+        with self._cache_lock:
+            for word, stem in list(stem_table.items())[-self._cache_size:]:
+                self._cache[word] = stem
+                self._cache.move_to_end(word)
 
-    # Step 1
-    buffer1 = buffer
-    buffer = re.sub(lang.perfective, '', buffer)
-    if buffer1 == buffer:
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _stem_cached(self, word: str, to_lower: bool) -> Tuple[str, bool]:
+        if not isinstance(word, str):
+            raise TypeError("word must have string type")
+
+        if to_lower:
+            word = word.lower()
+
+        with self._cache_lock:
+            stem = self._cache.get(word)
+            if stem is not None:
+                self._cache.move_to_end(word)
+                self.hits += 1
+                return stem, True
+
+            self.misses += 1
+
+        stem = self._stem(word)
+
+        with self._cache_lock:
+            self._cache[word] = stem
+            self._cache.move_to_end(word)
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+        return stem, False
+
+    def _stem(self, word: str) -> str:
+        match = self._first_vowel.search(word)
+        if match is None:
+            return word
+
+        first_word_part, buffer = word[:match.span()[1]], word[match.span()[1]:]
 
-        buffer = re.sub(lang.reflexive, '', buffer)
+        # Step 1
+        length = self._perfective.longest_match(buffer)
+        if length:
+            buffer = buffer[:-length]
 
-        buffer1 = buffer
-        buffer = re.sub(lang.adjective, '', buffer)
-        if buffer1 == buffer:
-
-            buffer1 = buffer
-            buffer = re.sub(lang.verb, '', buffer)
-            if buffer1 == buffer:
-                buffer = re.sub(lang.noun, '', buffer)
         else:
-            buffer = re.sub(lang.participle, '', buffer)
+            buffer = self._reflexive.strip(buffer)
+
+            length = self._adjective.longest_match(buffer)
+            if length:
+                buffer = self._participle.strip(buffer[:-length])
+
+            else:
+                length = self._verb.longest_match(buffer)
+                buffer = buffer[:-length] if length else self._noun.strip(buffer)
+
+        # Step 2
+        if buffer.endswith('и'):
+            buffer = buffer[:-1]
+
+        # Step 3
+        if self._derivational.search(buffer) and buffer.endswith('ость'):
+            buffer = buffer[:-4]
+
+        # Step 4
+        if buffer.endswith('ь'):
+            buffer = buffer[:-1]
+
+            if buffer.endswith('ейше'):
+                buffer = buffer[:-4]
+            elif buffer.endswith('ейш'):
+                buffer = buffer[:-3]
+
+            if buffer.endswith('нн'):
+                buffer = buffer[:-1]
+
+        return first_word_part + buffer
+
+
+_ukrainian_stemmer = None
+_ukrainian_stemmer_lock = threading.Lock()
+
 
-    # Step 2
-    buffer = re.sub(r'и$', '', buffer)
+def get_ukrainian_stemmer() -> UkrainianStemmer:
+    global _ukrainian_stemmer
 
-    # Step 3
-    vowels = lang.vowels
-    if re.search(fr"[^{vowels}][{vowels}]+[^{vowels}]+[{vowels}].*(?<=о)сть?$", buffer):
-        buffer = re.sub(r'ость$', '', buffer)
+    if _ukrainian_stemmer is None:
+        with _ukrainian_stemmer_lock:
+            if _ukrainian_stemmer is None:
+                _ukrainian_stemmer = UkrainianStemmer()
 
-    # Step 4
-    buffer1 = buffer
-    buffer = re.sub(r"ь$", '', buffer)
-    if buffer1 != buffer:
-        buffer = re.sub(r'ейше?$', '', buffer)
-        buffer = re.sub(r'нн$', u'н', buffer)
+    return _ukrainian_stemmer
 
-    return first_word_part + buffer
+
+def stem_word(word: str, lang: Language, *, to_lower: bool = True):
+    if isinstance(lang, Ukrainian):
+        return stem_ukr_word(word, to_lower=to_lower)
+
+    raise TypeError
+
+
+def stem_many(words: Iterable[str], lang: Language, *, to_lower: bool = True) -> List[str]:
+    if isinstance(lang, Ukrainian):
+        cache_counts = {"hits": 0, "misses": 0}
+
+        with profiling.stage("stem") as stage:
+            stems = get_ukrainian_stemmer().stem_many(words, to_lower=to_lower, cache_counts=cache_counts)
+            stage.add_items(len(stems))
+
+        profiling.count("stemmer_cache", **cache_counts)
+        return stems
+
+    raise TypeError
+
+
+def stem_ukr_word(word: str, *, to_lower: bool = True) -> str:
+    return get_ukrainian_stemmer().stem(word, to_lower=to_lower)
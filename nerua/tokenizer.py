@@ -1,9 +1,15 @@
+import os
 import re
 import six
-from typing import List
+from itertools import chain
+from typing import Iterable, Iterator, List, TextIO, Tuple, Union
+from nerua import profiling
 from nerua.lang.language import Language
 
 
+_NON_SPACE = re.compile(r'\S+')
+
+
 def tokenize_text(text: str, lang: Language):
     """
     tokenize input text to sentences
@@ -14,28 +20,123 @@ def tokenize_text(text: str, lang: Language):
 
     """
     text = six.text_type(text)
+    with profiling.stage("tokenize", items=1):
+        return [tokenize_sentence(text[start:end], lang) for start, end in iter_sentence_spans(text)]
+
+
+def tokenize_text_with_offsets(text: str, lang: Language) -> List[List[Tuple[str, int, int]]]:
+    """
+    tokenize input text to sentences keeping the position of every token
+
+    :param text: input text to tokenize
+    :param lang: the main language used in the text
+    :return: list of sentences, each one is a list of (token, start, end) with character offsets in the text
+
+    """
+    text = six.text_type(text)
+    with profiling.stage("tokenize", items=1):
+        return [
+            [
+                (match.group(), match.start(), match.end())
+                for match in lang.word_tokenization_rules.finditer(text, start, end)
+            ]
+            for start, end in iter_sentence_spans(text)
+        ]
+
+
+def iter_tokens(text_or_stream: Union[str, os.PathLike, TextIO], lang: Language, *,
+                chunk_size: int = 65536) -> Iterator[Tuple[int, str, int, int]]:
+    """
+    tokenize text in one pass, a file or stream is read incrementally so only the current sentence is kept in memory
+
+    :param text_or_stream: text, path to a text file or text stream to tokenize
+    :param lang: the main language used in the text
+    :param chunk_size: number of characters read from a file or stream at once
+    :return: generator of (sentence_id, token, start, end), start and end are character offsets in the whole text
+
+    """
+    if isinstance(text_or_stream, os.PathLike):
+        with open(text_or_stream, 'r') as file:
+            yield from iter_tokens(file, lang, chunk_size=chunk_size)
+        return
+
+    if hasattr(text_or_stream, "read"):
+        chunks = _read_chunks(text_or_stream, chunk_size)
+    else:
+        chunks = (six.text_type(text_or_stream),)
+
+    for sentence_id, (sentence_start, sentence) in enumerate(_iter_sentences(chunks)):
+        for match in lang.word_tokenization_rules.finditer(sentence):
+            yield sentence_id, match.group(), sentence_start + match.start(), sentence_start + match.end()
+
+
+def iter_sentence_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """
+    :param text: input text to split
+    :return: generator of (start, end) character offsets of the sentences
+
+    """
+    for sentence_start, sentence in _iter_sentences((text,)):
+        yield sentence_start, sentence_start + len(sentence)
+
+
+def _iter_sentences(chunks: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    """
+    split text given in chunks to sentences: a sentence ends with a word ending with a dot
+    if the next word starts with a capital letter and the dot does not follow a capital letter or a bracket
+
+    :param chunks: consecutive parts of the text
+    :return: generator of (start, sentence) with the character offset of the sentence in the whole text
+
+    """
+    buffer, buffer_start = "", 0
+    cursor, scan_from, previous_span = 0, 0, None
+
+    for chunk in chain(chunks, (None,)):
+        is_last_chunk = chunk is None
+        if not is_last_chunk:
+            buffer += chunk
+
+        for span in _NON_SPACE.finditer(buffer, scan_from):
+            # a word touching the end of the buffer can continue in the next chunk
+            if span.end() == len(buffer) and not is_last_chunk:
+                break
+
+            if previous_span is not None and _is_sentence_end(buffer[slice(*previous_span)], buffer[span.start()]):
+                yield buffer_start + cursor, buffer[cursor:previous_span[1]]
+                cursor = span.start()
+
+            previous_span, scan_from = span.span(), span.end()
+
+        if is_last_chunk and previous_span is not None:
+            yield buffer_start + cursor, buffer[cursor:previous_span[1]]
+
+        # keep only the current sentence in the buffer
+        buffer, buffer_start = buffer[cursor:], buffer_start + cursor
+        scan_from -= cursor
+        if previous_span is not None:
+            previous_span = previous_span[0] - cursor, previous_span[1] - cursor
+        cursor = 0
+
 
-    spans = [match for match in re.finditer(r'\S+', text)]
-    spans_count = len(spans)
+def _is_sentence_end(token: str, next_token_first_char: str) -> bool:
+    if token[-1] not in ['.', '!', '?', '…', '»']:
+        return False
 
-    tokenized_text = list()
+    tmp = token[re.search('[.!?…»]', token).start() - 1]
+    return next_token_first_char.isupper() and not tmp.isupper() and not (token[-1] != '.' or tmp[0] == '(')
 
-    cursor = 0
-    for span_index, span in enumerate(spans):
-        if span_index == spans_count - 1:
-            tokenized_text.append(text[cursor:span.end()])
 
-        elif text[span.end()-1] in ['.', '!', '?', '…', '»']:
-            next_span = spans[span_index + 1]
-            token = text[span.start():span.end()]
-            tmp = token[re.search('[.!?…»]', token).start() - 1]
-            next_tok = text[next_span.start():next_span.end()]
+def _read_chunks(stream: TextIO, chunk_size: int) -> Iterator[str]:
+    while True:
+        chunk = stream.read(chunk_size)
+        if not isinstance(chunk, str):
+            raise TypeError(f"The stream must be opened in text mode, it returned {type(chunk).__name__}")
 
-            if next_tok[0].isupper() and not tmp.isupper() and not (token[-1] != '.' or tmp[0] == '('):
-                tokenized_text.append(text[cursor:span.end()])
-                cursor = next_span.start()
+        if not chunk:
+            return
 
-    return [tokenize_sentence(sentence, lang) for sentence in tokenized_text]
+        yield chunk
 
 
 def tokenize_sentence(text: str, lang: Language) -> List[str]:
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from nerua.engine import EXPORT_FORMAT_VERSION, NumpyNERModel
+
+TAGS = ["B-PER", "I-PER", "B-LOC", "I-LOC", "O"]
+
+
+def make_numpy_model(*, vocab_size: int = 50, embedding_size: int = 8, seed: int = 0,
+                     max_words_count_in_sentence: int = None) -> NumpyNERModel:
+    """
+    numpy engine with random weights in the shape NNModel.create builds, small enough for the tests
+
+    """
+    random_state = np.random.RandomState(seed)
+
+    def lstm(input_size, units):
+        return {
+            "kernel": random_state.normal(0., .5, (input_size, 4 * units)),
+            "recurrent_kernel": random_state.normal(0., .5, (units, 4 * units)),
+            "bias": random_state.normal(0., .1, 4 * units),
+        }
+
+    lstm_config = {"activation": "tanh", "recurrent_activation": "hard_sigmoid"}
+    layers = [
+        ("embedding", {"embeddings": random_state.normal(0., 1., (vocab_size, embedding_size))}, {}),
+        ("bidirectional_lstm", dict(
+            **{f"forward_{name}": weight for name, weight in lstm(embedding_size, embedding_size).items()},
+            **{f"backward_{name}": weight for name, weight in lstm(embedding_size, embedding_size).items()}
+        ), lstm_config),
+        ("lstm", lstm(2 * embedding_size, 2 * embedding_size), lstm_config),
+        ("dense", {
+            "kernel": random_state.normal(0., 1., (2 * embedding_size, len(TAGS))), "bias": np.zeros(len(TAGS))
+        }, {"activation": "relu"}),
+        ("crf", {
+            "kernel": random_state.normal(0., 1., (len(TAGS), len(TAGS))),
+            "chain_kernel": random_state.normal(0., 1., (len(TAGS), len(TAGS))),
+            "bias": random_state.normal(0., .1, len(TAGS)),
+            "left_boundary": random_state.normal(0., .1, len(TAGS)),
+            "right_boundary": random_state.normal(0., .1, len(TAGS)),
+        }, {"activation": "linear"}),
+    ]
+
+    meta = {
+        "format": EXPORT_FORMAT_VERSION, "lang": "Ukrainian", "tags": TAGS, "stem_words": True,
+        "max_words_count_in_sentence": max_words_count_in_sentence, "input_length": None, "layers": list()
+    }
+    weights = dict()
+    for layer_id, (layer_type, layer_weights, config) in enumerate(layers):
+        meta["layers"].append(dict(config, type=layer_type, weights=[f"{layer_id}_{name}" for name in layer_weights]))
+        weights.update({f"{layer_id}_{name}": weight.astype(np.float32) for name, weight in layer_weights.items()})
+
+    return NumpyNERModel(meta, weights)
+
+
+@pytest.fixture
+def numpy_model() -> NumpyNERModel:
+    return make_numpy_model()
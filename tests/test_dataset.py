@@ -0,0 +1,110 @@
+import os
+import csv
+import gzip
+import json
+import multiprocessing
+
+import pytest
+
+from nerua.dataset import EncodedCorpus, _file_hash, load_encoded_corpus
+from nerua.lang.language import get_language
+from nerua.preprocess import TRAIN_DATA_COLUMNS, _write_columnar_train_data
+
+TAGS = ["O", "B-PER", "I-PER", "B-LOC"]
+
+ROWS = [
+    (0, "Тарас", "B-PER"), (0, "Шевченко", "I-PER"), (0, "жив", "O"),
+    (1, "у", "O"), (1, "Києві", "B-LOC"),
+    (2, "так", "O"),
+]
+
+
+def write_train_data(path, rows, output_format: str):
+    if output_format in ("csv", "csv.gz"):
+        csv_file = gzip.open(path, "wt", newline="") if output_format == "csv.gz" else open(path, "w", newline="")
+        with csv_file:
+            writer = csv.writer(csv_file, lineterminator="\n")
+            writer.writerow(("",) + TRAIN_DATA_COLUMNS)
+            writer.writerows((row_id,) + row for row_id, row in enumerate(rows))
+    else:
+        _write_columnar_train_data(iter(rows), str(path), output_format, chunk_size=4)
+
+    return str(path)
+
+
+@pytest.mark.parametrize("output_format, extension", [
+    ("csv", ".csv"), ("csv.gz", ".csv.gz"), ("parquet", ".parquet"), ("arrow", ".arrow")
+])
+def test_from_csv_reads_every_train_data_format(tmp_path, output_format, extension):
+    if output_format in ("parquet", "arrow"):
+        pytest.importorskip("pyarrow")
+
+    path = write_train_data(tmp_path / f"train{extension}", ROWS, output_format)
+    corpus = EncodedCorpus.from_csv(path, get_language("Ukrainian"), TAGS, stem_words=False)
+
+    assert len(corpus) == 3
+    assert corpus.offsets.tolist() == [0, 3, 5, 6]
+    assert corpus.tag_ids.tolist() == [TAGS.index(tag) for _, _, tag in ROWS]
+
+
+def test_from_csv_rejects_articles_split_across_the_file(tmp_path):
+    path = write_train_data(tmp_path / "train.csv", ROWS + [(0, "ще", "O")], "csv")
+
+    with pytest.raises(ValueError, match="not consecutive"):
+        EncodedCorpus.from_csv(path, get_language("Ukrainian"), TAGS, stem_words=False)
+
+
+def cached_corpora(cache_dir: str) -> set:
+    return {name for name in os.listdir(cache_dir) if os.path.isdir(os.path.join(cache_dir, name))}
+
+
+def test_cached_corpora_of_other_files_are_kept(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    lang = get_language("Ukrainian")
+
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    paths = [
+        write_train_data(tmp_path / "a" / "train.csv", ROWS, "csv"),
+        write_train_data(tmp_path / "b" / "train.csv", ROWS[:3], "csv"),
+        write_train_data(tmp_path / "a" / "train.csv.gz", ROWS[3:], "csv.gz"),
+    ]
+    for path in paths:
+        load_encoded_corpus(path, lang, TAGS, stem_words=False, cache_dir=cache_dir)
+
+    cached = cached_corpora(cache_dir)
+    assert len(cached) == 3
+
+    # a new version of the first file replaces only its own cache
+    write_train_data(tmp_path / "a" / "train.csv", ROWS[:5], "csv")
+    corpus = load_encoded_corpus(paths[0], lang, TAGS, stem_words=False, cache_dir=cache_dir)
+
+    assert len(corpus) == 2
+    assert len(cached_corpora(cache_dir)) == 3
+    assert len(cached & cached_corpora(cache_dir)) == 2
+
+
+def hash_files(paths, cache_dir):
+    for path in paths:
+        _file_hash(path, cache_dir)
+
+
+def test_file_hashes_of_concurrent_processes_are_kept(tmp_path):
+    paths = list()
+    for index in range(40):
+        paths.append(str(tmp_path / f"train_{index}.csv"))
+        with open(paths[-1], 'w') as file:
+            file.write(f"article_id,word,tag\n{index},слово,O\n")
+
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=hash_files, args=(paths[index::4], str(tmp_path / "cache"))) for index in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert [process.exitcode for process in processes] == [0] * 4
+    with open(tmp_path / "cache" / "file_hashes.json") as hashes_file:
+        assert len(json.load(hashes_file)) == 40
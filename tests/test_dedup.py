@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from nerua.lang.language import get_language
+from nerua.scraping.dedup import DedupIndex, deduplicate_articles_jsonl
+from nerua.scraping.preprocess import write_articles_jsonl
+
+
+def article(number: int) -> str:
+    return " ".join(f"слово{number}_{i}" for i in range(50))
+
+
+def failing_articles(count: int, fail_after: int):
+    for number in range(count):
+        if number == fail_after:
+            raise OSError("disk full")
+        yield article(number)
+
+
+def read_articles(path) -> list:
+    with open(path) as jsonl_file:
+        return [json.loads(line)["article"] for line in jsonl_file if line.strip()]
+
+
+def test_filter_drops_repeated_articles(tmp_path):
+    with DedupIndex(str(tmp_path / "index.sqlite"), get_language("Ukrainian")) as index:
+        with index.transaction():
+            kept = list(index.filter([article(0), article(1), article(0)]))
+
+    assert kept == [article(0), article(1)]
+    assert index.stats == {"articles": 3, "kept": 2, "duplicates": 1}
+
+
+def test_failed_write_does_not_remember_articles(tmp_path):
+    index_path, output_path = str(tmp_path / "index.sqlite"), tmp_path / "articles.jsonl"
+
+    with DedupIndex(index_path, get_language("Ukrainian"), commit_every=2) as index:
+        with pytest.raises(OSError):
+            write_articles_jsonl(str(output_path), failing_articles(10, fail_after=5), index)
+
+    assert not output_path.exists()
+    assert not (tmp_path / "articles.jsonl.part").exists()
+
+    with DedupIndex(index_path, get_language("Ukrainian"), commit_every=2) as index:
+        write_articles_jsonl(str(output_path), failing_articles(10, fail_after=10), index)
+        assert len(index) == 10
+
+    assert read_articles(output_path) == [article(number) for number in range(10)]
+
+
+def test_deduplicate_articles_jsonl_against_previous_runs(tmp_path):
+    index_path = str(tmp_path / "index.sqlite")
+    write_articles_jsonl(str(tmp_path / "first.jsonl"), [article(0), article(1)])
+    write_articles_jsonl(str(tmp_path / "second.jsonl"), [article(1), article(2)])
+
+    with DedupIndex(index_path, get_language("Ukrainian")) as index:
+        deduplicate_articles_jsonl(str(tmp_path / "first.jsonl"), str(tmp_path / "first_kept.jsonl"), index)
+
+    with DedupIndex(index_path, get_language("Ukrainian")) as index:
+        stats = deduplicate_articles_jsonl(str(tmp_path / "second.jsonl"), str(tmp_path / "second_kept.jsonl"), index)
+
+    assert stats == {"articles": 2, "kept": 1, "duplicates": 1}
+    assert read_articles(tmp_path / "second_kept.jsonl") == [article(2)]
@@ -0,0 +1,147 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from nerua.engine import NumpyNERModel, QuantizedMatrix, _hard_sigmoid, _lstm, _quantize, viterbi_decode
+
+LSTM_CONFIG = {"activation": "tanh", "recurrent_activation": "hard_sigmoid"}
+
+
+def path_energy(energy: np.ndarray, chain_kernel: np.ndarray, path) -> float:
+    return sum(energy[step, tag] for step, tag in enumerate(path)) + sum(
+        chain_kernel[previous, tag] for previous, tag in zip(path, path[1:])
+    )
+
+
+def brute_force_decode(energy: np.ndarray, chain_kernel: np.ndarray) -> list:
+    """
+    the decoding of keras_contrib CRF without a mask: the last tag is taken as the best predecessor of the best
+    last tag of the paths followed by a tag with id 0, the other tags are the best path ending with it
+
+    """
+    time_steps, tag_count = energy.shape
+    paths = list(itertools.product(range(tag_count), repeat=time_steps))
+
+    def best_last_tag(next_tag: int) -> int:
+        return min(
+            paths, key=lambda path: path_energy(energy, chain_kernel, path) + chain_kernel[path[-1], next_tag]
+        )[-1]
+
+    last_tag = best_last_tag(best_last_tag(0))
+    return list(min(
+        (path for path in paths if path[-1] == last_tag), key=lambda path: path_energy(energy, chain_kernel, path)
+    ))
+
+
+def reference_lstm_step(x, hidden, cell, kernel, recurrent_kernel, bias):
+    # the gates are in the i, f, c, o order of keras
+    input_gate, forget_gate, candidate, output_gate = (
+        x @ gate_kernel + hidden @ gate_recurrent_kernel + gate_bias
+        for gate_kernel, gate_recurrent_kernel, gate_bias in zip(
+            np.split(kernel, 4, axis=1), np.split(recurrent_kernel, 4, axis=1), np.split(bias, 4)
+        )
+    )
+
+    cell = _hard_sigmoid(forget_gate) * cell + _hard_sigmoid(input_gate) * np.tanh(candidate)
+    return _hard_sigmoid(output_gate) * np.tanh(cell), cell
+
+
+def lstm_weights(random_state, features: int, units: int) -> dict:
+    return {
+        "kernel": random_state.randn(features, 4 * units).astype(np.float32),
+        "recurrent_kernel": random_state.randn(units, 4 * units).astype(np.float32),
+        "bias": random_state.randn(4 * units).astype(np.float32),
+    }
+
+
+@pytest.mark.parametrize("time_steps", [1, 2, 3, 5])
+def test_viterbi_decode_matches_brute_force(time_steps):
+    random_state = np.random.RandomState(time_steps)
+    energy = random_state.randn(4, time_steps, 3).astype(np.float32)
+    chain_kernel = random_state.randn(3, 3).astype(np.float32)
+
+    assert viterbi_decode(energy, chain_kernel).tolist() == [
+        brute_force_decode(sentence_energy, chain_kernel) for sentence_energy in energy
+    ]
+
+
+def test_viterbi_decode_of_empty_batch():
+    assert viterbi_decode(np.zeros((2, 0, 3), dtype=np.float32), np.zeros((3, 3))).shape == (2, 0)
+
+
+def test_lstm_matches_reference_steps():
+    random_state = np.random.RandomState(0)
+    inputs = random_state.randn(3, 7, 4).astype(np.float32)
+    weights = lstm_weights(random_state, 4, 5)
+
+    outputs = _lstm(inputs, weights, LSTM_CONFIG)
+
+    for sequence, sequence_outputs in zip(inputs, outputs):
+        hidden, cell = np.zeros(5, dtype=np.float32), np.zeros(5, dtype=np.float32)
+        for x, output in zip(sequence, sequence_outputs):
+            hidden, cell = reference_lstm_step(x, hidden, cell, **weights)
+            np.testing.assert_allclose(output, hidden, atol=1e-5)
+
+
+def test_lstm_matches_keras():
+    keras = pytest.importorskip("keras")
+
+    random_state = np.random.RandomState(1)
+    inputs = random_state.randn(2, 6, 4).astype(np.float32)
+    weights = lstm_weights(random_state, 4, 3)
+
+    layer_input = keras.layers.Input(shape=(None, 4))
+    layer = keras.layers.LSTM(3, return_sequences=True, **LSTM_CONFIG)
+    model = keras.models.Model(layer_input, layer(layer_input))
+    layer.set_weights([weights["kernel"], weights["recurrent_kernel"], weights["bias"]])
+
+    np.testing.assert_allclose(_lstm(inputs, weights, LSTM_CONFIG), model.predict(inputs), atol=1e-4)
+
+
+def test_viterbi_decode_matches_keras_contrib():
+    keras = pytest.importorskip("keras")
+    crf_module = pytest.importorskip("keras_contrib.layers")
+
+    random_state = np.random.RandomState(2)
+    inputs = random_state.randn(3, 5, 4).astype(np.float32)
+    kernel, chain_kernel = random_state.randn(4, 3).astype(np.float32), random_state.randn(3, 3).astype(np.float32)
+
+    layer_input = keras.layers.Input(shape=(None, 4))
+    crf = crf_module.CRF(3, use_bias=False, use_boundary=False)
+    model = keras.models.Model(layer_input, crf(layer_input))
+    crf.set_weights([kernel, chain_kernel])
+
+    expected = model.predict(inputs).argmax(axis=-1)
+    np.testing.assert_array_equal(viterbi_decode(inputs @ kernel, chain_kernel), expected)
+
+
+def test_int8_quantization_error_is_within_half_a_step():
+    weight = np.random.RandomState(3).normal(0., 1., (20, 30)).astype(np.float32)
+    weight[4] = 0.
+
+    values, scales = _quantize(weight, "int8")
+    dequantized = QuantizedMatrix(values, scales).dequantize()
+
+    assert values.dtype == np.int8
+    assert np.all(np.abs(dequantized - weight) <= scales[:, None] / 2 + 1e-6)
+    assert not dequantized[4].any()
+
+
+def test_float16_quantization_error_is_within_its_precision():
+    weight = np.random.RandomState(4).normal(0., 1., (20, 30)).astype(np.float32)
+
+    values, scales = _quantize(weight, "float16")
+
+    assert scales is None
+    np.testing.assert_allclose(QuantizedMatrix(values).dequantize(), weight, rtol=2 ** -11)
+
+
+@pytest.mark.parametrize("quantize, atol", [("float16", 1e-2), ("int8", 1e-1)])
+def test_quantized_model_tags_like_the_float32_model(numpy_model, tmp_path, quantize, atol):
+    quantized = NumpyNERModel.load(numpy_model.save(str(tmp_path / quantize), quantize=quantize))
+    input_data = np.random.RandomState(5).randint(0, 50, (6, 12))
+
+    assert isinstance(quantized._weights["0_embeddings"], QuantizedMatrix)
+    np.testing.assert_allclose(quantized.hidden_states(input_data), numpy_model.hidden_states(input_data), atol=atol)
+    np.testing.assert_array_equal(quantized._predict_padded(input_data), numpy_model._predict_padded(input_data))
@@ -0,0 +1,51 @@
+import sys
+import subprocess
+
+import pytest
+
+# records the attempts to import the heavy packages, so the test fails even where they are not installed
+IMPORT_CHECK = """
+import sys
+
+HEAVY_PACKAGES = {heavy_packages!r}
+
+class HeavyImportRecorder:
+    attempts = []
+
+    def find_spec(self, name, path=None, target=None):
+        if name.partition(".")[0] in HEAVY_PACKAGES:
+            self.attempts.append(name)
+
+sys.meta_path.insert(0, HeavyImportRecorder())
+import {module}
+loaded = [name for name in sys.modules if name.partition(".")[0] in HEAVY_PACKAGES]
+print(" ".join(HeavyImportRecorder.attempts + loaded))
+"""
+
+KERAS = ("keras", "tensorflow")
+
+# the packages needed only to train, to crawl or to read the older training data
+NOT_NEEDED_TO_TAG = KERAS + ("pandas", "scrapy", "selenium")
+
+
+def imported_heavy_packages(module: str, heavy_packages) -> list:
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_CHECK.format(module=module, heavy_packages=tuple(heavy_packages))],
+        check=True, capture_output=True, text=True
+    )
+
+    return result.stdout.split()
+
+
+@pytest.mark.parametrize("module", ["nerua", "nerua.model", "nerua.dataset"])
+def test_import_does_not_load_keras(module):
+    assert imported_heavy_packages(module, KERAS) == []
+
+
+@pytest.mark.parametrize("module", ["nerua.tokenizer", "nerua.stemmer", "nerua.preprocess", "nerua.lang.vocabulary"])
+def test_import_does_not_load_the_training_and_crawling_packages(module):
+    assert imported_heavy_packages(module, NOT_NEEDED_TO_TAG) == []
+
+
+def test_scraping_preprocess_does_not_load_selenium():
+    assert imported_heavy_packages("nerua.scraping.preprocess", ("selenium",)) == []
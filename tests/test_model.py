@@ -0,0 +1,124 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from nerua.engine import NumpyNERModel, crf_marginals
+from nerua.model import _merge_windows, _split_into_windows
+
+
+def context_free_model(numpy_model: NumpyNERModel) -> NumpyNERModel:
+    """
+    the model without its LSTM layers and with a zero chain kernel, the tag of a token depends only on the token
+    so tagging in windows must give the tags of the whole sentences
+
+    """
+    meta = dict(numpy_model._meta, layers=[
+        layer for layer in numpy_model._meta["layers"] if layer["type"] in ("embedding", "dense", "crf")
+    ])
+    weights = dict(numpy_model._weights)
+
+    dense_kernel = meta["layers"][1]["weights"][0]
+    weights[dense_kernel] = np.random.RandomState(1).normal(0., 1., (8, len(meta["tags"]))).astype(np.float32)
+    for name in meta["layers"][2]["weights"]:
+        if name.endswith(("chain_kernel", "boundary")):
+            weights[name] = np.zeros_like(weights[name])
+
+    return NumpyNERModel(meta, weights)
+
+
+def test_crf_marginals_match_brute_force():
+    random_state = np.random.RandomState(0)
+    energy, chain_kernel = random_state.normal(size=(2, 4, 3)), random_state.normal(size=(3, 3))
+
+    marginals = crf_marginals(energy, chain_kernel)
+
+    for sentence_energy, sentence_marginals in zip(energy, marginals):
+        probabilities = np.zeros((4, 3))
+        for path in itertools.product(range(3), repeat=4):
+            weight = np.exp(-sum(sentence_energy[step, tag] for step, tag in enumerate(path)) - sum(
+                chain_kernel[previous, tag] for previous, tag in zip(path, path[1:])
+            ))
+            probabilities[np.arange(4), path] += weight
+
+        np.testing.assert_allclose(sentence_marginals, probabilities / probabilities.sum(axis=1, keepdims=True))
+
+
+@pytest.mark.parametrize("length, overlap", [(5, 2), (10, 0), (10, 3), (11, 3), (23, 5)])
+def test_windows_cover_the_sentence(length, overlap):
+    sequence = np.arange(length)
+
+    windows, spans = _split_into_windows([np.arange(3), sequence], 6, overlap)
+
+    assert spans[0] == (0, 0) and windows[0].tolist() == [0, 1, 2]
+    assert all(len(window) <= 6 for window in windows)
+    assert all(window.tolist() == sequence[start:start + len(window)].tolist()
+               for window, (_, start) in zip(windows[1:], spans[1:]))
+    assert spans[-1][1] + len(windows[-1]) == length
+
+
+def test_window_overlap_must_be_shorter_than_the_window():
+    with pytest.raises(ValueError, match="overlap"):
+        _split_into_windows([np.arange(10)], 4, 4)
+
+
+def test_windows_are_switched_where_the_scores_are_best():
+    # two windows of 6 tokens overlapping in 4, the second window is more certain from the third shared token
+    spans = [(0, 0), (0, 2)]
+    window_tag_ids = [np.zeros(6, dtype=np.int64), np.ones(6, dtype=np.int64)]
+    window_scores = [np.array([1., 1., .9, .9, .1, .1]), np.array([.5, .2, .8, .8, .8, .8])]
+
+    merged = _merge_windows([8], spans, window_tag_ids, window_scores)
+
+    assert merged[0].tolist() == [0, 0, 0, 0, 1, 1, 1, 1]
+
+
+@pytest.mark.parametrize("overlap", [0, 3, 8, 15])
+def test_windowed_tags_equal_whole_sentence_tags(numpy_model, overlap):
+    model = context_free_model(numpy_model)
+    sequences = [np.random.RandomState(seed).randint(1, 50, length) for seed, length in enumerate((3, 16, 17, 70))]
+
+    whole = model._predict_tag_ids(sequences)
+    model.max_words_count_in_sentence = 16
+    windowed = model._predict_tag_ids(sequences, batch_size=5, window_overlap=overlap)
+
+    assert [tag_ids.tolist() for tag_ids in windowed] == [tag_ids.tolist() for tag_ids in whole]
+
+
+def test_long_sentences_keep_every_token(numpy_model):
+    numpy_model.max_words_count_in_sentence = 8
+    text = ", ".join(["Тарас Шевченко жив у Києві"] * 10) + "."
+
+    result = numpy_model.predict_batch([text])[0]
+
+    assert len(result["tokens"]) == len(result["tags"]) > 8
+
+
+def test_keras_model_scores_its_tags():
+    keras = pytest.importorskip("keras")
+    crf_module = pytest.importorskip("keras_contrib.layers")
+    from nerua.model import NNModel
+
+    layer_input = keras.layers.Input(shape=(None,))
+    embeddings = keras.layers.Embedding(50, 8)(layer_input)
+    dense = keras.layers.TimeDistributed(keras.layers.Dense(5, activation="relu"))(embeddings)
+    model = NNModel.__new__(NNModel)
+    model._model = keras.models.Model(layer_input, crf_module.CRF(5)(dense))
+    model._hidden_states_model = None
+
+    input_data = np.random.RandomState(6).randint(0, 50, (4, 9))
+    tag_ids, scores = model._predict_padded_scores(input_data)
+
+    np.testing.assert_array_equal(tag_ids, model._predict_padded(input_data))
+    assert scores.shape == tag_ids.shape and np.all((scores > 0.) & (scores <= 1.))
+
+
+def test_scores_predictor_is_created_once_per_call(numpy_model, monkeypatch):
+    created = list()
+    scores_predictor = numpy_model._scores_predictor
+    monkeypatch.setattr(numpy_model, "_scores_predictor", lambda: created.append(1) or scores_predictor())
+    numpy_model.max_words_count_in_sentence = 8
+
+    numpy_model._predict_tag_ids([np.arange(1, 40) % 50, np.arange(30) % 50], batch_size=2)
+
+    assert created == [1]
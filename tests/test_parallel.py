@@ -0,0 +1,55 @@
+import os
+import time
+from itertools import count, islice
+
+import pytest
+
+from nerua.parallel import parallel_map
+
+
+def slower_for_smaller(item: int) -> int:
+    time.sleep(.02 * (8 - item % 8))
+    return item * item
+
+
+def process_id(_) -> int:
+    return os.getpid()
+
+
+def fail_on_five(item: int) -> int:
+    if item == 5:
+        raise ValueError(f"Unable to process {item}")
+    return item
+
+
+def test_results_keep_the_order_of_the_items():
+    assert list(parallel_map(slower_for_smaller, range(16), processes=4, chunk_size=1)) == [
+        item * item for item in range(16)
+    ]
+
+
+def test_one_process_maps_in_the_current_process():
+    # a lambda can not be sent to a worker process
+    assert list(parallel_map(lambda item: (item, os.getpid()), range(3), processes=1)) == [
+        (item, os.getpid()) for item in range(3)
+    ]
+
+
+def test_workers_run_in_other_processes():
+    assert os.getpid() not in set(parallel_map(process_id, range(8), processes=2, chunk_size=2))
+
+
+def test_worker_exception_propagates():
+    with pytest.raises(ValueError, match="Unable to process 5"):
+        list(parallel_map(fail_on_five, range(10), processes=2, chunk_size=2))
+
+
+def test_items_are_read_as_the_workers_need_them():
+    read = list()
+    items = (read.append(item) or item for item in count())
+
+    results = list(islice(parallel_map(abs, items, processes=2, chunk_size=3), 4))
+
+    assert results == [0, 1, 2, 3]
+    # two chunks per worker are queued, one more is read once the first chunk is taken
+    assert len(read) == (2 * 2 + 1) * 3
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from nerua.lang.language import get_language
+from nerua.preprocess import (
+    _REPLACERS_CACHE_SIZE, _multiple_replace, _replacers, base_normilize, convert_jsonl_tagged_file_to_csv,
+    iter_train_data_rows
+)
+
+ARTICLE = {"id": 1, "text": "Тарас жив у Києві", "label": [[12, 17, "LOC"]], "article_id": 0}
+
+
+def test_convert_writes_next_to_the_input(tmp_path):
+    jsonl_path = tmp_path / "tagged.jsonl"
+    jsonl_path.write_text(json.dumps(ARTICLE, ensure_ascii=False), encoding="utf-8")
+
+    output_path = convert_jsonl_tagged_file_to_csv(str(jsonl_path), get_language("Ukrainian"), output_format="csv.gz")
+
+    assert output_path == str(tmp_path / "tagged.csv.gz")
+    assert [tag for _, _, tag in iter_train_data_rows(output_path)] == ["O", "O", "O", "B-LOC"]
+
+
+def test_convert_never_overwrites_the_input(tmp_path):
+    input_path = tmp_path / "tagged.csv"
+    input_path.write_text(json.dumps(ARTICLE, ensure_ascii=False), encoding="utf-8")
+
+    with pytest.raises(ValueError, match="overwrite"):
+        convert_jsonl_tagged_file_to_csv(str(input_path), get_language("Ukrainian"))
+
+    assert json.loads(input_path.read_text(encoding="utf-8")) == ARTICLE
+
+
+def test_replacers_follow_in_place_edits_and_stay_bounded():
+    replacements = {"ab": "x", "cd": "y"}
+    assert _multiple_replace(replacements, "abcd") == "xy"
+
+    replacements["cd"] = "z"
+    assert _multiple_replace(replacements, "abcd") == "xz"
+
+    for number in range(100):
+        assert _multiple_replace({"a": str(number)}, "a") == str(number)
+
+    assert len(_replacers) <= _REPLACERS_CACHE_SIZE
+    assert base_normilize("«так» — ні") == '"так" - ні'
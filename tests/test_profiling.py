@@ -0,0 +1,75 @@
+import threading
+
+from nerua import profiling
+
+
+def test_stages_are_no_ops_when_profiling_is_disabled():
+    assert not profiling.is_enabled()
+    assert profiling.stage("predict_batch", items=3) is profiling.stage("forward")
+
+    with profiling.stage("predict_batch") as stage:
+        stage.add_items(3)
+    profiling.count("stemmer_cache", hits=1, misses=0)
+
+    with profiling.profile() as profiler:
+        pass
+
+    assert profiler.stages() == [] and profiler.counters() == {}
+
+
+def test_nested_stages_and_counters():
+    with profiling.profile() as profiler:
+        for _ in range(2):
+            with profiling.stage("predict_batch", items=4):
+                with profiling.stage("forward") as stage:
+                    stage.add_items(2)
+                with profiling.stage("decode", items=2):
+                    pass
+
+        profiling.count("stemmer_cache", hits=3, misses=1)
+
+    stages = {stage["stage"]: stage for stage in profiler.stages()}
+    assert sorted(stages) == ["predict_batch", "predict_batch/decode", "predict_batch/forward"]
+    assert (stages["predict_batch"]["calls"], stages["predict_batch"]["items"]) == (2, 8)
+    assert stages["predict_batch/forward"]["items"] == 4
+    assert stages["predict_batch"]["self_seconds"] <= stages["predict_batch"]["seconds"]
+
+    assert profiler.counters() == {"stemmer_cache": {"hits": 3, "misses": 1, "hit_ratio": .75}}
+    assert 'nerua_events_total{counter="stemmer_cache",kind="hits"} 3' in profiler.to_prometheus()
+    assert profiler.flame().splitlines()[0].startswith("predict_batch")
+    assert profiler.folded().splitlines()[0].startswith("predict_batch ")
+
+
+def test_stages_of_other_threads_are_not_nested():
+    def predict_batch():
+        with profiling.stage("predict_batch"):
+            pass
+
+    with profiling.profile() as profiler:
+        with profiling.stage("server"):
+            thread = threading.Thread(target=predict_batch)
+            thread.start()
+            thread.join()
+
+    assert [stage["stage"] for stage in profiler.stages()] == ["predict_batch", "server"]
+
+
+def test_profile_restores_the_enabled_profiler():
+    outer = profiling.enable()
+    try:
+        with profiling.profile() as inner:
+            assert profiling.get_profiler() is inner
+        assert profiling.get_profiler() is outer
+    finally:
+        profiling.disable()
+
+    assert not profiling.is_enabled()
+
+
+def test_predict_batch_stages(numpy_model):
+    with profiling.profile() as profiler:
+        numpy_model.predict_batch(["Тарас Шевченко жив у Києві. Він писав вірші."])
+
+    stages = {stage["stage"] for stage in profiler.stages()}
+    assert {"predict_batch/tokenize", "predict_batch/forward", "predict_batch/decode"} <= stages
+    assert "stemmer_cache" in profiler.counters()
@@ -0,0 +1,63 @@
+import threading
+import multiprocessing
+
+import pytest
+
+from nerua.registry import ModelCache, ModelRegistry
+
+
+def register_models(models_dir_path: str, process_index: int, count: int):
+    registry = ModelRegistry(models_dir_path, cache=ModelCache())
+
+    for model_index in range(count):
+        model_path = registry.new_model_path("ukr").replace(".h5", f"_{process_index}_{model_index}.h5")
+        with open(model_path, 'w') as model_file:
+            model_file.write(f"model {process_index} {model_index}")
+
+        registry.register(model_path, lang="Ukrainian", tags=["O"], stem_words=True, max_words_count_in_sentence=None)
+
+
+def test_models_registered_by_concurrent_processes_are_kept(tmp_path):
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=register_models, args=(str(tmp_path), index, 20)) for index in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert [process.exitcode for process in processes] == [0] * 4
+    assert len(ModelRegistry(str(tmp_path), cache=ModelCache()).models()) == 80
+
+
+def test_cached_models_are_served_while_another_model_loads():
+    cache, loading, release = ModelCache(), threading.Event(), threading.Event()
+    cache.get("cached", lambda: "cached model", 1)
+
+    def slow_loader():
+        loading.set()
+        assert release.wait(5)
+        return "slow model"
+
+    results = list()
+    threads = [threading.Thread(target=lambda: results.append(cache.get("slow", slow_loader, 1))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert loading.wait(5)
+
+    assert cache.get("cached", lambda: pytest.fail("the cached model is loaded again"), 1) == "cached model"
+
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["slow model"] * 3
+    assert (cache.info()["misses"], cache.info()["models"]) == (2, 2)
+
+
+def test_failed_load_is_not_cached():
+    cache = ModelCache()
+
+    with pytest.raises(OSError):
+        cache.get("broken", lambda: open("/nonexistent/model.h5"), 1)
+
+    assert cache.get("broken", lambda: "model", 1) == "model"
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from nerua.scraping import segments
+from nerua.scraping.segments import PART_EXTENSION, SegmentWriter, iter_segment_records, list_segments, \
+    recover_segments
+
+
+def records(count: int, start: int = 0):
+    return [{"id": index, "text": f"Стаття номер {index} " * 20} for index in range(start, start + count)]
+
+
+def test_segments_are_rotated_by_size(tmp_path):
+    with SegmentWriter(str(tmp_path), "pravda_spider", max_segment_size=2000, flush_every=10) as writer:
+        for record in records(200):
+            writer.write(record)
+
+    paths = list_segments(str(tmp_path))
+
+    assert len(paths) > 1
+    assert all(path.endswith(".jsonl.gz") for path in paths)
+    assert [record for path in paths for record in iter_segment_records(path)] == records(200)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(PART_EXTENSION)]
+
+
+def test_flushed_records_are_synced_before_on_flush(tmp_path, monkeypatch):
+    events = list()
+
+    fsync = os.fsync
+    monkeypatch.setattr(segments.os, "fsync", lambda fd: (fsync(fd), events.append("fsync")))
+
+    writer = SegmentWriter(str(tmp_path), "tsn_spider", flush_every=3,
+                           on_flush=lambda flushed: events.append([record["id"] for record in flushed]))
+    for record in records(7):
+        writer.write(record)
+
+    assert events == ["fsync", [0, 1, 2], "fsync", [3, 4, 5]]
+
+    writer.close()
+    assert events[-2:] == ["fsync", [6]]
+
+
+def test_recovery_drops_the_torn_last_batch(tmp_path):
+    writer = SegmentWriter(str(tmp_path), "pravda_spider", flush_every=5)
+    for record in records(500):
+        writer.write(record)
+
+    # the writer crashes in the middle of its last batch
+    writer._file.write(segments._compressor("gzip")(b'{"id": 500}\n')[:-7])
+    writer._file.close()
+
+    recovered = recover_segments(str(tmp_path), "pravda_spider")
+
+    assert len(recovered) == 1 and list_segments(str(tmp_path)) == recovered
+    assert list(iter_segment_records(recovered[0])) == records(500)
+
+
+def test_recovery_removes_a_segment_without_complete_batches(tmp_path):
+    part_path = tmp_path / f"tsn_spider.1.jsonl.gz{PART_EXTENSION}"
+    part_path.write_bytes(segments._compressor("gzip")(b'{"id": 0}\n')[:10])
+
+    assert recover_segments(str(tmp_path)) == []
+    assert not os.listdir(tmp_path)
+
+
+def test_writer_recovers_the_segments_of_its_prefix(tmp_path):
+    for prefix in ("pravda_spider", "tsn_spider"):
+        writer = SegmentWriter(str(tmp_path), prefix, flush_every=1)
+        writer.write({"id": prefix})
+        writer._file.close()
+
+    SegmentWriter(str(tmp_path), "tsn_spider")
+
+    assert [os.path.basename(path).split(".")[0] for path in list_segments(str(tmp_path))] == ["tsn_spider"]
+
+
+def test_zstd_segments(tmp_path):
+    pytest.importorskip("zstandard")
+
+    writer = SegmentWriter(str(tmp_path), "pravda_spider", compression="zstd", flush_every=7)
+    for record in records(50):
+        writer.write(record)
+    writer._file.write(segments._compressor("zstd")(b'{"id": 50}\n')[:-3])
+    writer._file.close()
+
+    recovered = recover_segments(str(tmp_path))
+
+    assert recovered[0].endswith(".jsonl.zst")
+    assert list(iter_segment_records(recovered[0])) == records(50)
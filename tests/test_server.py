@@ -0,0 +1,98 @@
+import json
+import asyncio
+from typing import List
+
+from nerua.server import MicroBatcher, NerServer
+
+
+def predict_batch(texts: List[str]) -> List[dict]:
+    return [{"tokens": text.split()} for text in texts]
+
+
+async def send(port: int, request: bytes):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    await writer.drain()
+
+    response = await asyncio.wait_for(reader.read(), 5)
+    writer.close()
+
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), head.decode("latin-1"), json.loads(body) if body else None
+
+
+def post(body: dict) -> bytes:
+    data = json.dumps(body).encode("utf-8")
+    return b"POST /tag HTTP/1.1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n%s" % (len(data), data)
+
+
+def serve(check, *, max_queue: int = 4):
+    async def run():
+        server = NerServer(MicroBatcher(predict_batch, max_queue=max_queue), port=0)
+        await server.start()
+        try:
+            return await check(server)
+        finally:
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+def test_tag_texts_and_count_requests():
+    async def check(server):
+        status, _, response = await send(server.port, post({"texts": ["a b", "c"]}))
+        assert status == 200
+        assert response == {"results": [{"tokens": ["a", "b"]}, {"tokens": ["c"]}]}
+
+        status, _, response = await send(server.port, post({"text": "d e"}))
+        assert status == 200
+        assert response == {"tokens": ["d", "e"]}
+
+        metrics = server.metrics()
+        assert metrics["requests"] == 2
+        assert metrics["texts"] == 3
+
+    serve(check)
+
+
+def test_invalid_content_length():
+    async def check(server):
+        for content_length in (b"abc", b"-1", b"\xb2"):
+            status, _, response = await send(
+                server.port, b"POST /tag HTTP/1.1\r\nContent-Length: " + content_length + b"\r\n\r\n"
+            )
+            assert status == 400
+            assert "Content-Length" in response["error"]
+
+    serve(check)
+
+
+def test_more_texts_than_the_queue_is_not_retryable():
+    async def check(server):
+        status, head, _ = await send(server.port, post({"texts": ["a"] * 5}))
+        assert status == 413
+        assert "Retry-After" not in head
+        assert server.metrics()["rejected"] == 1
+
+    serve(check)
+
+
+def test_too_many_or_too_large_headers():
+    async def check(server):
+        many_headers = b"".join(b"X-Header-%d: value\r\n" % index for index in range(200))
+        status, _, response = await send(server.port, b"GET /health HTTP/1.1\r\n" + many_headers + b"\r\n")
+        assert status == 431
+        assert "headers" in response["error"]
+
+        long_header = b"X-Header: " + b"a" * (1 << 17) + b"\r\n"
+        status, _, _ = await send(server.port, b"GET /health HTTP/1.1\r\n" + long_header + b"\r\n")
+        assert status == 431
+
+        status, _, _ = await send(server.port, b"GET /" + b"a" * (1 << 17) + b" HTTP/1.1\r\n\r\n")
+        assert status == 400
+
+        # the server keeps serving
+        status, _, _ = await send(server.port, b"GET /health HTTP/1.1\r\nConnection: close\r\n\r\n")
+        assert status == 200
+
+    serve(check)
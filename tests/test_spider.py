@@ -0,0 +1,189 @@
+import os
+import sys
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("scrapy")
+
+import scrapy.crawler  # noqa: E402
+from scrapy.settings import Settings  # noqa: E402
+from nerua.scraping import spider  # noqa: E402
+from nerua.scraping.segments import iter_segment_records, list_segments  # noqa: E402
+
+# the reactor of twisted can not be restarted, so every crawl runs in its own process,
+# the copy of the pravda spider checks that the spiders run together in one reactor
+CRAWL = """
+import sys
+from nerua.scraping.spider import PravdaNewsSpider, run_crawl
+
+class PravdaCopySpider(PravdaNewsSpider):
+    name = "pravda_copy_spider"
+
+state_dir_path, segments_dir_path, start_url = sys.argv[1:]
+run_crawl(
+    [PravdaNewsSpider, PravdaCopySpider], state_dir_path=state_dir_path,
+    settings={
+        "NERUA_SEGMENTS_DIR": segments_dir_path, "NERUA_SEGMENT_FLUSH_EVERY": 2, "DOWNLOAD_DELAY": 0,
+        "AUTOTHROTTLE_ENABLED": False, "LOG_LEVEL": "ERROR", "TELNETCONSOLE_ENABLED": False,
+    },
+    spider_kwargs={
+        "pravda_spider": {"start_url": f"{start_url}/news/"},
+        "pravda_copy_spider": {"start_url": f"{start_url}/copy/news/"},
+    }
+)
+"""
+
+
+def listing_page(article_ids, yesterday: str = None) -> str:
+    links = "".join(
+        f'<div class="article_header"><a href="../articles/{id_}.html">{id_}</a></div>' for id_ in article_ids
+    )
+    if yesterday is not None:
+        links += f'<a href="{yesterday}"><img src="/images/v6/ico_arr_l.svg"></a>'
+
+    return f"<html><body>{links}</body></html>"
+
+
+def article_page(article_id: int) -> str:
+    return f'<html><body><div class="post_text"><p>Новина {article_id}</p><p>Київ &amp; Львів</p></div></body></html>'
+
+
+class FixtureSite:
+    """
+    the pages of the news site, at / and at /copy/ for the second spider, every request is recorded
+
+    """
+    def __init__(self):
+        self.pages, self.requests = dict(), list()
+
+        for prefix in ("", "/copy"):
+            self.pages[f"{prefix}/news/"] = listing_page([1, 2], "../news_2/")
+            self.pages[f"{prefix}/news_2/"] = listing_page([3, 4], "../news_3/")
+            self.pages[f"{prefix}/news_3/"] = listing_page([5])
+            self.pages.update({f"{prefix}/articles/{id_}.html": article_page(id_) for id_ in range(1, 7)})
+
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.requests.append(self.path)
+
+                page = site.pages.get(self.path)
+                self.send_response(200 if page is not None else 404)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.end_headers()
+                self.wfile.write((page or "").encode("utf-8"))
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def site():
+    fixture_site = FixtureSite()
+    yield fixture_site
+    fixture_site.close()
+
+
+def crawl(site: FixtureSite, tmp_path) -> list:
+    site.requests.clear()
+    subprocess.run(
+        [sys.executable, "-c", CRAWL, str(tmp_path / "state"), str(tmp_path / "segments"), site.url],
+        check=True, timeout=120, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+
+    return sorted(site.requests)
+
+
+class RecordingCrawlerProcess:
+    def __init__(self, settings):
+        self.settings, self.crawls = settings, list()
+        RecordingCrawlerProcess.last = self
+
+    def crawl(self, spider_class, **kwargs):
+        self.crawls.append((spider_class.name, kwargs))
+
+    def start(self):
+        pass
+
+
+@pytest.fixture
+def crawler_process(monkeypatch):
+    monkeypatch.setattr(scrapy.crawler, "CrawlerProcess", RecordingCrawlerProcess)
+    return RecordingCrawlerProcess
+
+
+@pytest.mark.parametrize("start_url", ["unknown_spider=https://example.com", "pravda_spider", "pravda_spider="])
+def test_start_url_of_an_unknown_spider_is_an_error(crawler_process, capsys, start_url):
+    with pytest.raises(SystemExit):
+        spider.main(["--start-url", start_url])
+
+    assert "--start-url" in capsys.readouterr().err
+
+
+def test_settings_override_the_state_dir(crawler_process, tmp_path):
+    spider.main(["--state-dir", str(tmp_path), "--set", "NERUA_CRAWL_STATE_DIR=elsewhere", "--only", "tsn_spider",
+                 "--start-url", "tsn_spider=file:///tmp/tsn.html"])
+
+    assert crawler_process.last.settings["NERUA_CRAWL_STATE_DIR"] == "elsewhere"
+    assert crawler_process.last.crawls == [
+        ("tsn_spider", {"incremental": True, "start_url": "file:///tmp/tsn.html"})
+    ]
+
+
+def test_crawl_saves_the_articles_and_does_not_fetch_them_again(site, tmp_path):
+    requests = crawl(site, tmp_path)
+
+    assert [path for path in requests if not path.startswith("/copy/")] == [
+        "/articles/1.html", "/articles/2.html", "/articles/3.html", "/articles/4.html", "/articles/5.html",
+        "/news/", "/news_2/", "/news_3/"
+    ]
+    assert len([path for path in requests if path.startswith("/copy/")]) == 8
+
+    records = [record for path in list_segments(str(tmp_path / "segments")) for record in iter_segment_records(path)]
+    pravda_records = sorted((record for record in records if "/copy/" not in record["url"]), key=lambda r: r["url"])
+    assert len(records) == 10
+    assert [record["url"] for record in pravda_records] == [f"{site.url}/articles/{id_}.html" for id_ in range(1, 6)]
+    assert pravda_records[0]["source"] == "pravda.com.ua"
+    assert pravda_records[0]["paragraphs"] == ["<p>Новина 1</p>", "<p>Київ &amp; Львів</p>"]
+
+    seen_urls = spider.SeenUrlStore(str(tmp_path / "state" / "pravda_spider" / "seen_urls.txt"))
+    assert len(seen_urls) == 5 and f"{site.url}/articles/3.html#comments" in seen_urls
+    seen_urls.close()
+
+    # nothing is new, so the crawl stops at the first listing page
+    assert crawl(site, tmp_path) == ["/copy/news/", "/news/"]
+
+    # a new article is fetched, the older days are not followed past the first one without new articles
+    site.pages["/news/"] = listing_page([6, 1, 2], "../news_2/")
+    assert [path for path in crawl(site, tmp_path) if not path.startswith("/copy/")] == [
+        "/articles/6.html", "/news/", "/news_2/"
+    ]
+    assert len(list_segments(str(tmp_path / "segments"))) == 3
+
+
+def test_only_an_unfinished_job_is_resumed(tmp_path):
+    job_dir_path = tmp_path / "pravda_spider" / "job"
+    (job_dir_path / "requests.queue").mkdir(parents=True)
+
+    settings = Settings({"NERUA_CRAWL_STATE_DIR": str(tmp_path)})
+    spider.PravdaNewsSpider.update_settings(settings)
+
+    assert settings.get("JOBDIR") == str(job_dir_path)
+    assert (job_dir_path / "requests.queue").exists()
+
+    (job_dir_path / "finished").touch()
+    spider.PravdaNewsSpider.update_settings(Settings({"NERUA_CRAWL_STATE_DIR": str(tmp_path)}))
+
+    assert not job_dir_path.exists()
@@ -0,0 +1,103 @@
+import re
+import html
+import json
+
+import pytest
+
+from nerua.scraping.preprocess import SPIDER_XML_INLINE_TAGS, convert_ner_xml_to_jsonl, iter_spider_articles, \
+    simplify_spider_xml
+
+# articles cleaned as the old regex cleanup cleaned them
+SAME_ARTICLES = [
+    '<p class="lead" id="1">  Перший абзац. </p><p>Другий\xa0абзац</p>',
+    '<p><a href="/news/"><strong>Вкладені</strong> <em>теги</em></a> і <span class="x">текст</span></p>',
+    '<p>Рядок<br>другий <br >третій</p>',
+    '<p><img src="/photo.jpg"> Фото <i>дня</i><meta content="x"></p>',
+    '<script>var news = 1;</script><p>Після скрипта</p>',
+    '<p>Текст до скрипта<script type="text/javascript">track();</script></p>',
+    '<p>Київ &amp; Львів, &quot;цитата&quot;, &#39;апостроф&#39; і &#1050;иїв</p>',
+    '<!-- коментар --><p>Текст<!-- ще один --></p>',
+    '<p> </p><p></p><p>Непорожній</p>',
+    '<div class="post"><p>Абзац у блоці</p></div>',
+    '<p></p>',
+]
+
+# the old cleanup kept the scripts and lost the text after them and after <br/>, the new one drops the scripts
+# and keeps the text, and a block element inside a paragraph closes the paragraph as in every html parser,
+# while the old cleanup kept it inside, the spiders extract the paragraphs with an html parser,
+# so their paragraphs never contain block elements
+DIFFERENT_ARTICLES = [
+    ('<script>var news = "<p>не текст</p>";</script><p>Після скрипта</p>', ["не текст", "Після скрипта"],
+     ["Після скрипта"]),
+    ('<p>Рядок<br/>другий</p>', ["Рядок"], ["Рядокдругий"]),
+    ('<p>Текст<script type="x">var a = 1;</script> далі</p>', ["Текст"], ["Текст далі"]),
+    ('<p>Перший <div>вкладений</div> текст </p>', ["Перший "], ["Перший"]),
+]
+
+
+@pytest.fixture(scope="module")
+def regex_simplify():
+    """
+    the cleanup of the spider dumps as it was before SpiderXmlCleaner, one regex substitution per step
+
+    """
+    def simplify(xml: str) -> str:
+        xml = re.sub(r"<!--[\S\s]*?-->|<script(?:\s.*?>|>)>.*?</script>", "", xml)
+        for tag in SPIDER_XML_INLINE_TAGS:
+            xml = re.sub(fr"</?\s*{tag}(?:\s.*?>|>)", "", xml)
+        xml = re.sub(u"\xa0", u" ", xml)
+        xml = re.sub(r"<\s*p(?:\s.*?>|>)\s*</\s*p(?:\s.*?>|>)", "", xml)
+        xml = re.sub(r"<\s*p(?:\s.*?>|>)\s*", "<p>", xml)
+        xml = re.sub(r"\s*</\s*p\s*>", "</p>", xml)
+        xml = re.sub(r"\t+\n+", "", xml)
+        xml = re.sub(r"\t*<(\w+)(?:\s[^<>]*)?>\s*</\1>\n*", "", xml)
+        return xml
+
+    return simplify
+
+
+def spider_dump(*articles: str) -> str:
+    articles = "".join(f"\t<article>\n\t\t{article}\n\t</article>\n" for article in articles)
+    return f"<articles>\n{articles}</articles>"
+
+
+def article_texts(xml: str) -> list:
+    return [json.loads(line)["article"] for line in convert_ner_xml_to_jsonl(xml).splitlines()]
+
+
+@pytest.mark.parametrize("article", SAME_ARTICLES)
+def test_articles_match_the_regex_cleanup(regex_simplify, article):
+    xml = spider_dump(article, '<p>Сусідня стаття</p>')
+
+    assert article_texts(simplify_spider_xml(xml)) == article_texts(regex_simplify(xml))
+
+
+def test_dump_matches_the_regex_cleanup(regex_simplify):
+    xml = spider_dump(*SAME_ARTICLES)
+
+    assert article_texts(simplify_spider_xml(xml)) == article_texts(regex_simplify(xml))
+
+
+@pytest.mark.parametrize("article, regex_paragraphs, paragraphs", DIFFERENT_ARTICLES)
+def test_known_differences_from_the_regex_cleanup(regex_simplify, article, regex_paragraphs, paragraphs):
+    xml = spider_dump(article)
+
+    assert article_texts(regex_simplify(xml)) == ["\n".join(regex_paragraphs)]
+    assert article_texts(simplify_spider_xml(xml)) == ["\n".join(paragraphs)]
+
+
+def test_iterparse_yields_the_paragraphs_of_the_whole_dump_parse(tmp_path):
+    xml = spider_dump(
+        '<p class="lead">Київ &amp; Львів &quot;разом&quot;</p><p>Другий <a href="/x">абзац</a></p>',
+        '<div class="video">Стаття без абзаців</div>',
+        '<p> </p>',
+        '<p>&#1050;иїв&#39;s &lt;b&gt; і&nbsp;Одеса</p>',
+        *SAME_ARTICLES
+    )
+    dump_path = tmp_path / "pravda.text"
+    dump_path.write_text(xml, encoding="utf-8")
+
+    articles = list(iter_spider_articles(str(dump_path)))
+
+    assert articles[:3] == [['Київ & Львів "разом"', "Другий абзац"], [], ["Київ's <b> і Одеса"]]
+    assert [html.unescape("\n".join(paragraphs)) for paragraphs in articles] == article_texts(simplify_spider_xml(xml))
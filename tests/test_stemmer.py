@@ -0,0 +1,128 @@
+import re
+import random
+import threading
+
+import pytest
+
+from nerua.stemmer import UkrainianStemmer, stem_ukr_word
+
+VOWELS = "аеиоуюяіїє"
+
+ENDINGS = [
+    "ив", "ивши", "ившись", "ыв", "ывши", "ывшись", "ся", "сь", "си", "ими", "ій", "ий", "а", "е", "ова", "ове", "ів",
+    "є", "їй", "єє", "еє", "я", "ім", "ем", "им", "их", "іх", "ою", "йми", "іми", "у", "ю", "ого", "ому", "ої", "і",
+    "ать", "ять", "ав", "али", "учи", "ячи", "вши", "ши", "ме", "ати", "яти", "ев", "ов", "ями", "ами", "еи", "и",
+    "ей", "ой", "й", "иям", "ям", "ием", "ам", "ом", "о", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ия", "ья", "ові",
+    "ї", "ею", "єю", "еві", "єм", "їв", "ость", "ості", "ейше", "ейшь", "нн", "нь", "ннь",
+]
+
+
+@pytest.fixture(scope="module")
+def regex_stemmer():
+    """
+    the stemmer as it was before the suffix tries, one regex substitution per group of endings
+
+    """
+    perfective = r"(ив|ивши|ившись|ыв|ывши|ывшись((?<=[ая])(в|вши|вшись)))$"
+    reflexive = r"(с[яьи])$"
+    adjective = r"(ими|ій|ий|а|е|ова|ове|ів|є|їй|єє|еє|я|ім|ем|им|ім|их|іх|ою|йми|іми|у|ю|ого|ому|ої)$"
+    participle = r"(ий|ого|ому|им|ім|а|ій|у|ою|ій|і|их|йми|их)$"
+    verb = r"(сь|ся|ив|ать|ять|у|ю|ав|али|учи|ячи|вши|ши|е|ме|ати|яти|є)$"
+    noun = r"(а|ев|ов|е|ями|ами|еи|и|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю" \
+           r"|ия|ья|я|і|ові|ї|ею|єю|ою|є|еві|ем|єм|ів|їв|ю)$"
+
+    def stem(word: str) -> str:
+        word = word.lower()
+
+        match = re.search(fr"[{VOWELS}]", word)
+        if match is None:
+            return word
+
+        first_word_part, buffer = word[:match.span()[1]], word[match.span()[1]:]
+
+        buffer1 = buffer
+        buffer = re.sub(perfective, '', buffer)
+        if buffer1 == buffer:
+            buffer = re.sub(reflexive, '', buffer)
+
+            buffer1 = buffer
+            buffer = re.sub(adjective, '', buffer)
+            if buffer1 == buffer:
+                buffer1 = buffer
+                buffer = re.sub(verb, '', buffer)
+                if buffer1 == buffer:
+                    buffer = re.sub(noun, '', buffer)
+            else:
+                buffer = re.sub(participle, '', buffer)
+
+        buffer = re.sub(r'и$', '', buffer)
+
+        if re.search(fr"[^{VOWELS}][{VOWELS}]+[^{VOWELS}]+[{VOWELS}].*(?<=о)сть?$", buffer):
+            buffer = re.sub(r'ость$', '', buffer)
+
+        buffer1 = buffer
+        buffer = re.sub(r"ь$", '', buffer)
+        if buffer1 != buffer:
+            buffer = re.sub(r'ейше?$', '', buffer)
+            buffer = re.sub(r'нн$', 'н', buffer)
+
+        return first_word_part + buffer
+
+    return stem
+
+
+def random_words(count: int, seed: int = 1):
+    random_state = random.Random(seed)
+    alphabet = "абвгґдеєжзиіїйклмнопрстуфхцчшщьюяыъ'"
+
+    for _ in range(count):
+        word = "".join(random_state.choice(alphabet) for _ in range(random_state.randint(0, 7)))
+        yield word + "".join(random_state.choice(ENDINGS) for _ in range(random_state.randint(0, 3)))
+
+
+def test_stems_match_the_regex_stemmer(regex_stemmer):
+    mismatches = [
+        (word, regex_stemmer(word), stem_ukr_word(word))
+        for word in random_words(20000)
+        if regex_stemmer(word) != stem_ukr_word(word)
+    ]
+
+    assert not mismatches[:10]
+
+
+@pytest.mark.parametrize("word", ["Україна", "працювавши", "радістю", "найбільшого", "ГОРОДИ", "ткнн", ""])
+def test_cached_stems_match_the_regex_stemmer(regex_stemmer, word):
+    stemmer = UkrainianStemmer(cache_size=2)
+
+    assert [stemmer.stem(word) for _ in range(2)] == [regex_stemmer(word)] * 2
+
+
+def test_stem_many_counts_the_cache_of_its_own_call():
+    stemmer = UkrainianStemmer(cache_size=10)
+    stemmer.stem("україна")
+
+    cache_counts = dict()
+    stems = stemmer.stem_many(["Україна", "України", "україна"], cache_counts=cache_counts)
+
+    assert stems == [stemmer.stem("україна"), stemmer.stem("України"), stemmer.stem("україна")]
+    assert cache_counts == {"hits": 2, "misses": 1}
+
+
+def test_cache_shared_by_threads_stays_consistent():
+    stemmer = UkrainianStemmer(cache_size=50)
+    words = list(random_words(2000, seed=2))
+
+    def stem_words():
+        for word in words:
+            stemmer.stem(word)
+
+    threads = [threading.Thread(target=stem_words) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cache_info = stemmer.cache_info()
+    assert cache_info["hits"] + cache_info["misses"] == 8 * len(words)
+    assert cache_info["size"] <= 50
+    assert all(stemmer.stem(word) == stemmer._stem(word.lower()) for word in words[-50:])
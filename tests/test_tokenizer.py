@@ -0,0 +1,74 @@
+import io
+import re
+
+import pytest
+
+from nerua.lang.language import get_language
+from nerua.tokenizer import iter_tokens, tokenize_text_with_offsets
+
+TEXTS = [
+    "Президент прибув до м. Київ. Він зустрівся з мером м. Львів і т.д. Потім поїхав далі.",
+    "  Згідно зі ст. 5 Закону України (Н. Іванов) все гаразд! Чи ні? Так… Побачимо.",
+    "Організація ООН. Вона працює у США. А ще «Укрзалізниця». Поїзди ходять.\n\nНовий абзац. Кінець",
+    "Ціна 5.5 грн. Курс 27.3. Проф. Петренко сказав: «Досить». Далі буде...   Справді.",
+    "Один.Два. Три.  П. Шевченко народився в с. Моринці.",
+    "",
+    "   ",
+    "Слово",
+]
+
+
+@pytest.fixture(scope="module")
+def regex_sentence_spans():
+    """
+    the sentence splitter as it was before the chunked one, it looks at every word of the whole text
+
+    """
+    def sentence_spans(text: str):
+        spans = [match for match in re.finditer(r'\S+', text)]
+
+        cursor = 0
+        for span_index, span in enumerate(spans):
+            if span_index == len(spans) - 1:
+                yield cursor, span.end()
+
+            elif text[span.end() - 1] in ['.', '!', '?', '…', '»']:
+                next_span = spans[span_index + 1]
+                token = text[span.start():span.end()]
+                tmp = token[re.search('[.!?…»]', token).start() - 1]
+                next_tok = text[next_span.start():next_span.end()]
+
+                if next_tok[0].isupper() and not tmp.isupper() and not (token[-1] != '.' or tmp[0] == '('):
+                    yield cursor, span.end()
+                    cursor = next_span.start()
+
+    return sentence_spans
+
+
+def regex_tokens(text: str, sentence_spans, lang) -> list:
+    return [
+        (sentence_id, match.group(), match.start(), match.end())
+        for sentence_id, (start, end) in enumerate(sentence_spans(text))
+        for match in lang.word_tokenization_rules.finditer(text, start, end)
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 65))
+def test_chunked_tokens_match_the_regex_splitter(regex_sentence_spans, chunk_size):
+    lang = get_language("ua")
+
+    for text in TEXTS:
+        expected = regex_tokens(text, regex_sentence_spans, lang)
+
+        assert list(iter_tokens(io.StringIO(text), lang, chunk_size=chunk_size)) == expected, text
+
+
+def test_tokens_of_a_text_match_its_sentences():
+    lang = get_language("ua")
+    text = " ".join(TEXTS)
+
+    assert list(iter_tokens(text, lang)) == [
+        (sentence_id, token, start, end)
+        for sentence_id, sentence in enumerate(tokenize_text_with_offsets(text, lang))
+        for token, start, end in sentence
+    ]
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from nerua.lang.language import get_language
+from nerua.lang.vocabulary import VocabularyBuilder
+
+
+def builder() -> VocabularyBuilder:
+    return VocabularyBuilder(get_language("Ukrainian"), stem_words=False, shard_size=16)
+
+
+def write_corpus(path, lines):
+    path.write_text("".join(f"{line}\n" for line in lines), encoding="utf-8")
+    return str(path)
+
+
+def test_checkpoint_skips_counted_shards(tmp_path):
+    corpus_path = write_corpus(tmp_path / "corpus.txt", ["київ львів одеса"] * 8)
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+
+    counts = builder().update_from_files([corpus_path], checkpoint_path=checkpoint_path, checkpoint_every=3).counts
+    assert counts["київ"] == 8
+
+    resumed = builder().load_checkpoint(checkpoint_path).update_from_files([corpus_path])
+    assert resumed.counts == counts
+
+
+def test_changed_file_is_not_counted_twice(tmp_path):
+    corpus_path = write_corpus(tmp_path / "corpus.txt", ["київ львів одеса"] * 8)
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    builder().update_from_files([corpus_path], checkpoint_path=checkpoint_path)
+
+    with open(corpus_path, "a", encoding="utf-8") as corpus_file:
+        corpus_file.write("харків\n")
+    os.utime(corpus_path, ns=(0, os.stat(corpus_path).st_mtime_ns + 10 ** 9))
+
+    with pytest.raises(ValueError, match="has changed"):
+        builder().load_checkpoint(checkpoint_path).update_from_files([corpus_path])